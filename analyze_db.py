@@ -12,19 +12,10 @@ print(f'  上市: {len(listed)} 支')
 print(f'  上櫃: {len(otc)} 支')
 print(f'\n上櫃股票代碼範例: {[s["code"] for s in otc[:20]]}')
 
-# 檢查 twstock 的分類
-import twstock
-codes = twstock.codes
-
-all_stocks_from_twstock = []
-for code, info in codes.items():
-    if info.type == '股票' and code.isdigit() and len(code) == 4:
-        market = 'LISTED' if info.market == '上市' else 'OTC'
-        all_stocks_from_twstock.append({
-            'code': code,
-            'name': info.name,
-            'market': market
-        })
+# 檢查 twstock 的分類（使用快取的股票清單，代碼表未變動時不必重新走訪 twstock）
+from stock_universe import get_universe
+
+all_stocks_from_twstock, _ = get_universe()
 
 twstock_listed = [s for s in all_stocks_from_twstock if s['market'] == 'LISTED']
 twstock_otc = [s for s in all_stocks_from_twstock if s['market'] == 'OTC']
@@ -0,0 +1,109 @@
+"""
+API 回應層：壓縮、ETag / If-None-Match、Cache-Control
+
+  - 壓縮：回應 >= COMPRESS_MIN_BYTES 且為 JSON / 文字 / 圖表 binary 時，依 Accept-Encoding
+    使用 brotli（有安裝 brotli 套件時）或 gzip
+  - ETag：路由可先以資料版本（例如快照版本）算出 ETag，符合 If-None-Match 時直接回 304，
+    完全不用產生內容；沒有自行設定 ETag 的 /api/ 回應則以內容雜湊補上
+  - Cache-Control：依 endpoint 設定（路由已自行設定的不覆蓋）
+
+POST /api/screen 等端點也接受 If-None-Match：瀏覽器不會快取 POST 回應，
+由前端保留上一次的內容並帶上 ETag，304 時沿用。
+"""
+import gzip
+import hashlib
+import os
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = ('application/json', 'application/octet-stream', 'application/javascript', 'text/')
+DEFAULT_API_CACHE_CONTROL = 'no-cache'     # 可存，但每次都要以 ETag 驗證
+
+
+def make_etag(*parts):
+    """任意資料 -> ETag 值（不含引號；以弱 ETag 送出，壓縮前後視為同一份內容）"""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else str(p).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()[:20]
+
+
+def _matches(etag):
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag, cache_control=None):
+    """If-None-Match 符合時回傳 304 回應，否則 None"""
+    if not _matches(etag):
+        return None
+    resp = current_app.response_class(status=304)
+    resp.set_etag(etag, weak=True)
+    if cache_control:
+        resp.headers['Cache-Control'] = cache_control
+    return resp
+
+
+def with_etag(resp, etag):
+    resp.set_etag(etag, weak=True)
+    return resp
+
+
+def _accepts(encoding):
+    return request.accept_encodings.quality(encoding) > 0
+
+
+def _compress(resp):
+    if resp.direct_passthrough or resp.status_code != 200 or 'Content-Encoding' in resp.headers:
+        return resp
+    if not (resp.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    if brotli is not None and _accepts('br'):
+        body, encoding = brotli.compress(data, quality=BROTLI_QUALITY), 'br'
+    elif _accepts('gzip'):
+        body, encoding = gzip.compress(data, GZIP_LEVEL), 'gzip'
+    else:
+        return resp
+    resp.set_data(body)
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
+
+def init_app(app, cache_control=None):
+    """註冊 after_request；cache_control 為 {endpoint: Cache-Control 標頭}"""
+    cache_control = cache_control or {}
+
+    @app.after_request
+    def _finalize_response(resp):
+        endpoint = request.endpoint or ''
+        is_api = request.path.startswith('/api/')
+        if 'Cache-Control' not in resp.headers:
+            value = cache_control.get(endpoint, DEFAULT_API_CACHE_CONTROL if is_api else None)
+            if value:
+                resp.headers['Cache-Control'] = value
+
+        if is_api and resp.status_code == 200 and not resp.direct_passthrough:
+            etag, _ = resp.get_etag()
+            if etag is None:
+                etag = make_etag(resp.get_data())
+                resp.set_etag(etag, weak=True)
+            if _matches(etag):
+                cached = app.response_class(status=304)
+                cached.set_etag(etag, weak=True)
+                cached.headers['Cache-Control'] = resp.headers.get('Cache-Control', DEFAULT_API_CACHE_CONTROL)
+                return cached
+        return _compress(resp)
+
+    return app
@@ -1,15 +1,29 @@
-from flask import Flask, request, jsonify, render_template, abort
+from flask import Flask, request, jsonify, render_template, abort, g
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import json
 import os
+import time
+import threading
 import yfinance as yf
 import pandas as pd
-import requests as req
+import numpy as np
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from http_cache import cached_get, ttl_for_trading_date, is_json
+from technicals import panel_field, build_panel, calc_high_days_batch
+from indicators import IndicatorBook
+from rules import get_strategy
+from bar_cache import get_bars, get_bars_many
+from chart_payload import (chart_columns, chart_rows, to_columns, to_rows, to_binary, json_response,
+                           BINARY_MIMETYPE)
+from fundamentals_cache import get_fundamentals, refresh_due as refresh_fundamentals
+from prefetch import Prefetcher
+from deadline import Deadline, DeadlineExceeded
+from api_response import init_app as init_api_response, make_etag, not_modified, with_etag
+from file_lock import FileLock
 
 # LINE Bot SDK
 from linebot import LineBotApi, WebhookHandler
@@ -25,6 +39,18 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# 各 endpoint 的 Cache-Control（未列出的 /api/ 一律 no-cache：每次以 ETag 驗證）；
+# 回應壓縮與 ETag / 304 見 api_response.py
+API_CACHE_CONTROL = {
+    'index':               'no-cache',
+    'refresh_indices_api': 'no-store',
+    'screen_stocks':       'private, no-cache',
+    'strong_stocks':       'private, no-cache',
+    'smart_recommend':     'private, no-cache',
+    'callback':            'no-store',
+}
+init_api_response(app, API_CACHE_CONTROL)
+
 # LINE Bot 設定
 LINE_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_SECRET = os.getenv('LINE_CHANNEL_SECRET')
@@ -82,78 +108,116 @@ def _recent_trading_dates(n=3):
             break
     return dates
 
-def fetch_institutional_data(code, market):
+# 外部呼叫的逾時上限（秒）；有請求期限時取 min(上限, 剩餘時間)
+INSTITUTIONAL_TIMEOUT = 15
+INDEX_TIMEOUT = 10
+REALTIME_TIMEOUT = 15
+HISTORY_TIMEOUT = 15
+
+# API 請求期限（秒）：篩選、指數、個股圖表 / 籌碼、LINE 回覆；應小於 gunicorn worker timeout
+API_DEADLINE = float(os.getenv('API_DEADLINE', '25'))
+PUSH_DEADLINE = float(os.getenv('PUSH_DEADLINE', '120'))     # 每日推播：不趕回應，但也不能無限等待
+
+
+def fetch_institutional_data(code, market, deadline=None):
     """抓取最新一筆三大法人資料（嘗試最近幾個交易日）"""
+    deadline = Deadline.of(deadline)
     for date_str in _recent_trading_dates(3):
         try:
             result = (_fetch_twse_institutional if market == 'LISTED'
-                      else _fetch_tpex_institutional)(code, date_str)
+                      else _fetch_tpex_institutional)(code, date_str, deadline.timeout(INSTITUTIONAL_TIMEOUT))
             if result:
                 return result
+        except DeadlineExceeded:
+            deadline.mark_partial('institutional')
+            break
         except Exception as e:
             print(f"[三大法人] {date_str} 抓取失敗: {e}")
     return None
 
 
-def fetch_institutional_history(code, market, n_days=30):
+def fetch_institutional_history(code, market, n_days=30, deadline=None):
     """
     平行抓取最近 n_days 個交易日的三大法人資料。
-    回傳按日期舊→新排序的 list。
+    回傳按日期舊→新排序的 list；超過請求期限時只回傳已完成的部分（標記 partial）。
     """
+    deadline = Deadline.of(deadline)
     dates = _recent_trading_dates(n_days)
     print(f"[歷史法人] 開始抓取 {code} ({market}) 最近 {n_days} 天資料: {dates[0]} ~ {dates[-1]}")
 
     def _fetch_one(date_str):
         try:
             fn = _fetch_twse_institutional if market == 'LISTED' else _fetch_tpex_institutional
-            res = fn(code, date_str)
+            res = fn(code, date_str, deadline.timeout(INSTITUTIONAL_TIMEOUT))
             if res:
                 print(f"  - {date_str}: OK")
             return (date_str, res)
+        except DeadlineExceeded:
+            deadline.mark_partial('institutional')
+            return (date_str, None)
         except Exception as e:
             print(f"  - {date_str}: 失敗 ({e})")
             return (date_str, None)
 
-    with ThreadPoolExecutor(max_workers=10) as ex:
-        pairs = list(ex.map(_fetch_one, dates))
+    # 不用 with：期限到時不等待仍在執行的呼叫（其逾時已不超過剩餘時間），尚未開始的直接取消
+    ex = ThreadPoolExecutor(max_workers=10)
+    try:
+        futures = [ex.submit(_fetch_one, d) for d in dates]
+        done, not_done = deadline.wait(futures)
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        deadline.mark_partial('institutional')
+    pairs = [f.result() for f in futures if f in done]
 
     # 過濾 None，按日期排序（舊→新）
     valid = [(d, r) for d, r in pairs if r is not None]
-    print(f"[歷史法人] 抓取完成, 成功 {len(valid)}/{len(dates)} 筆")
+    print(f"[歷史法人] 抓取完成, 成功 {len(valid)}/{len(dates)} 筆" + ('（逾時，部分資料）' if not_done else ''))
     valid.sort(key=lambda x: x[0])
     return [r for _, r in valid]
 
 
-def _fetch_twse_institutional(code, date_str):
-    """從 TWSE T86 取得上市股票三大法人資料"""
-    url = (
-        f"https://www.twse.com.tw/rwd/zh/fund/T86"
-        f"?date={date_str}&response=json&selectType=ALLBUT0999"
-    )
-    resp = req.get(url, headers=_HEADERS, timeout=15, verify=False)
+def _fetch_t86_table(date_str, timeout=INSTITUTIONAL_TIMEOUT):
+    """取得 TWSE T86 某日全市場三大法人表，回傳 (fields, rows)；無資料回傳 None"""
+    url = "https://www.twse.com.tw/rwd/zh/fund/T86"
+    params = {'date': date_str, 'response': 'json', 'selectType': 'ALLBUT0999'}
+    resp = cached_get(url, params=params, headers=_HEADERS, timeout=timeout, verify=False,
+                      ttl=ttl_for_trading_date(date_str), validate=is_json)
     data = resp.json()
 
     if data.get('stat') != 'OK' or 'data' not in data:
         return None
+    return data.get('fields', []), data['data']
+
+
+def _fetch_tpex_insti_table(date_str, timeout=INSTITUTIONAL_TIMEOUT):
+    """取得 TPEX 某日全市場三大法人表，回傳 rows；無資料回傳 None"""
+    d_fmt = f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
+    url = "https://www.tpex.org.tw/web/stock/3insti/daily_trade/3itrade_hedge_result.php"
+    params = {'l': 'zh-tw', 'o': 'json', 'se': 'EW', 't': 'D', 'd': d_fmt}
+    resp = cached_get(url, params=params, headers={**_HEADERS, 'Referer': 'https://www.tpex.org.tw/'},
+                      timeout=timeout, verify=False, ttl=ttl_for_trading_date(date_str), validate=is_json)
+    data = resp.json()
+
+    return data.get('aaData') or data.get('data', []) or None
+
+
+def _fetch_twse_institutional(code, date_str, timeout=INSTITUTIONAL_TIMEOUT):
+    """從 TWSE T86 取得上市股票三大法人資料"""
+    table = _fetch_t86_table(date_str, timeout)
+    if not table:
+        return None
 
-    fields = data.get('fields', [])
-    for row in data['data']:
+    fields, rows = table
+    for row in rows:
         if str(row[0]).strip() == str(code).strip():
             return _build_institutional_result(fields, row, date_str)
     return None
 
 
-def _fetch_tpex_institutional(code, date_str):
+def _fetch_tpex_institutional(code, date_str, timeout=INSTITUTIONAL_TIMEOUT):
     """從 TPEX 取得上櫃股票三大法人資料"""
-    d_fmt = f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
-    url = (
-        f"https://www.tpex.org.tw/web/stock/3insti/daily_trade/"
-        f"3itrade_hedge_result.php?l=zh-tw&o=json&se=EW&t=D&d={d_fmt}"
-    )
-    resp = req.get(url, headers={**_HEADERS, 'Referer': 'https://www.tpex.org.tw/'}, timeout=15, verify=False)
-    data = resp.json()
-
-    rows = data.get('aaData') or data.get('data', [])
+    rows = _fetch_tpex_insti_table(date_str, timeout) or []
     for row in rows:
         if str(row[0]).strip() == str(code).strip():
             # TPEX 欄位順序：代號,名稱,外資買,外資賣,外資超,投信買,投信賣,投信超,自營買,自營賣,自營超,合計超
@@ -202,11 +266,12 @@ def _build_institutional_result(fields, row, date_str):
     return result
 
 
-def fetch_index_data(symbol, name):
-    """抓取指數資料"""
+def fetch_index_data(symbol, name, deadline=None):
+    """抓取指數資料；失敗或超過請求期限時回傳 0 並標記 partial"""
+    deadline = Deadline.of(deadline)
     try:
         ticker = yf.Ticker(symbol)
-        hist = ticker.history(period='5d')
+        hist = ticker.history(period='5d', timeout=deadline.timeout(INDEX_TIMEOUT))
         
         if len(hist) == 0:
             return {'name': name, 'value': 0, 'change_pct': 0}
@@ -228,6 +293,7 @@ def fetch_index_data(symbol, name):
         }
     except Exception as e:
         print(f"抓取指數失敗: {e}")
+        deadline.mark_partial('indices')
         return {'name': name, 'value': 0, 'change_pct': 0}
 
 def filter_and_rank_stocks(min_price, max_price, min_market_cap, min_volume_lots, gap_up_only=False, taiex_change=0, otc_change=0):
@@ -305,8 +371,9 @@ def filter_and_rank_stocks(min_price, max_price, min_market_cap, min_volume_lots
 def refresh_indices_api():
     """手動強制更新大盤指數"""
     try:
-        taiex = fetch_index_data('^TWII',  '加權指數')
-        otc   = fetch_index_data('^TWOII', '上櫃指數')
+        deadline = Deadline(API_DEADLINE)
+        taiex = fetch_index_data('^TWII',  '加權指數', deadline)
+        otc   = fetch_index_data('^TWOII', '上櫃指數', deadline)
         return jsonify({
             'success': True,
             'taiex': taiex,
@@ -316,62 +383,146 @@ def refresh_indices_api():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def fetch_realtime_prices(stocks):
-    """【極速批次版】使用 yf.download 一次抓取所有股票 2 天資料，計算最精準即時漲跌幅"""
+def _last_two_closes(df, symbols):
+    """
+    一次算出每支股票「最後一筆有效收盤」「前一筆有效收盤」與最後一筆的成交量。
+    回傳 (last, prev, volume, n_valid) 四個長度 = len(symbols) 的 numpy array。
+    """
+    close = panel_field(df, 'Close', symbols)
+    n = len(symbols)
+    if close is None or close.empty:
+        nan = np.full(n, np.nan)
+        return nan, nan.copy(), nan.copy(), np.zeros(n, dtype=int)
+
+    c = close.to_numpy(dtype=float)
+    valid = ~np.isnan(c)
+    n_valid = valid.sum(axis=0)
+    rank = np.cumsum(valid, axis=0)
+    rows = np.arange(c.shape[0])[:, None]
+    cols = np.arange(n)
+
+    last_idx = np.where(valid & (rank == n_valid), rows, -1).max(axis=0)
+    prev_idx = np.where(valid & (rank == n_valid - 1), rows, -1).max(axis=0)
+
+    last = np.where(last_idx >= 0, c[last_idx.clip(0), cols], np.nan)
+    prev = np.where(prev_idx >= 0, c[prev_idx.clip(0), cols], np.nan)
+
+    vol_panel = panel_field(df, 'Volume', symbols)
+    if vol_panel is None:
+        volume = np.zeros(n)
+    else:
+        v = vol_panel.to_numpy(dtype=float)
+        volume = np.where(last_idx >= 0, v[last_idx.clip(0), cols], 0)
+    return last, prev, np.nan_to_num(volume), n_valid
+
+
+# ── 即時報價快取（所有快照與 API 共用）──
+# symbol -> {'price', 'change_pct', 'volume', 'ts'}；超過 REALTIME_FRESH_SECONDS 秒才重新下載
+REALTIME_FRESH_SECONDS = int(os.getenv('REALTIME_FRESH_SECONDS', '60'))
+_realtime_cache = {}
+_realtime_lock = threading.Lock()
+
+
+def _yahoo_symbol(s):
+    return f"{s['code']}{'.TW' if s['market'] == 'LISTED' else '.TWO'}"
+
+
+def _record_time(s):
+    """資料庫記錄的 updated_at（本地時間 ISO 格式）-> epoch 秒；沒有或無法解析時為 0"""
+    try:
+        return datetime.fromisoformat(s['updated_at']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+def _quote_is_fresh(q, now, max_age):
+    return q is not None and now - q['ts'] <= max_age
+
+
+def apply_cached_quotes(stocks, max_age=None):
+    """
+    把快取中的即時報價套用到股票列表（不發出任何網路請求），回傳套用筆數。
+    超過 max_age 秒（預設 REALTIME_FRESH_SECONDS）或比記錄本身的 updated_at 還舊的報價不套用。
+    """
+    max_age = REALTIME_FRESH_SECONDS if max_age is None else max_age
+    now = time.time()
+    applied = 0
+    with _realtime_lock:
+        for s in stocks:
+            q = _realtime_cache.get(_yahoo_symbol(s))
+            if not _quote_is_fresh(q, now, max_age) or q['ts'] < _record_time(s):
+                continue
+            s['price'] = q['price']
+            s['change_pct'] = q['change_pct']
+            if q['volume'] > 0: s['volume'] = q['volume']
+            applied += 1
+    return applied
+
+
+def fetch_realtime_prices(stocks, max_age=None, deadline=None):
+    """
+    【極速批次版】使用 yf.download 抓取 2 天資料，計算最精準即時漲跌幅。
+    只下載快取中超過 max_age 秒（預設 REALTIME_FRESH_SECONDS）的股票，其餘直接套用快取。
+    下載失敗或超過請求期限時沿用快取 / 資料庫報價，並標記 partial。
+    """
     if not stocks: return stocks
-    
-    symbols = []
-    sym_to_code = {}
+    max_age = REALTIME_FRESH_SECONDS if max_age is None else max_age
+    deadline = Deadline.of(deadline)
+
+    # symbol -> 記錄 的索引（同一代碼若出現多筆，一併更新）
+    by_sym = {}
     for s in stocks:
-        suffix = '.TW' if s['market'] == 'LISTED' else '.TWO'
-        sym = f"{s['code']}{suffix}"
-        symbols.append(sym)
-        sym_to_code[sym] = s['code']
-        
-    try:
-        # 下載 2 天資料以確保有昨收 (iloc[-2]) 與今收 (iloc[-1])
-        df = yf.download(
-            symbols, period='2d', interval='1d', 
-            auto_adjust=True, progress=False, threads=True, group_by='ticker'
-        )
-    except Exception as e:
-        print(f"批次校準失敗: {e}")
-        return stocks
+        by_sym.setdefault(_yahoo_symbol(s), []).append(s)
+
+    now = time.time()
+    with _realtime_lock:
+        symbols = [sym for sym in by_sym if not _quote_is_fresh(_realtime_cache.get(sym), now, max_age)]
 
-    single = len(symbols) == 1
-    for sym in symbols:
+    if symbols:
+        print(f"[即時校準] 下載 {len(symbols)}/{len(by_sym)} 支（其餘使用 {max_age} 秒內的快取）")
         try:
-            if single:
-                sub = df
-            else:
-                sub = df[sym] if sym in df.columns.get_level_values(0) else None
-                
-            if sub is None or sub.empty: continue
-            sub = sub.dropna(how='all')
-            if sub.empty: continue
-            
-            latest = sub.iloc[-1]
-            current_price = round(float(latest['Close']), 2)
-            
-            # 計算基準昨收
-            if len(sub) >= 2:
-                prev_close = float(sub.iloc[-2]['Close'])
-            else:
-                # 只有一筆時，使用資料庫資料逆推昨收作為備援
-                s_obj = next((x for x in stocks if x['code'] == sym_to_code[sym]), None)
-                if not s_obj: continue
-                prev_close = s_obj['price'] / (1 + s_obj['change_pct']/100)
-            
-            change_pct = round(((current_price - prev_close) / prev_close) * 100, 2)
-            volume = int(latest['Volume']) if 'Volume' in latest else 0
-            
-            # 更新回原始列表
-            for s in stocks:
-                if s['code'] == sym_to_code[sym]:
-                    s['price'] = current_price
-                    s['change_pct'] = change_pct
-                    if volume > 0: s['volume'] = volume
-        except: continue
+            # 下載 2 天資料以確保有昨收 (iloc[-2]) 與今收 (iloc[-1])
+            df = yf.download(
+                symbols, period='2d', interval='1d',
+                auto_adjust=True, progress=False, threads=True, group_by='ticker',
+                timeout=deadline.timeout(REALTIME_TIMEOUT)
+            )
+        except Exception as e:
+            print(f"批次校準失敗: {e}")
+            deadline.mark_partial('realtime')
+            df = None
+
+        if df is not None:
+            last, prev, volume, n_valid = _last_two_closes(df, symbols)
+            fetched = {}
+            for i, sym in enumerate(symbols):
+                if n_valid[i] == 0:
+                    continue
+                current_price = round(float(last[i]), 2)
+
+                # 計算基準昨收；只有一筆時，使用資料庫資料逆推昨收作為備援
+                if n_valid[i] >= 2:
+                    prev_close = float(prev[i])
+                else:
+                    base = by_sym[sym][0]
+                    ratio = 1 + base.get('change_pct', 0) / 100
+                    if ratio <= 0:          # 資料庫漲跌幅 <= -100%：無法逆推昨收
+                        continue
+                    prev_close = base['price'] / ratio
+                if not prev_close or np.isnan(prev_close):
+                    continue
+
+                fetched[sym] = {
+                    'price': current_price,
+                    'change_pct': round(((current_price - prev_close) / prev_close) * 100, 2),
+                    'volume': int(volume[i]),
+                    'ts': now,
+                }
+            with _realtime_lock:
+                _realtime_cache.update(fetched)
+
+    # 更新回原始列表（包含剛下載與快取中的報價）
+    apply_cached_quotes(stocks, max_age)
     return stocks
 
 @app.route('/')
@@ -380,9 +531,138 @@ def index():
 
 # 舊篩選 API 已遷移至下方 Pipeline 區塊
 
+# ── /api/search 資料補充 ──
+# 所有搜尋請求共用同一個執行緒池（全域併發上限），每次呼叫與整個請求各有時間上限
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '16'))
+SEARCH_CALL_TIMEOUT = float(os.getenv('SEARCH_CALL_TIMEOUT', '10'))   # 單一資料來源呼叫（秒）
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE', '20'))           # 整個搜尋請求（秒）
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+
+
+def _chart_series(hist, intraday=False):
+    """yfinance history -> (K 線, 成交量) 兩個 list，格式供 TradingView Lightweight Charts 使用"""
+    return chart_rows(hist, intraday)
+
+
+def fetch_daily_bars(symbol, period='60d', start=None, end=None, deadline=None):
+    """日 K：指定 start / end 時依日期區間，否則依 period（經由 K 棒快取）"""
+    timeout = Deadline.of(deadline).timeout(HISTORY_TIMEOUT)
+    return get_bars(symbol, '1d', period=period, start=start, end=end, timeout=timeout)
+
+
+def fetch_intraday_bars(symbol, period='7d', interval='5m', deadline=None):
+    timeout = Deadline.of(deadline).timeout(HISTORY_TIMEOUT)
+    return get_bars(symbol, interval, period=period, timeout=timeout)
+
+
+def fetch_holders(symbol, deadline=None):
+    """股本與前 5 大法人持股（經由基本面快取，數天才向 Yahoo 更新一次）"""
+    data = get_fundamentals(symbol, deadline=deadline)
+    return {k: data[k] for k in ('shares_outstanding', 'float_shares', 'institutional_holders')}
+
+
+# 每個 part 收到的 deadline = min(單一呼叫上限, 整個請求剩餘時間)，底層的外部呼叫都以它計算逾時
+def _search_part_daily(stock, symbol, deadline):
+    candles, volumes = _chart_series(fetch_daily_bars(symbol, deadline=deadline))
+    return {'chart_data_daily': candles, 'volume_data_daily': volumes}
+
+
+def _search_part_intraday(stock, symbol, deadline):
+    candles, volumes = _chart_series(fetch_intraday_bars(symbol, deadline=deadline), intraday=True)
+    return {'chart_data_5min': candles, 'volume_data_5min': volumes}
+
+
+def _search_part_holders(stock, symbol, deadline):
+    """股本與法人持股同屬基本面快取，一次讀取同時回傳兩組欄位"""
+    return fetch_holders(symbol, deadline)
+
+
+def _search_part_institutional(stock, symbol, deadline):
+    history = fetch_institutional_history(stock['code'], stock['market'], n_days=60, deadline=deadline)
+    return {'institutional_history': history}
+
+
+# 資料種類 -> (抓取函式, 未取得時的預設值)
+SEARCH_PARTS = {
+    'daily':         (_search_part_daily,         {'chart_data_daily': [], 'volume_data_daily': []}),
+    'intraday':      (_search_part_intraday,      {'chart_data_5min': [], 'volume_data_5min': []}),
+    'holders':       (_search_part_holders,       {'shares_outstanding': 0, 'float_shares': 0,
+                                                   'institutional_holders': None}),
+    'institutional': (_search_part_institutional, {'institutional_history': []}),
+}
+
+
+def _run_search_part(fn, stock, symbol, deadline, call_timeout, box):
+    """回傳 (資料, 是否完整)；例如法人歷史只抓到部分日期時資料照用，但仍標記為不完整"""
+    box['started'] = time.time()
+    call = Deadline(min(call_timeout, deadline.remaining()))
+    result = fn(stock, symbol, call)
+    return result, not call.partial
+
+
+def enrich_search_results(stocks, deadline=None, call_timeout=None):
+    """
+    對每支股票 × 每種資料 平行抓取，完成一項就併入結果。
+    deadline 為整個請求的 Deadline（None 時為 SEARCH_DEADLINE 秒），單一呼叫另有 call_timeout 上限；
+    兩者都會傳進底層的外部呼叫作為逾時，逾時的部分保留預設值，並在該股的 partial_parts 列出缺少的資料種類。
+    回傳 (results, partial)。
+    """
+    deadline = Deadline(SEARCH_DEADLINE) if deadline is None else deadline
+    call_timeout = SEARCH_CALL_TIMEOUT if call_timeout is None else call_timeout
+
+    results = []
+    for s in stocks:
+        enriched = dict(s)
+        for _, defaults in SEARCH_PARTS.values():
+            enriched.update(defaults)
+        results.append(enriched)
+
+    jobs = {}
+    for i, s in enumerate(stocks):
+        symbol = _yahoo_symbol(s)
+        for part, (fn, _) in SEARCH_PARTS.items():
+            box = {}
+            jobs[_search_executor.submit(_run_search_part, fn, s, symbol, deadline, call_timeout, box)] = (i, part, box)
+
+    missing = [set(SEARCH_PARTS) for _ in stocks]
+    pending = set(jobs)
+    while pending:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=min(remaining, 0.25), return_when=FIRST_COMPLETED)
+        for fut in done:
+            i, part, _ = jobs[fut]
+            try:
+                data, complete = fut.result()
+                results[i].update(data)
+                if complete:
+                    missing[i].discard(part)
+            except Exception as e:
+                print(f"抓取 {stocks[i]['code']} {part} 資料失敗: {e}")
+        now = time.time()
+        for fut in [f for f in pending if jobs[f][2].get('started') and now - jobs[f][2]['started'] > call_timeout]:
+            i, part, _ = jobs[fut]
+            print(f"[搜尋] {stocks[i]['code']} {part} 超過 {call_timeout:.0f} 秒，略過")
+            pending.discard(fut)
+
+    for fut in pending:
+        fut.cancel()        # 尚未開始的工作直接取消，釋出共用執行緒池
+    if pending:
+        print(f"[搜尋] 超過 {deadline.seconds:.0f} 秒上限，{len(pending)} 項資料未完成")
+
+    for r, m in zip(results, missing):
+        if m:
+            r['partial_parts'] = sorted(m)
+    return results, any(missing)
+
+
 @app.route('/api/search', methods=['GET'])
 def search_stock():
-    """股票搜尋 API（包含歷史資料用於圖表）"""
+    """
+    股票搜尋 API：預設只回傳基本資料，圖表 / 籌碼由 /api/chart、/api/holders、/api/institutional 個別載入。
+    full=1 時維持舊格式（每筆結果內嵌 K 線、5 分 K 與法人歷史）。
+    """
     try:
         query = request.args.get('q', '').strip()
         
@@ -402,103 +682,199 @@ def search_stock():
             if query.lower() in stock['code'].lower() or query in stock['name']:
                 results.append(stock)
         
-        # 限制結果數量
-        results = results[:10]
+        # 限制結果數量（複製一份，避免改到資料庫物件），並套用共用的即時報價快取
+        results = [dict(s) for s in results[:10]]
+        apply_cached_quotes(results)
+        PREFETCHER.record_search(results)
         
-        # 為每支股票抓取歷史資料（用於 K 線圖）
-        enhanced_results = []
-        for stock in results:
-            try:
-                # 上市用 .TW，上櫃用 .TWO
-                suffix = '.TW' if stock['market'] == 'LISTED' else '.TWO'
-                symbol = f"{stock['code']}{suffix}"
-                ticker = yf.Ticker(symbol)
-                
-                # 抓取最近 60 天的日K資料
-                hist_daily = ticker.history(period='60d', interval='1d')
-                
-                # 抓取最近 7 天的5分K資料
-                hist_5min = ticker.history(period='7d', interval='5m')
-                
-                # 轉換日K資料（用於前端互動圖表）
-                chart_data_daily = []
-                volume_data_daily = []
-                for date, row in hist_daily.iterrows():
-                    # TradingView Lightweight Charts 接受 YYYY-MM-DD 字符串
-                    chart_data_daily.append({
-                        'time': date.strftime('%Y-%m-%d'),
-                        'open': round(row['Open'], 2),
-                        'high': round(row['High'], 2),
-                        'low': round(row['Low'], 2),
-                        'close': round(row['Close'], 2)
-                    })
-                    volume_data_daily.append({
-                        'time': date.strftime('%Y-%m-%d'),
-                        'value': int(row['Volume']),
-                        'color': '#ef5350' if row['Close'] >= row['Open'] else '#26a69a'
-                    })
-                
-                # 轉換5分K資料（用於前端互動圖表）
-                chart_data_5min = []
-                volume_data_5min = []
-                # TradingView 對日內圖表需要 Unix Timestamp (秒)
-                for date, row in hist_5min.iterrows():
-                    timestamp = int(date.timestamp())
-                    # 修正時區問題，yfinance 返回的是 UTC 時間，需要轉換為本地時間（如果需要顯示正確的小時）
-                    # 這裡假設已經是本地時間，或者前端處理
-                    # 為了保險，加上 8 小時（28800秒）如果是 UTC
-                    # yfinance history 通常帶有 tz info
-                    
-                    chart_data_5min.append({
-                        'time': timestamp,
-                        'open': round(row['Open'], 2),
-                        'high': round(row['High'], 2),
-                        'low': round(row['Low'], 2),
-                        'close': round(row['Close'], 2)
-                    })
-                    volume_data_5min.append({
-                        'time': timestamp,
-                        'value': int(row['Volume']),
-                        'color': '#ef5350' if row['Close'] >= row['Open'] else '#26a69a'
-                    })
-                
-                # 獲取籌碼資訊
-                info = ticker.info
-                institutional_holders = None
-                try:
-                    holders = ticker.institutional_holders
-                    if holders is not None and not holders.empty:
-                        institutional_holders = holders.head(5).to_dict('records')
-                except:
-                    pass
-                
-                enhanced_stock = {
-                    **stock,
-                    'chart_data_daily': chart_data_daily,
-                    'volume_data_daily': volume_data_daily,
-                    'chart_data_5min': chart_data_5min,
-                    'volume_data_5min': volume_data_5min,
-                    'institutional_holders': institutional_holders,
-                    'shares_outstanding': info.get('sharesOutstanding', 0),
-                    'float_shares': info.get('floatShares', 0),
-                    'institutional_history': fetch_institutional_history(stock['code'], stock['market'], n_days=60)
-                }
-                enhanced_results.append(enhanced_stock)
-            except Exception as e:
-                print(f"抓取 {stock['code']} 歷史資料失敗: {e}")
-                # 如果失敗，仍然返回基本資料
-                enhanced_results.append(stock)
+        if request.args.get('full') != '1':
+            return json_response({'success': True, 'query': query, 'count': len(results), 'results': results})
+        
+        # 為每支股票平行抓取 K 線、籌碼、法人歷史（有時間上限，逾時的部分標記為 partial）
+        enhanced_results, partial = enrich_search_results(results, Deadline(SEARCH_DEADLINE))
         
         return jsonify({
             'success': True,
             'query': query,
             'count': len(enhanced_results),
+            'partial': partial,
             'results': enhanced_results
         })
         
     except Exception as e:
         return jsonify({'error': f'搜尋失敗: {str(e)}'}), 500
 
+# ── 搜尋目標預熱：快照重建後，背景預熱推薦 / 強勢表格前幾名與最近搜尋的股票 ──
+# 預設參數與前端第一次載入個股時相同，點進個股就能直接命中快取
+PREFETCHER = Prefetcher({
+    'daily':         lambda stock: fetch_daily_bars(_yahoo_symbol(stock)),
+    'intraday':      lambda stock: fetch_intraday_bars(_yahoo_symbol(stock)),
+    'fundamentals':  lambda stock: get_fundamentals(_yahoo_symbol(stock)),
+    'institutional': lambda stock: fetch_institutional_history(stock['code'], stock['market'], n_days=60),
+}, runner_lock=FileLock('prefetch'))     # 多個 gunicorn worker 輪流預熱，同一時間只有一個在跑
+
+
+@app.before_request
+def _mark_foreground():
+    if request.path.startswith('/api/'):
+        g.prefetch_foreground = True
+        PREFETCHER.begin_foreground()
+
+
+@app.teardown_request
+def _unmark_foreground(exc):
+    if g.pop('prefetch_foreground', False):
+        PREFETCHER.end_foreground()
+
+
+# ── 個股圖表 / 籌碼 API（搜尋結果顯示時才個別載入）──
+CHART_DAILY_DEFAULT_DAYS = 60
+CHART_DAILY_MAX_DAYS = 730
+# 日內 K 的週期 -> Yahoo 可查詢的最長天數
+CHART_INTRADAY_INTERVALS = {'1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '60m': 730}
+CHART_CACHE_SECONDS = {'daily': 300, 'intraday': 60, 'holders': 3600, 'institutional': 300}
+
+
+_stock_index = {'mtime': None, 'by_code': {}}
+_stock_index_lock = threading.Lock()
+
+
+def stock_index():
+    """代碼 -> 股票 的索引；資料庫檔案的 mtime 改變（重新寫入）時才重建"""
+    try:
+        mtime = os.path.getmtime(DATABASE_FILE)
+    except OSError:
+        mtime = None
+    with _stock_index_lock:
+        if mtime is None or mtime != _stock_index['mtime']:
+            database = load_stock_database()
+            _stock_index['by_code'] = {s['code']: s for s in (database or {}).get('stocks', [])}
+            _stock_index['mtime'] = mtime
+        return _stock_index['by_code']
+
+
+def _find_stock(code):
+    """代碼 -> 資料庫中的股票（需要 market 決定 .TW / .TWO）；可用 ?market= 略過查詢"""
+    market = request.args.get('market')
+    if market in ('LISTED', 'OTC'):
+        return {'code': code, 'market': market}
+    return stock_index().get(code)
+
+
+def _int_arg(name, default, lo, hi):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} 必須是整數")
+    if not lo <= value <= hi:
+        raise ValueError(f"{name} 必須介於 {lo} ~ {hi}")
+    return value
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if value:
+        datetime.strptime(value, '%Y-%m-%d')   # 格式錯誤時拋出 ValueError
+    return value
+
+
+def _cacheable(payload, kind):
+    if isinstance(payload, bytes):
+        resp = app.response_class(payload, mimetype=BINARY_MIMETYPE)
+    else:
+        resp = json_response(payload)
+    resp.headers['Cache-Control'] = f"public, max-age={CHART_CACHE_SECONDS[kind]}"
+    return resp
+
+
+def _stock_response(code, kind, build):
+    """共用流程：查股票 -> build(stock, symbol, deadline) -> 加上快取標頭；參數錯誤 400、查無股票 404"""
+    stock = _find_stock(code)
+    if stock is None:
+        return jsonify({'error': f'找不到股票 {code}'}), 404
+    try:
+        payload = build(stock, _yahoo_symbol(stock), Deadline(API_DEADLINE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'資料抓取失敗: {str(e)}'}), 502
+    return _cacheable(payload if isinstance(payload, bytes) else {'code': code, **payload}, kind)
+
+
+CHART_FORMATS = ('rows', 'columns', 'binary')
+
+
+def _chart_format():
+    fmt = request.args.get('format', 'rows')
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"format 必須是 {', '.join(CHART_FORMATS)} 其中之一")
+    return fmt
+
+
+def _chart_payload(hist, interval, fmt, intraday=False):
+    """
+    format=rows：candles / volumes；columns：精簡欄位格式 {bars: {t, o, h, l, c, v}}；
+    binary：application/octet-stream（格式見 chart_payload.py，前端以 static/chart_codec.js 解碼）
+    """
+    cols = chart_columns(hist, intraday)
+    if fmt == 'binary':
+        return to_binary(cols, intraday)
+    if fmt == 'columns':
+        return {'interval': interval, 'format': 'columns', 'bars': to_columns(cols)}
+    candles, volumes = to_rows(cols)
+    return {'interval': interval, 'candles': candles, 'volumes': volumes}
+
+
+def _daily_chart(stock, symbol, deadline):
+    """?days=60（1 ~ 730）或 ?start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    start, end = _date_arg('start'), _date_arg('end')
+    days = _int_arg('days', CHART_DAILY_DEFAULT_DAYS, 1, CHART_DAILY_MAX_DAYS)
+    fmt = _chart_format()
+    return _chart_payload(fetch_daily_bars(symbol, period=f"{days}d", start=start, end=end, deadline=deadline),
+                          '1d', fmt)
+
+
+def _intraday_chart(stock, symbol, deadline):
+    """?interval=5m&days=7（天數上限依週期而定）"""
+    interval = request.args.get('interval', '5m')
+    if interval not in CHART_INTRADAY_INTERVALS:
+        raise ValueError(f"interval 必須是 {', '.join(CHART_INTRADAY_INTERVALS)} 其中之一")
+    days = _int_arg('days', 7, 1, CHART_INTRADAY_INTERVALS[interval])
+    fmt = _chart_format()
+    return _chart_payload(fetch_intraday_bars(symbol, f"{days}d", interval, deadline=deadline),
+                          interval, fmt, intraday=True)
+
+
+def _institutional(stock, symbol, deadline):
+    """?days=60（1 ~ 120 個交易日）"""
+    days = _int_arg('days', 60, 1, 120)
+    history = fetch_institutional_history(stock['code'], stock['market'], n_days=days, deadline=deadline)
+    return {'institutional_history': history}
+
+
+@app.route('/api/chart/<code>/daily', methods=['GET'])
+def stock_chart_daily(code):
+    """個股日 K"""
+    return _stock_response(code, 'daily', _daily_chart)
+
+
+@app.route('/api/chart/<code>/intraday', methods=['GET'])
+def stock_chart_intraday(code):
+    """個股日內 K（預設 5 分 K、7 天）"""
+    return _stock_response(code, 'intraday', _intraday_chart)
+
+
+@app.route('/api/holders/<code>', methods=['GET'])
+def stock_holders(code):
+    """個股股本與法人持股"""
+    return _stock_response(code, 'holders', lambda stock, symbol, deadline: fetch_holders(symbol, deadline))
+
+
+@app.route('/api/institutional/<code>', methods=['GET'])
+def stock_institutional(code):
+    """個股三大法人買賣超歷史"""
+    return _stock_response(code, 'institutional', _institutional)
+
 # 技術分析函數
 def calculate_technicals(hist):
     try:
@@ -518,6 +894,31 @@ def calculate_technicals(hist):
         print(f"計算技術指標失敗: {e}")
         return hist
 
+# 強勢選股候選數（優於大盤股依 Alpha 排序後取前 N 檔下載歷史資料）
+STRONG_CANDIDATE_LIMIT = int(os.getenv('STRONG_CANDIDATE_LIMIT', '150'))
+
+# 各股 MA / RSI 的滾動狀態，跨快照重建保留
+INDICATOR_BOOK = IndicatorBook()
+
+# /api/screen 的輸出區塊 -> (來源資料庫, 市場, 預設排序；None 表示沿用資料庫順序 = Alpha 由高到低)
+SCREEN_SECTIONS = {
+    'listed_stocks': ('outperformer_db', 'LISTED', None),
+    'otc_stocks':    ('outperformer_db', 'OTC',    None),
+    'listed_all':    ('base_pool',       'LISTED', 'change_pct'),
+    'otc_all':       ('base_pool',       'OTC',    'change_pct'),
+}
+SCREEN_SORT_KEYS = ('alpha', 'change_pct', 'volume', 'market_cap')
+SCREEN_FIELDS = ('symbol', 'name', 'current_price', 'daily_change_pct', 'volume', 'market_cap', 'market')
+SCREEN_MAX_LIMIT = 2000
+
+
+def format_screen_row(s):
+    return {
+        'symbol': f"{s['code']}.TW", 'name': s['name'], 'current_price': s['price'],
+        'daily_change_pct': s['change_pct'], 'volume': s['volume'],
+        'market_cap': s['market_cap'], 'market': s['market']
+    }
+
 # ── 管道狀態管理器 (Pipeline State Manager) ──
 # 這裡充當您要求的 "Database"，確保層次過濾的嚴格性與資料一致性
 class PipelineSnapshot:
@@ -526,15 +927,50 @@ class PipelineSnapshot:
         self.taiex = taiex
         self.otc = otc
         self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.version = f"{time.time_ns():x}"   # 快照版本：ETag 依此判斷內容是否改變
+        self.built_at = time.time()
+        self.partial_parts = []       # 建置時因逾時 / 失敗而不完整的部分（partial 快照只短暫沿用）
         
         # 管道階層資料庫
         self.base_pool = []           # 階層 1: 基礎池 (符合股價/成交量/市值)
         self.outperformer_db = []     # 階層 2: 優於大盤資料庫 (Alpha > 0)
         self.strong_stock_db = []     # 階層 3: 強勢選股資料庫 (站穩高點)
         self.smart_pick_db = []       # 階層 4: 智慧推薦資料庫 (指標完美)
+        self._screen_rows = {}        # (區塊, 排序) -> 已格式化並排序的輸出列，快照不變就不重算
+
+    @property
+    def partial(self):
+        return bool(self.partial_parts)
+
+    def _alpha(self, s):
+        if 'alpha' in s:
+            return s['alpha']
+        idx_chg = self.taiex['change_pct'] if s['market'] == 'LISTED' else self.otc['change_pct']
+        return round(s['change_pct'] - idx_chg, 2)
+
+    def screen_rows(self, section, sort=None):
+        """/api/screen 某個區塊的輸出列；sort 為 None 時使用該區塊的預設排序"""
+        db_name, market, default_sort = SCREEN_SECTIONS[section]
+        sort = sort or default_sort
+        rows = self._screen_rows.get((section, sort))
+        if rows is None:
+            pool = [s for s in getattr(self, db_name) if s['market'] == market]
+            if sort == 'alpha':
+                pool.sort(key=self._alpha, reverse=True)
+            elif sort:
+                pool.sort(key=lambda s: s[sort], reverse=True)
+            rows = self._screen_rows[(section, sort)] = [format_screen_row(s) for s in pool]
+        return rows
+
+    def run_full_sync(self, deadline=None):
+        """執行全鏈條過濾流程，一次性填充所有層級 Database；超過 deadline 的部分略過並記錄在 partial_parts"""
+        deadline = Deadline.of(deadline)
+        try:
+            self._sync(deadline)
+        finally:
+            self.partial_parts = deadline.partial_parts
 
-    def run_full_sync(self):
-        """執行全鏈條過濾流程，一次性填充所有層級 Database"""
+    def _sync(self, deadline):
         # 1. 抓取基礎池
         base = filter_and_rank_stocks(
             min_price=self.filters['min_price'], 
@@ -548,7 +984,7 @@ class PipelineSnapshot:
         if not self.base_pool: return
 
         # 2. 即時校準報價 (關鍵：所有層級共享同一組校準後的數據)
-        fetch_realtime_prices(self.base_pool)
+        fetch_realtime_prices(self.base_pool, deadline=deadline)
 
         # 3. 填充 優於大盤資料庫 (OUTPERFORMER_DB)
         for s in self.base_pool:
@@ -563,77 +999,87 @@ class PipelineSnapshot:
         self.outperformer_db.sort(key=lambda x: x['alpha'], reverse=True)
 
         # 4. 填充 強勢選股資料庫 (STRONG_STOCK_DB) -> 來源於 OUTPERFORMER_DB
-        print(f"[Database] 正在批次下載 {len(self.outperformer_db[:150])} 檔優於大盤股的歷史資料...")
+        candidates = self.outperformer_db[:STRONG_CANDIDATE_LIMIT]
+        print(f"[Database] 正在批次下載 {len(candidates)} 檔優於大盤股的歷史資料...")
         # 建立 Symbol 清單
-        candidates = self.outperformer_db[:150]
         symbols = [f"{s['code']}{'.TW' if s['market'] == 'LISTED' else '.TWO'}" for s in candidates]
         
         if symbols:
             try:
-                # 批次下載各股 25 天資料 (速度快 20 倍以上)
-                data_all = yf.download(symbols, period='25d', group_by='ticker', progress=False)
-                
-                for s in candidates:
-                    symbol = f"{s['code']}{'.TW' if s['market'] == 'LISTED' else '.TWO'}"
-                    # 處理單一或多個股票返回格式差異
-                    if len(symbols) == 1:
-                        hist = data_all
-                    else:
-                        if symbol not in data_all.columns.levels[0]: continue
-                        hist = data_all[symbol].dropna()
-                    
-                    if len(hist) < 10: continue
-                    
-                    hist = calculate_technicals(hist)
-                    is_strong, label, count = calc_high_days(hist)
-                    
-                    if is_strong:
-                        self.strong_stock_db.append({
-                            **s, 'reasons': [label], 'strong_score': count, 'hist': hist
-                        })
+                # 各股 25 天日 K：已收盤 K 棒來自磁碟快取，只下載快取之後的新 K 棒
+                data_all = get_bars_many(symbols, '1d', period='25d', timeout=deadline.timeout(HISTORY_TIMEOUT))
+
+                # 日期 × 股票 面板；MA / RSI 由程序內的增量指標狀態更新（盤中重建只需 O(1)/檔）
+                panel = build_panel(data_all, symbols)
+                feats = INDICATOR_BOOK.sync_panel(panel)
+                high_days = calc_high_days_batch(panel)
+
+                # 強勢條件見 strategy_rules.json 的 "strong" 策略
+                strong = get_strategy('strong').evaluate({
+                    'length':          panel.lengths,
+                    'high_days':       np.array([h[2] for h in high_days]),
+                    'high_days_label': np.array([h[1] for h in high_days], dtype=object),
+                    'alpha':           np.array([s['alpha'] for s in candidates], dtype=float),
+                    **{k: feats[k] for k in ('close', 'ma5', 'ma20', 'rsi')},
+                })
+                for j in np.flatnonzero(strong.passed):
+                    self.strong_stock_db.append({
+                        **candidates[j], 'reasons': strong.reasons(j), 'strong_score': strong.score_of(j),
+                        'tech': {k: float(feats[k][j]) for k in ('close', 'ma5', 'ma20', 'rsi')}
+                    })
             except Exception as e:
                 print(f"[Database] 批次資料抓取失敗: {e}")
+                deadline.mark_partial('history')
                 
         self.strong_stock_db.sort(key=lambda x: x['strong_score'], reverse=True)
 
         # 5. 填充 智慧推薦資料庫 (SMART_PICK_DB) -> 來源於 STRONG_STOCK_DB
-        for s in self.strong_stock_db:
-            latest = s['hist'].iloc[-1]
-            price, ma5, ma20, rsi = latest['Close'], latest['MA5'], latest['MA20'], latest['RSI']
-            
-            score = s['strong_score'] + 2 
-            reasons = [f"跑贏大盤 ({s['alpha']:+.2f}%)", s['reasons'][0]]
-            
-            if price > ma5 > ma20:
-                score += 3
-                reasons.append("均線多頭排列")
-            if 55 <= rsi <= 80:
-                score += 2
-                reasons.append(f"RSI 強勢範疇 ({rsi:.1f})")
-
-            if score >= 6:
+        #    評分規則見 strategy_rules.json 的 "smart_pick" 策略
+        strong_db = self.strong_stock_db
+        if strong_db:
+            smart = get_strategy('smart_pick').evaluate({
+                'price':         np.array([s['tech']['close'] for s in strong_db]),
+                'ma5':           np.array([s['tech']['ma5'] for s in strong_db]),
+                'ma20':          np.array([s['tech']['ma20'] for s in strong_db]),
+                'rsi':           np.array([s['tech']['rsi'] for s in strong_db]),
+                'strong_score':  np.array([s['strong_score'] for s in strong_db], dtype=float),
+                'alpha':         np.array([s['alpha'] for s in strong_db], dtype=float),
+                'change_pct':    np.array([s['change_pct'] for s in strong_db], dtype=float),
+                'volume':        np.array([s['volume'] for s in strong_db], dtype=float),
+                'market_cap':    np.array([s['market_cap'] for s in strong_db], dtype=float),
+                'strong_reason': np.array([s['reasons'][0] for s in strong_db], dtype=object),
+            })
+            for i in np.flatnonzero(smart.passed):
+                s = strong_db[i]
                 self.smart_pick_db.append({
-                    'code': s['code'], 'name': s['name'], 'price': round(price, 2),
+                    'code': s['code'], 'name': s['name'], 'price': round(s['tech']['close'], 2),
                     'change_pct': s['change_pct'], 'alpha': s['alpha'],
                     'volume': s['volume'], 'market': s['market'],
-                    'score': score, 'reasons': reasons
+                    'score': smart.score_of(i), 'reasons': smart.reasons(i)
                 })
         self.smart_pick_db.sort(key=lambda x: x['score'], reverse=True)
 
 # 全域單例，存儲當前的 Pipeline 狀態
 GLOBAL_SNAPSHOT = None
 
-def get_or_update_snapshot(filters):
+# 不完整（partial）的快照只沿用這麼多秒，之後的請求會重新建置
+PARTIAL_SNAPSHOT_TTL = int(os.getenv('PARTIAL_SNAPSHOT_TTL', '30'))
+
+
+def get_or_update_snapshot(filters, deadline=None):
     global GLOBAL_SNAPSHOT
+    deadline = Deadline.of(deadline)
     
     # 抓取最新的大盤數值作為基準
-    taiex = fetch_index_data('^TWII', '加權指數')
-    otc = fetch_index_data('^TWOII', '上櫃指數')
+    taiex = fetch_index_data('^TWII', '加權指數', deadline)
+    otc = fetch_index_data('^TWOII', '上櫃指數', deadline)
     
-    # 判斷是否需要重新運行整個 Pipeline (條件改變或第一次運行)
+    # 判斷是否需要重新運行整個 Pipeline (條件改變、第一次運行、或上次建置不完整且已過期)
     need_refresh = False
     if GLOBAL_SNAPSHOT is None:
         need_refresh = True
+    elif GLOBAL_SNAPSHOT.partial and time.time() - GLOBAL_SNAPSHOT.built_at > PARTIAL_SNAPSHOT_TTL:
+        need_refresh = True
     else:
         # 檢查關鍵篩選條件是否有變
         for key in ['min_price', 'max_price', 'min_market_cap', 'min_volume']:
@@ -644,55 +1090,114 @@ def get_or_update_snapshot(filters):
     if need_refresh:
         print(f"[Pipeline] 檢測到條件變更，重新建置 Database 快照...")
         new_snap = PipelineSnapshot(filters, taiex, otc)
-        new_snap.run_full_sync()
+        new_snap.run_full_sync(deadline)
+        if new_snap.partial:
+            print(f"[Pipeline] 快照不完整（{', '.join(new_snap.partial_parts)}），{PARTIAL_SNAPSHOT_TTL} 秒後重建")
         GLOBAL_SNAPSHOT = new_snap
+        PREFETCHER.on_snapshot(new_snap)
     
     return GLOBAL_SNAPSHOT
 
-@app.route('/api/screen', methods=['POST'])
-def screen_stocks():
-    """精準即時篩選 API (階層 2)"""
+
+def _partial_flags(snap):
+    """快照建置逾時 / 失敗時，回應帶 partial 與缺少的部分"""
+    if not snap.partial:
+        return {'partial': False}
+    return {'partial': True, 'partial_parts': snap.partial_parts}
+
+
+def _snapshot_etag(snap, name):
+    """同一個快照 + 同樣的請求內容 -> 同一個 ETag（快照重建後才會改變）"""
+    return make_etag(name, snap.version, request.get_data())
+
+def _request_filters():
+    """POST 內容 -> (data, filters)；格式錯誤拋出 ValueError（回應 400）"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("請以 JSON 物件傳送篩選條件")
     try:
-        data = request.get_json()
         filters = {
             'min_price': float(data.get('min_price', 10)),
             'max_price': float(data.get('max_price', 1000)),
             'min_market_cap': float(data.get('min_market_cap', 0)) * 100_000_000 if data.get('enable_market_cap') else 0,
             'min_volume': float(data.get('min_volume', 1000))
         }
-        
-        snap = get_or_update_snapshot(filters)
-        
-        # 從 snap.outperformer_db 格式化輸出
-        def format_s(s):
-            return {
-                'symbol': f"{s['code']}.TW", 'name': s['name'], 'current_price': s['price'],
-                'daily_change_pct': s['change_pct'], 'volume': s['volume'],
-                'market_cap': s['market_cap'], 'market': s['market']
-            }
+    except (TypeError, ValueError):
+        raise ValueError("min_price / max_price / min_market_cap / min_volume 必須是數字")
+    return data, filters
 
-        listed_out = [format_s(s) for s in snap.outperformer_db if s['market'] == 'LISTED']
-        otc_out = [format_s(s) for s in snap.outperformer_db if s['market'] == 'OTC']
-        
-        # listed_all 與 otc_all 則從 base_pool 取
-        listed_all = [format_s(s) for s in snap.base_pool if s['market'] == 'LISTED']
-        otc_all = [format_s(s) for s in snap.base_pool if s['market'] == 'OTC']
 
-        return jsonify({
+def _screen_page(data):
+    """
+    /api/screen 的分頁參數：offset / limit（各區塊分別切片）、fields（欄位清單或逗號分隔字串）、
+    sort（alpha / change_pct / volume / market_cap，由高到低）。都沒給時輸出與原本相同；
+    給了任何一項就附上 page（含實際使用的 sort 與各區塊總數）。
+    """
+    fields = data.get('fields')
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    if fields:
+        unknown = [f for f in fields if f not in SCREEN_FIELDS]
+        if unknown:
+            raise ValueError(f"未知的欄位: {', '.join(unknown)}")
+    sort = data.get('sort')
+    if sort is not None and sort not in SCREEN_SORT_KEYS:
+        raise ValueError(f"sort 必須是 {', '.join(SCREEN_SORT_KEYS)} 其中之一")
+    try:
+        offset = int(data.get('offset', 0))
+        limit = int(data['limit']) if data.get('limit') is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("offset / limit 必須是整數")
+    if offset < 0 or (limit is not None and not 1 <= limit <= SCREEN_MAX_LIMIT):
+        raise ValueError(f"offset 不可為負，limit 必須介於 1 ~ {SCREEN_MAX_LIMIT}")
+    paged = bool(fields) or limit is not None or 'offset' in data or sort is not None
+    return {'offset': offset, 'limit': limit, 'fields': fields, 'sort': sort, 'paged': paged}
+
+
+def _project(rows, fields):
+    if not fields:
+        return rows
+    return [{f: r[f] for f in fields} for r in rows]
+
+
+@app.route('/api/screen', methods=['POST'])
+def screen_stocks():
+    """精準即時篩選 API (階層 2)"""
+    try:
+        data, filters = _request_filters()
+        page = _screen_page(data)            # 參數錯誤要回 400，不能先以 304 回應
+        snap = get_or_update_snapshot(filters, Deadline(API_DEADLINE))
+        etag = _snapshot_etag(snap, 'screen')
+        cached = not_modified(etag, API_CACHE_CONTROL['screen_stocks'])
+        if cached:
+            return cached
+
+        # 各區塊的排序與格式化結果由快照快取；分頁只是切片
+        sections = {name: snap.screen_rows(name, page['sort']) for name in SCREEN_SECTIONS}
+        totals = {name: len(rows) for name, rows in sections.items()}
+        if page['paged']:
+            end = page['offset'] + page['limit'] if page['limit'] else None
+            sections = {name: _project(rows[page['offset']:end], page['fields']) for name, rows in sections.items()}
+
+        payload = {
             'success': True,
             'timestamp': snap.timestamp,
-            'listed_stocks': listed_out,
-            'otc_stocks': otc_out,
-            'listed_all': sorted(listed_all, key=lambda x: x['daily_change_pct'], reverse=True),
-            'otc_all': sorted(otc_all, key=lambda x: x['daily_change_pct'], reverse=True),
+            **_partial_flags(snap),
+            **sections,
             'indices': {'taiex': snap.taiex, 'otc': snap.otc},
             'stats': {
                 'total_analyzed': len(snap.base_pool),
                 'total_filtered': len(snap.outperformer_db),
-                'listed_outperformers': len(listed_out),
-                'otc_outperformers': len(otc_out)
+                'listed_outperformers': totals['listed_stocks'],
+                'otc_outperformers': totals['otc_stocks']
             }
-        })
+        }
+        if page['paged']:
+            payload['page'] = {'offset': page['offset'], 'limit': page['limit'], 'sort': page['sort'],
+                               'totals': totals}
+        return with_etag(json_response(payload), etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -701,27 +1206,28 @@ def screen_stocks():
 def strong_stocks():
     """強勢選股 API (階層 3)"""
     try:
-        data = request.get_json()
-        filters = {
-            'min_price': float(data.get('min_price', 10)),
-            'max_price': float(data.get('max_price', 1000)),
-            'min_market_cap': float(data.get('min_market_cap', 0)) * 100_000_000 if data.get('enable_market_cap') else 0,
-            'min_volume': float(data.get('min_volume', 1000))
-        }
-        snap = get_or_update_snapshot(filters)
+        data, filters = _request_filters()
+        snap = get_or_update_snapshot(filters, Deadline(API_DEADLINE))
+        etag = _snapshot_etag(snap, 'strong')
+        cached = not_modified(etag, API_CACHE_CONTROL['strong_stocks'])
+        if cached:
+            return cached
         
-        # 必須排除 'hist' (DataFrame)，否則 jsonify 會報錯
+        # 必須排除 'tech'（內部技術指標，可能含 NaN），否則前端 JSON 解析會失敗
         clean_strong_db = []
         for s in snap.strong_stock_db:
-            clean_s = {k: v for k, v in s.items() if k != 'hist'}
+            clean_s = {k: v for k, v in s.items() if k != 'tech'}
             clean_strong_db.append(clean_s)
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
+            **_partial_flags(snap),
             'count': len(clean_strong_db),
             'stocks': clean_strong_db,
             'indices': {'taiex': snap.taiex, 'otc': snap.otc}
-        })
+        }), etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -729,19 +1235,20 @@ def strong_stocks():
 def smart_recommend():
     """智慧推薦 API (階層 4)"""
     try:
-        data = request.get_json()
-        filters = {
-            'min_price': float(data.get('min_price', 10)),
-            'max_price': float(data.get('max_price', 1000)),
-            'min_market_cap': float(data.get('min_market_cap', 0)) * 100_000_000 if data.get('enable_market_cap') else 0,
-            'min_volume': float(data.get('min_volume', 1000))
-        }
-        snap = get_or_update_snapshot(filters)
+        data, filters = _request_filters()
+        snap = get_or_update_snapshot(filters, Deadline(API_DEADLINE))
+        etag = _snapshot_etag(snap, 'recommend')
+        cached = not_modified(etag, API_CACHE_CONTROL['smart_recommend'])
+        if cached:
+            return cached
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
+            **_partial_flags(snap),
             'recommendations': snap.smart_pick_db
-        })
+        }), etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -767,7 +1274,8 @@ def handle_message(event):
     if "推薦" in msg_text or "選股" in msg_text:
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text="🚀 正在為您分析今日強勢標的，請稍候..."))
         # 使用預設條件進行 Pipeline 分析
-        snap = get_or_update_snapshot({'min_price': 10, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 2000})
+        snap = get_or_update_snapshot({'min_price': 10, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 2000},
+                                      Deadline(API_DEADLINE))
         stocks = snap.smart_pick_db[:5]
         if stocks:
             reply = "🤖 AI 今日推薦強勢股：\n"
@@ -789,7 +1297,8 @@ def daily_push_job():
         return
 
     # 使用預設條件刷新
-    snap = get_or_update_snapshot({'min_price': 15.0, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 2500})
+    snap = get_or_update_snapshot({'min_price': 15.0, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 2500},
+                                  Deadline(PUSH_DEADLINE))
     stocks = snap.smart_pick_db[:8]
     if stocks:
         msg = f"🔔 【每日強勢股推播】 {datetime.now().strftime('%Y-%m-%d')}\n"
@@ -805,6 +1314,35 @@ def daily_push_job():
         line_bot_api.push_message(LINE_USER_ID, TextSendMessage(text=msg))
         print(f"[排程任務] 已推播至 {LINE_USER_ID}")
 
+# ── 盤中增量更新資料庫（設定 INTRADAY_REFRESH=1 才啟用）──────────
+
+INTRADAY_LOCK = FileLock('intraday_refresh')
+
+@scheduler.task('cron', id='intraday_refresh', day_of_week='mon-fri', hour='9-13', minute='*/5')
+def intraday_refresh_job():
+    if os.getenv('INTRADAY_REFRESH') != '1':
+        return
+    # 多個 gunicorn worker 各有一份排程：同一時間只讓一個程序更新資料庫
+    if not INTRADAY_LOCK.acquire():
+        print("[排程任務] 其他程序正在執行盤中增量更新，略過")
+        return
+    try:
+        from update_stock_database import update_stock_database_incremental
+        update_stock_database_incremental()
+    except Exception as e:
+        print(f"[排程任務] 盤中增量更新失敗: {e}")
+    finally:
+        INTRADAY_LOCK.release()
+
+# ── 基本面快取背景更新（最近查詢過且已過期的股票，慢速逐檔更新）──────────
+
+@scheduler.task('cron', id='fundamentals_refresh', hour='*/2', minute=17)
+def fundamentals_refresh_job():
+    try:
+        refresh_fundamentals()
+    except Exception as e:
+        print(f"[排程任務] 基本面快取更新失敗: {e}")
+
 # ─────────────────────────────────────────────
 
 
@@ -861,7 +1399,7 @@ def calc_high_days(hist):
     return is_strong, label, count
 
 
-# ── 新增技術條件請在此 list 加一個 tuple: (check_fn, kwargs) ──
+# ── 逐檔技術條件（舊介面）；快照流程的條件與評分改由 strategy_rules.json 設定 ──
 TECH_CONDITIONS = [
     (calc_high_days, {}),
 ]
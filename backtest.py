@@ -0,0 +1,405 @@
+"""
+歷史回測：重播 篩選 → 優於大盤 → 強勢股 → 智慧推薦 的完整流程
+
+1. build：批次下載全市場日 K（yf.download），存成 .cache/history/daily.npz
+   （日期 × 股票 的 Open / Close / Volume、股本、加權 / 櫃買指數收盤）
+2. run：對區間內每一天同時計算（日期 × 股票 二維陣列，不逐日迴圈）
+     - 價格 / 市值 / 成交量篩選，漲跌幅 > 所屬市場指數漲跌幅
+     - 依 Alpha 取前 STRONG_CANDIDATE_LIMIT 檔候選
+     - 連續高過前幾日實體高點（回看 LOOKBACK 根）、MA5 / MA20 / RSI14
+     - strategy_rules.json 的 strong / smart_pick 策略
+   報告各層選出股票的未來 N 日報酬、勝率、相對大盤超額報酬與每日換手率。
+
+命令列：
+  python backtest.py build --period 3y
+  python backtest.py run --start 2023-01-01 --end 2024-12-31 [--min-price 10 --min-volume 1000 ...]
+
+與即時流程的差異：即時流程用下載當下的 25 日資料（停牌日會被 dropna 跳過），
+這裡以每支股票自己的有效 K 棒計算（同樣跳過停牌日），指標以完整歷史計算；
+市值以目前股本 × 當日收盤估算。
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rules import get_strategy
+from technicals import panel_field, rolling_mean, rsi
+
+HISTORY_DIR = os.path.join('.cache', 'history')
+HISTORY_FILE = os.path.join(HISTORY_DIR, 'daily.npz')
+INDEX_SYMBOLS = ('^TWII', '^TWOII')     # 上市、上櫃各自的比較基準
+DOWNLOAD_BATCH = 100
+DOWNLOAD_WORKERS = 4
+LOOKBACK = 24           # 即時流程下載 25 日資料 -> 參考日之前最多 24 根 K 棒
+MIN_BARS = 10           # 與 run_full_sync 相同：少於 10 根不判斷強勢
+CANDIDATE_LIMIT = int(os.getenv('STRONG_CANDIDATE_LIMIT', '150'))
+HORIZONS = (1, 5, 10, 20)
+DEFAULT_FILTERS = {'min_price': 10, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 1000}
+LAYERS = ('outperformer', 'strong', 'smart')
+
+
+class History:
+    """
+    回測用日 K 面板（依日期對齊，停牌 / 未上市為 NaN）
+      dates (T,)  codes / markets / shares (N,)
+      open / close / volume (T × N)   index_close (T × 2)：^TWII、^TWOII
+    """
+
+    def __init__(self, dates, codes, markets, shares, open_, close, volume, index_close):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.codes = np.asarray(codes)
+        self.markets = np.asarray(markets)
+        self.shares = np.asarray(shares, dtype=float)
+        self.open = open_
+        self.close = close
+        self.volume = volume
+        self.index_close = index_close
+
+    @property
+    def otc(self):
+        return self.markets == 'OTC'
+
+    def save(self, path=HISTORY_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(tmp, dates=self.dates, codes=self.codes, markets=self.markets, shares=self.shares,
+                            open=self.open, close=self.close, volume=self.volume, index_close=self.index_close)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=HISTORY_FILE):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z['dates'], z['codes'], z['markets'], z['shares'],
+                       z['open'], z['close'], z['volume'], z['index_close'])
+
+
+# ── 建立歷史資料 ──────────────────────────────────
+
+def _load_shares(stocks):
+    """股本：優先用股本快取（.cache/shares_outstanding.json），沒有時以資料庫的 市值 / 股價 逆推"""
+    from update_stock_database import load_shares_cache
+    cache = load_shares_cache()
+    shares = []
+    for s in stocks:
+        entry = cache.get(s['code'])
+        if entry:
+            shares.append(entry['shares'])
+        elif s.get('market_cap') and s.get('price'):
+            shares.append(s['market_cap'] / s['price'])
+        else:
+            shares.append(np.nan)
+    return np.array(shares, dtype=float)
+
+
+def _download_fields(symbols, period, fields):
+    """yf.download 一批股票 -> {field: DataFrame(日期 × symbols)}"""
+    import yfinance as yf
+    df = yf.download(symbols, period=period, group_by='ticker', progress=False, threads=False)
+    out = {}
+    for f in fields:
+        p = panel_field(df, f, symbols) if not df.empty else None
+        out[f] = p if p is not None else pd.DataFrame(columns=symbols, dtype=float)
+    return out
+
+
+def _naive_index(frame):
+    idx = frame.index
+    if getattr(idx, 'tz', None) is not None:
+        idx = idx.tz_localize(None)
+    frame.index = pd.DatetimeIndex(idx).normalize()
+    return frame
+
+
+def build_history(period='3y', path=HISTORY_FILE):
+    """下載資料庫內所有股票與指數的日 K，存成 npz"""
+    from update_stock_database import load_database
+    from quote_sources import symbol_for
+
+    db = load_database()
+    if not db:
+        raise RuntimeError('股票資料庫不存在，請先執行 update_stock_database.py')
+    stocks = sorted(db['stocks'], key=lambda s: s['code'])
+    symbols = [symbol_for(s) for s in stocks]
+    batches = [symbols[i:i + DOWNLOAD_BATCH] for i in range(0, len(symbols), DOWNLOAD_BATCH)]
+    fields = ('Open', 'Close', 'Volume')
+
+    print(f"[回測] 下載 {len(symbols)} 支股票 {period} 日 K（{len(batches)} 批）...")
+    start = time.time()
+    parts = {f: [] for f in fields}
+
+    def _safe(batch):
+        try:
+            return _download_fields(batch, period, fields)
+        except Exception as e:
+            print(f"  - 批次下載失敗 ({batch[0]}...): {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as ex:
+        for i, got in enumerate(ex.map(_safe, batches), 1):
+            if got:
+                for f in fields:
+                    parts[f].append(_naive_index(got[f]))
+            print(f"  進度 {i}/{len(batches)}")
+
+    frames = {f: pd.concat(parts[f], axis=1).reindex(columns=symbols) for f in fields}
+    index = _naive_index(_download_fields(list(INDEX_SYMBOLS), period, ('Close',))['Close'])
+    dates = frames['Close'].index.union(index.index).sort_values()
+    arrays = {f: frames[f].reindex(dates).to_numpy(dtype=float) for f in fields}
+
+    hist = History(dates.to_numpy(dtype='datetime64[D]'),
+                   [s['code'] for s in stocks], [s['market'] for s in stocks], _load_shares(stocks),
+                   arrays['Open'], arrays['Close'], arrays['Volume'],
+                   index.reindex(dates).to_numpy(dtype=float))
+    hist.save(path)
+    print(f"[回測] 已儲存 {path}：{len(dates)} 日 × {len(symbols)} 支（{time.time() - start:.1f}s）")
+    return hist
+
+
+# ── 特徵計算（整段歷史一次算完）──────────────────────
+
+def _ffill(a):
+    """沿日期軸向前填補 NaN"""
+    T = a.shape[0]
+    idx = np.where(~np.isnan(a), np.arange(T).reshape(-1, *([1] * (a.ndim - 1))), 0)
+    idx = np.maximum.accumulate(idx, axis=0)
+    return np.take_along_axis(a, idx, axis=0)
+
+
+def _shift(a, k):
+    """a[t - k]（k > 0 往過去，k < 0 往未來），超出範圍補 NaN"""
+    out = np.full(a.shape, np.nan)
+    if k > 0:
+        out[k:] = a[:-k]
+    elif k < 0:
+        out[:k] = a[-k:]
+    else:
+        out[:] = a
+    return out
+
+
+def _pct_change(close):
+    """與資料庫相同：對前一個有成交日的收盤計算漲跌幅，四捨五入到小數 2 位"""
+    prev = _shift(_ffill(close), 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.round((close / prev - 1) * 100, 2)
+
+
+def _compress(valid):
+    """每支股票的有效列依時間順序往上堆疊：回傳 (order, pos)，pos 為每列在壓縮後的位置"""
+    order = np.argsort(~valid, axis=0, kind='stable')
+    pos = np.cumsum(valid, axis=0) - 1
+    return order, np.where(valid, pos, 0)
+
+
+def _high_days(open_c, close_c, lookback):
+    """壓縮空間中，收盤連續高過前幾根實體高點的根數（同 calc_high_days）"""
+    body = np.maximum(open_c, close_c)
+    ok_bar = (open_c > 0) & (close_c > 0)
+    count = np.zeros(close_c.shape, dtype=int)
+    alive = np.ones(close_c.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for k in range(1, lookback + 1):
+            prev_ok = _shift(ok_bar.astype(float), k) == 1
+            alive &= prev_ok & (close_c >= _shift(body, k) - 0.001)
+            count += alive
+    return count
+
+
+def compute_features(hist, lookback=LOOKBACK, horizons=HORIZONS):
+    """回測所需的所有 (T × N) 特徵；與篩選條件無關，參數掃描時可重複使用"""
+    close, open_ = hist.close, hist.open
+    valid = ~np.isnan(close) & ~np.isnan(open_)
+    order, pos = _compress(valid)
+    T = close.shape[0]
+
+    def compressed(a):
+        return np.take_along_axis(np.where(valid, a, np.nan), order, axis=0)
+
+    def expand(c):
+        return np.where(valid, np.take_along_axis(c, pos, axis=0), np.nan)
+
+    close_c, open_c = compressed(close), compressed(open_)
+    idx_chg_m = _pct_change(hist.index_close)
+    otc = hist.otc
+    idx_chg = np.where(otc, idx_chg_m[:, [1]], idx_chg_m[:, [0]])
+
+    feats = {
+        'valid':      valid,
+        'close':      close,
+        'change_pct': _pct_change(close),
+        'idx_chg':    idx_chg,
+        'market_cap': np.nan_to_num(close * hist.shares),
+        'volume':     np.nan_to_num(hist.volume),
+        'ma5':        expand(rolling_mean(close_c, 5)),
+        'ma20':       expand(rolling_mean(close_c, 20)),
+        'rsi':        expand(rsi(close_c, 14)),
+        'high_days':  np.where(valid, np.take_along_axis(_high_days(open_c, close_c, lookback), pos, axis=0), 0),
+        'bars':       np.where(valid, np.minimum(pos + 1, lookback + 1), 0),
+    }
+
+    close_ff = _ffill(close)
+    index_ff = _ffill(hist.index_close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for h in horizons:
+            fwd = _shift(close_ff, -h) / close - 1
+            fwd_idx = _shift(index_ff, -h) / index_ff - 1
+            feats[f"fwd_{h}"] = fwd
+            feats[f"idx_fwd_{h}"] = np.where(otc, fwd_idx[:, [1]], fwd_idx[:, [0]])
+    feats['T'] = T
+    return feats
+
+
+# ── 重播選股流程 ──────────────────────────────────
+
+def replay(feats, filters=None, candidate_limit=CANDIDATE_LIMIT, strategy_params=None):
+    """
+    回傳各層的 (T × N) 遮罩與分數：
+      outperformer / strong / smart  布林遮罩
+      alpha / strong_score / smart_score
+    strategy_params: {'strong': {...}, 'smart_pick': {...}} 覆寫策略參數
+    """
+    f = {**DEFAULT_FILTERS, **(filters or {})}
+    strategy_params = strategy_params or {}
+    close = feats['close']
+
+    with np.errstate(invalid='ignore'):
+        base = (feats['valid'] & (close >= f['min_price']) & (close <= f['max_price'])
+                & (feats['market_cap'] >= f['min_market_cap']) & (feats['volume'] >= f['min_volume'] * 1000))
+        outperf = base & (feats['change_pct'] > feats['idx_chg'])
+    alpha = np.round(feats['change_pct'] - feats['idx_chg'], 2)
+
+    # 每天依 Alpha 由大到小取前 candidate_limit 檔
+    ranked = np.argsort(np.where(outperf, -alpha, np.inf), axis=1, kind='stable')
+    rank = np.empty_like(ranked)
+    np.put_along_axis(rank, ranked, np.arange(ranked.shape[1])[None, :], axis=1)
+    cand = outperf & (rank < candidate_limit)
+
+    strong = np.zeros(close.shape, dtype=bool)
+    strong_score = np.zeros(close.shape)
+    ti, tj = np.nonzero(cand)
+    res = get_strategy('strong').evaluate({
+        'length': feats['bars'][ti, tj], 'high_days': feats['high_days'][ti, tj], 'alpha': alpha[ti, tj],
+        'close': close[ti, tj], 'ma5': feats['ma5'][ti, tj], 'ma20': feats['ma20'][ti, tj], 'rsi': feats['rsi'][ti, tj],
+    }, params=strategy_params.get('strong'))
+    strong[ti[res.passed], tj[res.passed]] = True
+    strong_score[ti, tj] = res.score
+
+    smart = np.zeros(close.shape, dtype=bool)
+    smart_score = np.zeros(close.shape)
+    si, sj = np.nonzero(strong)
+    res = get_strategy('smart_pick').evaluate({
+        'price': close[si, sj], 'ma5': feats['ma5'][si, sj], 'ma20': feats['ma20'][si, sj],
+        'rsi': feats['rsi'][si, sj], 'strong_score': strong_score[si, sj], 'alpha': alpha[si, sj],
+        'change_pct': feats['change_pct'][si, sj], 'volume': feats['volume'][si, sj],
+        'market_cap': feats['market_cap'][si, sj],
+    }, params=strategy_params.get('smart_pick'))
+    smart[si[res.passed], sj[res.passed]] = True
+    smart_score[si, sj] = res.score
+
+    return {'outperformer': outperf, 'strong': strong, 'smart': smart,
+            'alpha': alpha, 'strong_score': strong_score, 'smart_score': smart_score}
+
+
+def _turnover(mask):
+    """每日換手率：今天的名單中，昨天不在名單內的比例（今天無名單的日子不計）"""
+    n_today = mask.sum(axis=1)
+    kept = (mask[1:] & mask[:-1]).sum(axis=1)
+    days = n_today[1:] > 0
+    if not days.any():
+        return float('nan')
+    return float(np.mean(1 - kept[days] / n_today[1:][days]))
+
+
+def summarize(feats, masks, dates, start=None, end=None, horizons=HORIZONS):
+    """各層在 [start, end] 區間的平均每日檔數、未來報酬、勝率、超額報酬、換手率"""
+    in_range = np.ones(len(dates), dtype=bool)
+    if start:
+        in_range &= dates >= np.datetime64(start)
+    if end:
+        in_range &= dates <= np.datetime64(end)
+
+    report = {'start': str(dates[in_range][0]) if in_range.any() else None,
+              'end': str(dates[in_range][-1]) if in_range.any() else None,
+              'days': int(in_range.sum()), 'layers': {}}
+    for layer in LAYERS:
+        mask = masks[layer] & in_range[:, None]
+        stats = {'picks': int(mask.sum()),
+                 'avg_per_day': round(float(mask.sum() / max(in_range.sum(), 1)), 2),
+                 'turnover': _turnover(masks[layer][in_range])}
+        for h in horizons:
+            fwd = feats[f"fwd_{h}"][mask]
+            excess = fwd - feats[f"idx_fwd_{h}"][mask]
+            ok = ~np.isnan(fwd)
+            stats[f"{h}d"] = {
+                'n':        int(ok.sum()),
+                'mean':     float(np.mean(fwd[ok])) if ok.any() else float('nan'),
+                'hit_rate': float(np.mean(fwd[ok] > 0)) if ok.any() else float('nan'),
+                'excess':   float(np.nanmean(excess[ok])) if ok.any() else float('nan'),
+            }
+        report['layers'][layer] = stats
+    return report
+
+
+def run_backtest(start=None, end=None, filters=None, candidate_limit=CANDIDATE_LIMIT,
+                 strategy_params=None, path=HISTORY_FILE, horizons=HORIZONS):
+    hist = History.load(path)
+    t0 = time.time()
+    feats = compute_features(hist, horizons=horizons)
+    t1 = time.time()
+    masks = replay(feats, filters, candidate_limit, strategy_params)
+    report = summarize(feats, masks, hist.dates, start, end, horizons)
+    report['timing'] = {'features': round(t1 - t0, 2), 'replay': round(time.time() - t1, 2)}
+    return report
+
+
+def print_report(report, horizons=HORIZONS):
+    print(f"\n回測區間 {report['start']} ~ {report['end']}（{report['days']} 個交易日）")
+    header = f"{'層級':<14}{'每日檔數':>8}{'換手率':>8}" + ''.join(f"{f'{h}日報酬':>10}{'勝率':>7}{'超額':>8}" for h in horizons)
+    print(header)
+    print('-' * (len(header) + 8))
+    for layer, s in report['layers'].items():
+        line = f"{layer:<14}{s['avg_per_day']:>10.1f}{s['turnover']:>10.1%}"
+        for h in horizons:
+            r = s[f"{h}d"]
+            line += f"{r['mean']:>12.2%}{r['hit_rate']:>9.1%}{r['excess']:>9.2%}"
+        print(line)
+    if 'timing' in report:
+        print(f"\n計算耗時：特徵 {report['timing']['features']}s，重播 {report['timing']['replay']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='強勢股 / 智慧推薦 歷史回測')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_build = sub.add_parser('build', help='下載並儲存歷史日 K')
+    p_build.add_argument('--period', default='3y')
+    p_run = sub.add_parser('run', help='執行回測')
+    p_run.add_argument('--start')
+    p_run.add_argument('--end')
+    p_run.add_argument('--min-price', type=float, default=DEFAULT_FILTERS['min_price'])
+    p_run.add_argument('--max-price', type=float, default=DEFAULT_FILTERS['max_price'])
+    p_run.add_argument('--min-market-cap', type=float, default=0, help='單位：億')
+    p_run.add_argument('--min-volume', type=float, default=DEFAULT_FILTERS['min_volume'], help='單位：張')
+    p_run.add_argument('--candidates', type=int, default=CANDIDATE_LIMIT)
+    p_run.add_argument('--json', help='另存完整報告 JSON')
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        build_history(args.period)
+        return
+
+    filters = {'min_price': args.min_price, 'max_price': args.max_price,
+               'min_market_cap': args.min_market_cap * 100_000_000, 'min_volume': args.min_volume}
+    report = run_backtest(args.start, args.end, filters, args.candidates)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+K 棒快取（每支股票 × 每種週期）
+
+圖表、技術指標、儀表板都從這裡取 OHLCV，不再每次向 Yahoo 重抓整段視窗：
+  - 已收盤的 K 棒不會再變動：附加寫入磁碟 .cache/bars/<週期>/<代號>.csv
+  - 最後一根尚未收盤的 K 棒只放在記憶體，超過 BAR_OPEN_TTL 秒才重抓
+  - 重抓時只從最後一根已收盤 K 棒之後開始下載，新的 K 棒附加到檔尾
+  - 要求的區間比快取更早時才回補舊資料
+  - 快取未還原的原始價（auto_adjust=False）與 Adj Close；重抓時與重疊的已收盤 K 棒比對，
+    Close 或 Adj Close 不一致（分割 / 減資 / 除權息造成 Yahoo 回溯調整）時整段重新下載
+  - 回傳給呼叫端的是還原後的價格（與 auto_adjust=True 相同：OHLC 乘上 Adj Close / Close），
+    圖表、技術指標在除權息前後不會出現缺口
+
+收盤判定：日 K 的日期早於交易所當地的今天；日內 K 的開始時間 + 週期 <= 現在。
+
+命令列：
+  python bar_cache.py stats
+  python bar_cache.py purge [--interval 5m] [--symbol 2330.TW]
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+
+BAR_CACHE_DIR = os.getenv('BAR_CACHE_DIR', os.path.join('.cache', 'bars'))
+OPEN_BAR_TTL = int(os.getenv('BAR_OPEN_TTL', '60'))     # 未收盤 K 棒的有效秒數
+DOWNLOAD_TIMEOUT = 10
+MARKET_TZ = 'Asia/Taipei'
+PRICE_TOLERANCE = 1e-4      # 重疊 K 棒收盤價的相對誤差上限，超過視為歷史價格已被調整
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']      # 回傳欄位（還原價）
+RAW_FIELDS = FIELDS + ['Adj Close']                      # 快取欄位（原始價 + 還原收盤價）
+INTERVAL_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+# Yahoo 日內資料可查詢的最長天數
+MAX_LOOKBACK_DAYS = {'1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '60m': 730, '90m': 60, '1h': 730}
+
+
+class _Series:
+    """單一 (代號, 週期) 的快取狀態"""
+
+    def __init__(self):
+        self.closed = None          # 已收盤 K 棒 DataFrame
+        self.open_bar = None        # 最後一根未收盤 K 棒（0 或 1 列）
+        self.covered_from = None    # 快取涵蓋的起始日（naive Timestamp）
+        self.tz = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+
+_series = {}
+_series_lock = threading.Lock()
+_stats = {'hits': 0, 'refreshes': 0, 'backfills': 0}
+
+
+def _paths(symbol, interval):
+    d = os.path.join(BAR_CACHE_DIR, interval)
+    safe = symbol.replace('^', '_').replace('/', '_')
+    return os.path.join(d, f"{safe}.csv"), os.path.join(d, f"{safe}.json")
+
+
+def _get_series(symbol, interval):
+    key = (symbol, interval)
+    with _series_lock:
+        s = _series.get(key)
+        if s is None:
+            s = _series[key] = _Series()
+            _load(s, symbol, interval)
+        return s
+
+
+def _load(s, symbol, interval):
+    csv_path, meta_path = _paths(symbol, interval)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        df = pd.read_csv(csv_path, index_col=0)
+    except (OSError, ValueError):
+        return
+    df.index = pd.to_datetime(df.index, utc=True).tz_convert(meta['tz'])
+    s.closed = _with_adj_close(df)      # 舊版快取檔沒有 Adj Close：下次更新比對不符時會整段重抓
+    s.tz = meta['tz']
+    s.covered_from = pd.Timestamp(meta['covered_from'])
+
+
+def _save_meta(s, symbol, interval):
+    _, meta_path = _paths(symbol, interval)
+    tmp = f"{meta_path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'tz': s.tz, 'covered_from': s.covered_from.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    os.replace(tmp, meta_path)
+
+
+def _rewrite(s, symbol, interval):
+    csv_path, _ = _paths(symbol, interval)
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    tmp = f"{csv_path}.tmp"
+    s.closed.to_csv(tmp)
+    os.replace(tmp, csv_path)
+    _save_meta(s, symbol, interval)
+
+
+def _append(s, symbol, interval, rows):
+    """新收盤的 K 棒附加到檔尾（既有資料不改寫）"""
+    csv_path, _ = _paths(symbol, interval)
+    if not os.path.exists(csv_path):
+        return _rewrite(s, symbol, interval)
+    with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+        rows.to_csv(f, header=False)
+
+
+# ── 區間與收盤判定 ──────────────────────────────
+
+def _today():
+    """交易所當地（台北）的今天，naive Timestamp"""
+    return pd.Timestamp.now(tz=MARKET_TZ).tz_localize(None).normalize()
+
+
+def _range_start(period=None, start=None, interval='1d'):
+    """period ('60d' / '2wk' / '3mo' / '1y') 或 start -> naive 起始時間"""
+    if start:
+        since = pd.Timestamp(start)
+    else:
+        num = ''.join(ch for ch in period if ch.isdigit())
+        unit = period[len(num):]
+        offsets = {'d': pd.DateOffset(days=1), 'wk': pd.DateOffset(weeks=1),
+                   'mo': pd.DateOffset(months=1), 'y': pd.DateOffset(years=1)}
+        if not num or unit not in offsets:
+            raise ValueError(f"不支援的 period: {period}")
+        since = _today() - offsets[unit] * int(num)
+    if interval in MAX_LOOKBACK_DAYS:
+        since = max(since, _today() - pd.Timedelta(days=MAX_LOOKBACK_DAYS[interval] - 1))
+    return since
+
+
+def _split_closed(df, interval, now=None):
+    """把下載結果拆成 (已收盤, 未收盤)"""
+    if df.empty:
+        return df, df
+    now = now or pd.Timestamp.now(tz=df.index.tz)
+    if interval in INTERVAL_MINUTES:
+        closed = df.index + pd.Timedelta(minutes=INTERVAL_MINUTES[interval]) <= now
+    else:
+        closed = df.index.normalize() < now.normalize()
+    return df[closed], df[~closed]
+
+
+def _naive(index):
+    return index.tz_localize(None) if index.tz is not None else index
+
+
+# ── 下載 ──────────────────────────────────
+
+def _with_adj_close(df):
+    """補上 Adj Close 欄位（沒有時等於 Close），欄位順序固定為 RAW_FIELDS"""
+    if 'Adj Close' not in df.columns:
+        df = df.assign(**{'Adj Close': df['Close'] if 'Close' in df.columns else float('nan')})
+    return df[[f for f in RAW_FIELDS if f in df.columns]]
+
+
+def _clean(df):
+    if df is None or df.empty:
+        return pd.DataFrame(columns=RAW_FIELDS, dtype=float)
+    df = _with_adj_close(df).dropna(how='all')
+    if df.index.tz is None:
+        df.index = df.index.tz_localize(MARKET_TZ)
+    return df
+
+
+def _download(symbols, interval, start, timeout=DOWNLOAD_TIMEOUT):
+    """下載多支股票自 start 起的原始價 K 棒（不還原權息，另附 Adj Close），回傳 symbol -> DataFrame"""
+    import yfinance as yf
+    start = pd.Timestamp(start).strftime('%Y-%m-%d')
+    if len(symbols) == 1:
+        hist = yf.Ticker(symbols[0]).history(start=start, interval=interval, auto_adjust=False,
+                                             timeout=timeout)
+        return {symbols[0]: _clean(hist)}
+    data = yf.download(symbols, start=start, interval=interval, group_by='ticker',
+                       auto_adjust=False, progress=False, timeout=timeout)
+    out = {}
+    for sym in symbols:
+        if isinstance(data.columns, pd.MultiIndex) and sym in data.columns.get_level_values(0):
+            out[sym] = _clean(data[sym])
+        else:
+            out[sym] = _clean(None)
+    return out
+
+
+# ── 讀取 ──────────────────────────────────
+
+def _plan(s, since, end, now):
+    """回傳這次需要的動作：'backfill'、'refresh' 或 None（直接用快取）"""
+    if s.covered_from is None or since < s.covered_from:
+        return 'backfill'
+    if end is not None and s.closed is not None and len(s.closed) \
+            and pd.Timestamp(end) <= _naive(s.closed.index)[-1]:
+        return None     # 指定的歷史區間已完全在快取內
+    if now - s.fetched_at > OPEN_BAR_TTL:
+        return 'refresh'
+    return None
+
+
+def _fetch_start(s, action, since):
+    if action == 'backfill' or s.closed is None or not len(s.closed):
+        return since
+    return _naive(s.closed.index)[-1].normalize()     # 最後一根已收盤 K 棒當天起（含重疊）
+
+
+def _adjusted(s, closed):
+    """重疊的已收盤 K 棒 Close / Adj Close 與快取不一致（歷史價格被回溯調整）"""
+    if s.closed is None or not len(s.closed) or not len(closed):
+        return False
+    overlap = closed.index.intersection(s.closed.index)
+    if not len(overlap):
+        return False
+    for col in ('Close', 'Adj Close'):
+        old = s.closed.loc[overlap, col]
+        new = closed.loc[overlap, col]
+        if ((new - old).abs() > old.abs() * PRICE_TOLERANCE).any():
+            return True
+    return False
+
+
+def _apply(s, symbol, interval, action, since, df, now):
+    """
+    把下載結果併入快取；已存在的已收盤 K 棒不覆寫。
+    回傳 True 表示重疊 K 棒價格已被調整，呼叫端需以 _rebuild 整段重抓。
+    """
+    closed, open_bar = _split_closed(_with_adj_close(df), interval)
+    if _adjusted(s, closed):
+        print(f"[K棒快取] {symbol} {interval} 歷史價格已調整，整段重新下載")
+        return True
+    if s.tz is None:
+        s.tz = str(df.index.tz) if len(df) else MARKET_TZ
+    if s.closed is not None and len(s.closed):
+        new_rows = closed[closed.index > s.closed.index[-1]]
+        older = closed[closed.index < s.closed.index[0]]
+        # 下載結果須涵蓋到既有快取的開頭，才能把涵蓋起點往前推
+        covers = len(closed) and closed.index[0] <= s.closed.index[0]
+    else:
+        new_rows, older = closed, closed.iloc[0:0]
+        covers = len(closed) > 0
+
+    if action == 'backfill':
+        if covers:
+            parts = [p for p in (older, s.closed, new_rows) if p is not None and len(p)]
+            s.closed = pd.concat(parts)
+            s.covered_from = since if s.covered_from is None else min(since, s.covered_from)
+            _rewrite(s, symbol, interval)
+        _stats['backfills'] += 1
+    else:
+        if len(new_rows):
+            s.closed = pd.concat([s.closed, new_rows])
+            _append(s, symbol, interval, new_rows)
+        _stats['refreshes'] += 1
+    s.open_bar = open_bar
+    s.fetched_at = now
+    return False
+
+
+def _rebuild(s, symbol, interval, since, timeout, now):
+    """丟棄快取，自原涵蓋起點（或 since）重新下載整段"""
+    start = since if s.covered_from is None else min(since, s.covered_from)
+    s.closed = s.open_bar = s.covered_from = None
+    df = _download([symbol], interval, start, timeout)[symbol]
+    _apply(s, symbol, interval, 'backfill', start, df, now)
+
+
+def _to_adjusted(df):
+    """原始價 -> 還原價（同 yfinance auto_adjust：OHLC 乘上 Adj Close / Close，成交量不變）"""
+    ratio = (df['Adj Close'] / df['Close']).where(df['Close'] != 0).fillna(1.0)
+    out = df[FIELDS].copy()
+    for col in ('Open', 'High', 'Low'):
+        out[col] = out[col] * ratio
+    out['Close'] = df['Adj Close'].where(ratio != 1.0, df['Close'])
+    return out
+
+
+def _result(s, since, end):
+    parts = [p for p in (s.closed, s.open_bar) if p is not None and len(p)]
+    if not parts:
+        return pd.DataFrame(columns=FIELDS, dtype=float)
+    df = pd.concat(parts)
+    naive = _naive(df.index)
+    mask = naive >= since
+    if end is not None:
+        mask &= naive < pd.Timestamp(end)
+    return _to_adjusted(df[mask])
+
+
+def get_bars(symbol, interval='1d', period='60d', start=None, end=None, timeout=DOWNLOAD_TIMEOUT):
+    """
+    單一股票的還原價 K 棒（欄位 Open / High / Low / Close / Volume，index 為交易所時區）。
+    period 或 start / end 擇一；end 不含當日（同 yfinance）。timeout 為需要下載時的逾時秒數。
+    """
+    since = _range_start(period, start, interval)
+    s = _get_series(symbol, interval)
+    with s.lock:
+        now = time.time()
+        action = _plan(s, since, end, now)
+        if action:
+            df = _download([symbol], interval, _fetch_start(s, action, since), timeout)[symbol]
+            if _apply(s, symbol, interval, action, since, df, now):
+                _rebuild(s, symbol, interval, since, timeout, now)
+        else:
+            _stats['hits'] += 1
+        return _result(s, since, end)
+
+
+def get_bars_many(symbols, interval='1d', period='60d', timeout=DOWNLOAD_TIMEOUT):
+    """
+    多支股票一次取得，格式同 yf.download(group_by='ticker')（欄位為 (代號, 欄位) MultiIndex）。
+    需要回補的股票與只需更新最後幾根的股票各自合併成一次批次下載。
+    """
+    since = _range_start(period, None, interval)
+    series = {sym: _get_series(sym, interval) for sym in symbols}
+    now = time.time()
+
+    groups = {}
+    for sym, s in series.items():
+        with s.lock:
+            action = _plan(s, since, None, now)
+            if action:
+                groups.setdefault(action, []).append(sym)
+            else:
+                _stats['hits'] += 1
+
+    for action, syms in groups.items():
+        start = min(_fetch_start(series[sym], action, since) for sym in syms)
+        downloaded = _download(syms, interval, start, timeout)
+        for sym in syms:
+            with series[sym].lock:
+                if _apply(series[sym], sym, interval, action, since, downloaded[sym], now):
+                    _rebuild(series[sym], sym, interval, since, timeout, now)
+
+    frames = {}
+    for sym, s in series.items():
+        with s.lock:
+            frames[sym] = _result(s, since, None)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1).sort_index()
+
+
+# ── 命令列工具 ──────────────────────────────────
+
+def cache_stats():
+    stats = {'intervals': {}, 'bytes': 0, **_stats}
+    if not os.path.isdir(BAR_CACHE_DIR):
+        return stats
+    for interval in sorted(os.listdir(BAR_CACHE_DIR)):
+        d = os.path.join(BAR_CACHE_DIR, interval)
+        files = [f for f in os.listdir(d) if f.endswith('.csv')]
+        size = sum(os.path.getsize(os.path.join(d, f)) for f in files)
+        stats['intervals'][interval] = {'symbols': len(files), 'bytes': size}
+        stats['bytes'] += size
+    return stats
+
+
+def purge(interval=None, symbol=None):
+    """刪除快取檔；回傳刪除的股票數"""
+    removed = 0
+    intervals = [interval] if interval else (os.listdir(BAR_CACHE_DIR) if os.path.isdir(BAR_CACHE_DIR) else [])
+    for iv in intervals:
+        if symbol:
+            for p in _paths(symbol, iv):
+                if os.path.exists(p):
+                    os.remove(p)
+                    removed += p.endswith('.csv')
+        else:
+            d = os.path.join(BAR_CACHE_DIR, iv)
+            if os.path.isdir(d):
+                removed += len([f for f in os.listdir(d) if f.endswith('.csv')])
+                shutil.rmtree(d)
+    with _series_lock:
+        for key in [k for k in _series if (not interval or k[1] == interval) and (not symbol or k[0] == symbol)]:
+            del _series[key]
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K 棒快取管理')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats', help='顯示快取統計')
+    p_purge = sub.add_parser('purge', help='清除快取')
+    p_purge.add_argument('--interval')
+    p_purge.add_argument('--symbol')
+    args = parser.parse_args()
+
+    if args.cmd == 'stats':
+        s = cache_stats()
+        print(f"快取目錄: {BAR_CACHE_DIR}  容量: {s['bytes'] / 1024 / 1024:.1f} MB")
+        for iv, info in s['intervals'].items():
+            print(f"  {iv}: {info['symbols']} 支股票，{info['bytes'] / 1024:.0f} KB")
+    elif args.cmd == 'purge':
+        print(f"已刪除 {purge(args.interval, args.symbol)} 支股票的快取")
+
+
+if __name__ == '__main__':
+    main()
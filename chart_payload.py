@@ -0,0 +1,139 @@
+"""
+圖表資料序列化：OHLCV DataFrame -> TradingView Lightweight Charts 的 JSON
+
+四捨五入、時間轉換、漲跌顏色都以 numpy 整欄計算，不逐列呼叫 round() / strftime()。
+輸出兩種格式：
+  - rows：candles [{time, open, high, low, close}] + volumes [{time, value, color}]（原本的格式）
+  - columns：{t: [...], o: [...], h: [...], l: [...], c: [...], v: [...]}，每根 K 棒不重複欄位名稱，
+    由前端 expandColumns() 還原成 rows（漲跌顏色在前端依開收盤決定）
+  - binary：時間差分 + 價格乘以 10^小數位數的整數陣列，由 static/chart_codec.js 解碼
+
+binary 格式（little-endian）：
+  0   4s   magic 'TWCB'
+  4   u8   版本 (1)
+  5   u8   flags：bit0 = 日內（時間單位為秒；否則為 1970-01-01 起的日數）
+  6   u8   價格小數位數
+  7   u8   保留
+  8   u32  K 棒數 n
+  12  u32  保留
+  16  f64  第一根 K 棒的時間
+  24  f64[n]  成交量
+  ..  i32[n]  時間差分（第一個為 0）
+  ..  i32[n] × 4  開、高、低、收（× 10^小數位數）
+
+有安裝 orjson 時以 orjson 編碼（可直接序列化 numpy 陣列），否則退回標準 json。
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+UP_COLOR = '#ef5350'
+DOWN_COLOR = '#26a69a'
+PRICE_DECIMALS = 2
+
+
+def chart_columns(hist, intraday=False):
+    """
+    DataFrame -> 欄位 dict（numpy 陣列）：time / open / high / low / close / volume / up。
+    日 K 的 time 為 'YYYY-MM-DD' 字串，日內 K 為 Unix 秒；開高低收有缺值的 K 棒略過。
+    """
+    if hist is None or hist.empty:
+        return {k: np.array([]) for k in ('time', 'open', 'high', 'low', 'close', 'volume', 'up')}
+    ohlc = hist[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=float)
+    valid = ~np.isnan(ohlc).any(axis=1)
+    ohlc = ohlc[valid]
+    up = ohlc[:, 3] >= ohlc[:, 0]          # 漲跌以四捨五入前的價格判斷
+    ohlc = np.round(ohlc, PRICE_DECIMALS)
+    index = hist.index[valid]
+    if intraday:
+        epoch = pd.Timestamp(0, tz='UTC') if index.tz is not None else pd.Timestamp(0)
+        times = np.asarray((index - epoch) // pd.Timedelta(seconds=1), dtype=np.int64)
+    else:
+        times = np.asarray(index.strftime('%Y-%m-%d'), dtype=object)
+    volume = np.nan_to_num(hist['Volume'].to_numpy(dtype=float)[valid]).astype(np.int64)
+    return {'time': times, 'open': ohlc[:, 0], 'high': ohlc[:, 1], 'low': ohlc[:, 2], 'close': ohlc[:, 3],
+            'volume': volume, 'up': up}
+
+
+def to_rows(cols):
+    """欄位 dict -> (candles, volumes)，格式同原本逐列組出的 list"""
+    times = cols['time'].tolist()
+    o, h, l, c = (cols[k].tolist() for k in ('open', 'high', 'low', 'close'))
+    colors = np.where(cols['up'], UP_COLOR, DOWN_COLOR).tolist()
+    candles = [{'time': t, 'open': a, 'high': b, 'low': d, 'close': e} for t, a, b, d, e in zip(times, o, h, l, c)]
+    volumes = [{'time': t, 'value': v, 'color': col} for t, v, col in zip(times, cols['volume'].tolist(), colors)]
+    return candles, volumes
+
+
+def to_columns(cols):
+    """欄位 dict -> 精簡欄位格式 {t, o, h, l, c, v}（值仍為 numpy 陣列，交給 dumps 編碼）"""
+    return {'t': cols['time'], 'o': cols['open'], 'h': cols['high'], 'l': cols['low'], 'c': cols['close'],
+            'v': cols['volume']}
+
+
+BINARY_MAGIC = b'TWCB'
+BINARY_VERSION = 1
+BINARY_MIMETYPE = 'application/octet-stream'
+_BINARY_HEADER = struct.Struct('<4sBBBBIId')
+
+
+def to_binary(cols, intraday=False):
+    """欄位 dict -> binary bytes（格式見檔案開頭說明）"""
+    n = len(cols['time'])
+    if intraday:
+        ticks = np.asarray(cols['time'], dtype=np.int64)
+    else:
+        ticks = np.asarray(cols['time'], dtype='datetime64[D]').astype(np.int64)
+    deltas = np.diff(ticks, prepend=ticks[:1]).astype('<i4')
+    scale = 10 ** PRICE_DECIMALS
+    prices = np.rint(np.stack([cols[k] for k in ('open', 'high', 'low', 'close')]) * scale).astype('<i4')
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 1 if intraday else 0, PRICE_DECIMALS, 0, n, 0,
+                                 float(ticks[0]) if n else 0.0)
+    return b''.join([header, np.asarray(cols['volume'], dtype='<f8').tobytes(), deltas.tobytes(), prices.tobytes()])
+
+
+def from_binary(data):
+    """binary bytes -> 欄位 dict（測試與除錯用；前端解碼見 static/chart_codec.js）"""
+    magic, version, flags, decimals, _, n, _, first = _BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("不是圖表 binary 格式")
+    offset = _BINARY_HEADER.size
+    volume = np.frombuffer(data, '<f8', n, offset)
+    deltas = np.frombuffer(data, '<i4', n, offset + 8 * n)
+    prices = np.frombuffer(data, '<i4', 4 * n, offset + 12 * n).reshape(4, n) / 10 ** decimals
+    ticks = int(first) + np.cumsum(deltas, dtype=np.int64)
+    intraday = bool(flags & 1)
+    times = ticks if intraday else np.asarray(ticks.astype('datetime64[D]').astype(str), dtype=object)
+    return {'time': times, 'open': prices[0], 'high': prices[1], 'low': prices[2], 'close': prices[3],
+            'volume': volume.astype(np.int64), 'up': prices[3] >= prices[0]}
+
+
+def chart_rows(hist, intraday=False):
+    return to_rows(chart_columns(hist, intraday))
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"無法序列化 {type(obj).__name__}")
+
+
+def dumps(payload):
+    """payload -> UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
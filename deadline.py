@@ -0,0 +1,68 @@
+"""
+請求層級的時間預算（Deadline）
+
+每個長時間執行的 API 請求建立一個 Deadline，一路傳進各個抓取函式：
+  - deadline.timeout(上限)：這次外部呼叫可用的逾時秒數 = min(上限, 剩餘時間)；
+    時間已用完時拋出 DeadlineExceeded，不再發出新的請求
+  - deadline.wait(futures)：最多等到期限，未完成的工作取消（尚未開始的不會再執行）
+  - deadline.mark_partial(名稱)：記錄哪些資料因逾時 / 失敗而不完整，API 以 partial 旗標回報
+
+Deadline(None) 代表沒有期限（排程工作、命令列），所有函式的 deadline 參數預設都是這個行為。
+"""
+import threading
+import time
+from concurrent.futures import wait as _wait_futures
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self._partial = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def of(cls, deadline):
+        """None -> 沒有期限的 Deadline，方便函式以 deadline=None 為預設值"""
+        return deadline if deadline is not None else cls()
+
+    def remaining(self):
+        if self.expires is None:
+            return float('inf')
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """外部呼叫的逾時秒數；期限已過時拋出 DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"超過請求期限 {self.seconds}s")
+        return min(cap, remaining)
+
+    def wait(self, futures, cap=None):
+        """等待 futures 至多到期限（或 cap 秒）；回傳 (done, not_done)，未完成的會被取消"""
+        limit = self.remaining() if cap is None else min(cap, self.remaining())
+        done, not_done = _wait_futures(futures, timeout=None if limit == float('inf') else limit)
+        for f in not_done:
+            f.cancel()
+        return done, not_done
+
+    def mark_partial(self, part):
+        with self._lock:
+            self._partial.add(part)
+
+    @property
+    def partial(self):
+        return bool(self._partial)
+
+    @property
+    def partial_parts(self):
+        with self._lock:
+            return sorted(self._partial)
@@ -0,0 +1,62 @@
+"""
+跨程序的單一執行者鎖
+
+gunicorn 多個 worker 各自載入 app_v3，排程工作與背景執行緒也會各跑一份。
+需要「整台機器只跑一份」的工作先取得同名的檔案鎖，取不到就略過：
+  lock = FileLock('intraday_refresh')
+  if lock.acquire():
+      try: ...
+      finally: lock.release()
+鎖檔位於 .cache/locks/<名稱>.lock；程序結束時由作業系統釋放，不會留下殘鎖。
+"""
+import os
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_DIR = os.getenv('LOCK_DIR', os.path.join('.cache', 'locks'))
+
+
+class FileLock:
+    def __init__(self, name, directory=None):
+        self.path = os.path.join(directory or LOCK_DIR, f"{name}.lock")
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """不等待；取得回傳 True，已被其他程序持有回傳 False"""
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,266 @@
+"""
+個股基本面快取（股本、流通股數、前 5 大法人持股等，每季才會變動）
+
+yfinance 的 ticker.info 是 Yahoo 最慢、最容易被限流的呼叫，因此以代號為 key 存到磁碟
+.cache/fundamentals/<代號>.json：
+  - 未超過 FUNDAMENTALS_REFRESH_DAYS 天：直接使用
+  - 已過期但有舊資料：先回傳舊資料，背景重抓（同一檔同時只會有一個請求）
+  - 沒有資料：同步抓取
+最近 FUNDAMENTALS_WATCH_DAYS 天內被查詢過的代號視為「關注中」（查詢時間另存於
+<代號>.requested，不與基本面資料互相覆寫），refresh_due() 由排程定期呼叫，慢速更新其中已過期的項目。
+
+命令列：
+  python fundamentals_cache.py warm [代號 ...] [--all] [--force] [--workers 2]
+  python fundamentals_cache.py stats
+  python fundamentals_cache.py show 2330.TW
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+
+from deadline import Deadline, DeadlineExceeded
+
+FUNDAMENTALS_DIR = os.getenv('FUNDAMENTALS_DIR', os.path.join('.cache', 'fundamentals'))
+REFRESH_DAYS = float(os.getenv('FUNDAMENTALS_REFRESH_DAYS', '7'))
+WATCH_DAYS = float(os.getenv('FUNDAMENTALS_WATCH_DAYS', '30'))
+REFRESH_BATCH = int(os.getenv('FUNDAMENTALS_REFRESH_BATCH', '50'))   # 每次排程最多更新幾檔
+REFRESH_PAUSE = 1.0          # 背景更新每檔之間的間隔（秒），避免被 Yahoo 限流
+FETCH_TIMEOUT = float(os.getenv('FUNDAMENTALS_FETCH_TIMEOUT', '10'))   # 同步抓取最多等待（秒）
+HOLDERS_TOP = 5
+DAY = 86400
+
+# ticker.info 欄位 -> 快取欄位
+INFO_FIELDS = {
+    'sharesOutstanding': 'shares_outstanding',
+    'floatShares': 'float_shares',
+    'marketCap': 'market_cap',
+    'sector': 'sector',
+    'industry': 'industry',
+    'longName': 'long_name',
+}
+
+_locks = {}
+_locks_guard = threading.Lock()
+_refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fundamentals')
+# 同步抓取在這裡執行：呼叫端逾時就不再等待，抓取仍會完成並寫入快取，不佔住呼叫端的執行緒
+_fetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='fundamentals-fetch')
+_pending = set()
+
+
+def _path(symbol, ext='json'):
+    return os.path.join(FUNDAMENTALS_DIR, f"{symbol.replace('^', '_')}.{ext}")
+
+
+def _lock(symbol):
+    with _locks_guard:
+        return _locks.setdefault(symbol, threading.Lock())
+
+
+def load_entry(symbol):
+    try:
+        with open(_path(symbol), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_entry(entry):
+    os.makedirs(FUNDAMENTALS_DIR, exist_ok=True)
+    path = _path(entry['symbol'])
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def last_requested(symbol, entry=None):
+    """最近一次查詢時間；舊格式的快取檔仍可能把它存在 entry 裡"""
+    try:
+        with open(_path(symbol, 'requested'), 'r', encoding='utf-8') as f:
+            return float(f.read())
+    except (OSError, ValueError):
+        return (entry or {}).get('last_requested', 0)
+
+
+def _mark_requested(symbol):
+    os.makedirs(FUNDAMENTALS_DIR, exist_ok=True)
+    path = _path(symbol, 'requested')
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(str(time.time()))
+    os.replace(tmp, path)
+
+
+def _fetch(symbol):
+    """向 Yahoo 抓取基本面；info 失敗時拋出例外，法人持股失敗時為 None"""
+    import yfinance as yf
+    ticker = yf.Ticker(symbol)
+    info = ticker.info or {}
+    data = {key: info.get(src) for src, key in INFO_FIELDS.items()}
+    data['shares_outstanding'] = data['shares_outstanding'] or 0
+    data['float_shares'] = data['float_shares'] or 0
+    data['institutional_holders'] = None
+    try:
+        holders = ticker.institutional_holders
+        if holders is not None and not holders.empty:
+            data['institutional_holders'] = holders.head(HOLDERS_TOP).to_dict('records')
+    except Exception:
+        pass
+    return data
+
+
+def refresh(symbol):
+    """重新抓取並寫入快取（查詢時間存在另一個檔案，不受影響）"""
+    with _lock(symbol):
+        entry = {'symbol': symbol, 'fetched_at': time.time(), 'data': _fetch(symbol)}
+        _save_entry(entry)
+        return entry
+
+
+def _is_fresh(entry, max_age_days):
+    return entry is not None and time.time() - entry['fetched_at'] < max_age_days * DAY
+
+
+def _refresh_in_background(symbol):
+    with _locks_guard:
+        if symbol in _pending:
+            return
+        _pending.add(symbol)
+
+    def run():
+        try:
+            refresh(symbol)
+        except Exception as e:
+            print(f"[基本面快取] {symbol} 背景更新失敗: {e}")
+        finally:
+            with _locks_guard:
+                _pending.discard(symbol)
+
+    _refresher.submit(run)
+
+
+def _load_or_fetch(symbol):
+    with _lock(symbol):
+        entry = load_entry(symbol)       # 等鎖期間可能已由其他請求抓好
+        if entry is None:
+            entry = {'symbol': symbol, 'fetched_at': time.time(), 'data': _fetch(symbol)}
+            _save_entry(entry)
+        return entry
+
+
+def get_fundamentals(symbol, max_age_days=REFRESH_DAYS, deadline=None):
+    """
+    回傳基本面 dict（shares_outstanding / float_shares / institutional_holders / sector ...）。
+    過期時先回傳舊資料並排入背景更新（不等待更新中的鎖）；完全沒有資料時同步抓取，
+    最多等 min(FETCH_TIMEOUT, deadline 剩餘時間)，逾時拋出 DeadlineExceeded。
+    """
+    entry = load_entry(symbol)
+    if entry is None:
+        future = _fetcher.submit(_load_or_fetch, symbol)
+        try:
+            entry = future.result(timeout=Deadline.of(deadline).timeout(FETCH_TIMEOUT))
+        except FutureTimeout:
+            raise DeadlineExceeded(f"{symbol} 基本面抓取逾時")
+
+    # 記錄最近查詢時間（一天最多寫一次），作為背景更新的關注清單
+    if time.time() - last_requested(symbol, entry) > DAY:
+        _mark_requested(symbol)
+    if not _is_fresh(entry, max_age_days):
+        _refresh_in_background(symbol)
+    return entry['data']
+
+
+def _entries():
+    if not os.path.isdir(FUNDAMENTALS_DIR):
+        return
+    for name in os.listdir(FUNDAMENTALS_DIR):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(FUNDAMENTALS_DIR, name), 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+
+def refresh_due(limit=REFRESH_BATCH, pause=REFRESH_PAUSE):
+    """更新關注中且已過期的項目（最舊的先更新）；回傳更新數"""
+    now = time.time()
+    due = [e for e in _entries()
+           if now - last_requested(e['symbol'], e) < WATCH_DAYS * DAY and not _is_fresh(e, REFRESH_DAYS)]
+    due.sort(key=lambda e: e['fetched_at'])
+    done = 0
+    for e in due[:limit]:
+        try:
+            refresh(e['symbol'])
+            done += 1
+        except Exception as ex:
+            print(f"[基本面快取] {e['symbol']} 更新失敗: {ex}")
+        time.sleep(pause)
+    if due:
+        print(f"[基本面快取] 已更新 {done}/{min(len(due), limit)} 檔（待更新 {len(due)} 檔）")
+    return done
+
+
+def warm(symbols, force=False, workers=2):
+    """批次預熱；force=False 時略過仍在有效期內的項目。回傳 (成功, 失敗, 略過)"""
+    todo = [s for s in symbols if force or not _is_fresh(load_entry(s), REFRESH_DAYS)]
+    ok = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(refresh, s): s for s in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            try:
+                fut.result()
+                ok += 1
+            except Exception as e:
+                failed += 1
+                print(f"  - {futures[fut]} 失敗: {e}")
+            if i % 50 == 0:
+                print(f"  進度 {i}/{len(todo)}")
+    return ok, failed, len(symbols) - len(todo)
+
+
+def _database_symbols(path='stock_database.json'):
+    with open(path, 'r', encoding='utf-8') as f:
+        stocks = json.load(f)['stocks']
+    return [f"{s['code']}{'.TW' if s['market'] == 'LISTED' else '.TWO'}" for s in stocks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='個股基本面快取')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_warm = sub.add_parser('warm', help='批次預熱')
+    p_warm.add_argument('symbols', nargs='*')
+    p_warm.add_argument('--all', action='store_true', help='資料庫中的所有股票')
+    p_warm.add_argument('--force', action='store_true', help='忽略有效期限全部重抓')
+    p_warm.add_argument('--workers', type=int, default=2)
+    sub.add_parser('stats', help='顯示快取統計')
+    p_show = sub.add_parser('show', help='顯示單一股票的快取內容')
+    p_show.add_argument('symbol')
+    args = parser.parse_args()
+
+    if args.cmd == 'warm':
+        symbols = _database_symbols() if args.all else args.symbols
+        if not symbols:
+            parser.error('請指定代號或 --all')
+        t0 = time.time()
+        ok, failed, skipped = warm(symbols, args.force, args.workers)
+        print(f"完成：成功 {ok}、失敗 {failed}、略過 {skipped}（{time.time() - t0:.0f}s）")
+    elif args.cmd == 'stats':
+        now = time.time()
+        entries = list(_entries())
+        fresh = sum(_is_fresh(e, REFRESH_DAYS) for e in entries)
+        watched = sum(now - last_requested(e['symbol'], e) < WATCH_DAYS * DAY for e in entries)
+        print(f"快取目錄: {FUNDAMENTALS_DIR}")
+        print(f"  共 {len(entries)} 檔，有效 {fresh} 檔，關注中 {watched} 檔")
+    elif args.cmd == 'show':
+        entry = load_entry(args.symbol)
+        if entry is not None:
+            entry['last_requested'] = last_requested(args.symbol, entry)
+        print(json.dumps(entry, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+磁碟 HTTP 回應快取（TWSE / TPEX / Yahoo 等外部資料來源）
+
+收盤後的資料（T86 三大法人、TPEX 日報表、過去日期的日 K）不會再變動，
+因此以 URL + 參數為 key 存到磁碟：
+  - 已收盤的交易日：永久有效（ttl=None）
+  - 盤中資料：短 TTL（預設 60 秒）
+  - 伺服器有提供 ETag / Last-Modified 時，過期後改送條件式請求（304 直接沿用舊內容）
+  - 總容量超過上限時，依最近存取時間淘汰（LRU）
+
+命令列：
+  python http_cache.py stats
+  python http_cache.py warm --days 60
+  python http_cache.py purge [--expired | --older-than 天數 | --match 字串]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import requests as req
+
+CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join('.cache', 'http'))
+MAX_CACHE_BYTES = int(os.getenv('HTTP_CACHE_MAX_MB', '200')) * 1024 * 1024
+INTRADAY_TTL = 60       # 盤中資料的有效秒數
+
+_lock = threading.Lock()
+_total_bytes = None     # 目前快取總容量（第一次寫入時才掃描目錄）
+
+
+class CachedResponse:
+    """與 requests.Response 相容的最小介面（status_code / content / text / json()）"""
+
+    def __init__(self, status_code, content, headers=None, from_cache=False):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def cache_key(url, params=None):
+    """URL + 排序後的參數 -> sha1"""
+    full = url
+    if params:
+        full += ('&' if '?' in url else '?') + urlencode(sorted(params.items()))
+    return hashlib.sha1(full.encode('utf-8')).hexdigest()
+
+
+def ttl_for_trading_date(date_str):
+    """交易日 (YYYYMMDD) 早於今天 -> 永久快取；今天或未來 -> 盤中 TTL"""
+    return None if date_str < datetime.now().strftime('%Y%m%d') else INTRADAY_TTL
+
+
+def _paths(key):
+    sub = os.path.join(CACHE_DIR, key[:2])
+    return os.path.join(sub, f"{key}.json"), os.path.join(sub, f"{key}.body")
+
+
+def _read_entry(key):
+    meta_path, body_path = _paths(key)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            body = f.read()
+        return meta, body
+    except (OSError, ValueError):
+        return None, None
+
+
+def _is_fresh(meta, now=None):
+    if meta.get('ttl') is None:
+        return True
+    return (now or time.time()) < meta['stored_at'] + meta['ttl']
+
+
+def _touch(key):
+    """更新 body 檔的 mtime，作為 LRU 淘汰依據"""
+    try:
+        os.utime(_paths(key)[1], None)
+    except OSError:
+        pass
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _store(key, url, params, resp_headers, status, body, ttl):
+    global _total_bytes
+    meta_path, body_path = _paths(key)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    meta = {
+        'url': url,
+        'params': params or {},
+        'status': status,
+        'stored_at': time.time(),
+        'ttl': ttl,
+        'etag': resp_headers.get('ETag'),
+        'last_modified': resp_headers.get('Last-Modified'),
+        'content_type': resp_headers.get('Content-Type'),
+        'size': len(body),
+    }
+    old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+    _write_atomic(body_path, body)
+    _write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = sum(size for _, size, _ in _scan())
+        else:
+            _total_bytes += len(body) - old_size
+        if _total_bytes > MAX_CACHE_BYTES:
+            _evict_locked()
+
+
+def _refresh_meta(key, meta, ttl):
+    """304 Not Modified：沿用內容，只更新儲存時間"""
+    meta['stored_at'] = time.time()
+    meta['ttl'] = ttl
+    meta_path, _ = _paths(key)
+    try:
+        _write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+    except OSError:
+        pass
+    _touch(key)
+
+
+def _scan():
+    """列出所有快取項目 (key, body 大小, 最後存取時間)"""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    entries = []
+    for sub in os.scandir(CACHE_DIR):
+        if not sub.is_dir():
+            continue
+        for e in os.scandir(sub.path):
+            if e.name.endswith('.body'):
+                st = e.stat()
+                entries.append((e.name[:-5], st.st_size, st.st_mtime))
+    return entries
+
+
+def _remove(key):
+    for p in _paths(key):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def _evict_locked():
+    """淘汰最久未存取的項目，直到容量降到上限的 90%"""
+    global _total_bytes
+    entries = sorted(_scan(), key=lambda x: x[2])
+    total = sum(size for _, size, _ in entries)
+    target = MAX_CACHE_BYTES * 0.9
+    removed = 0
+    for key, size, _ in entries:
+        if total <= target:
+            break
+        _remove(key)
+        total -= size
+        removed += 1
+    _total_bytes = total
+    if removed:
+        print(f"[HTTP快取] 容量超過上限，已淘汰 {removed} 筆")
+
+
+def cached_get(url, params=None, headers=None, timeout=15, ttl=INTRADAY_TTL,
+               verify=True, validate=None):
+    """
+    帶快取的 GET。ttl=None 代表永久有效（已收盤資料）。
+    validate(content) 回傳 False 時不寫入快取（例如被限流回傳的 HTML 錯誤頁）。
+    網路失敗但有舊資料時，回傳舊資料（stale-if-error）。
+    """
+    key = cache_key(url, params)
+    meta, body = _read_entry(key)
+
+    if meta is not None and _is_fresh(meta):
+        _touch(key)
+        return CachedResponse(meta['status'], body, {'Content-Type': meta.get('content_type')}, from_cache=True)
+
+    send_headers = dict(headers or {})
+    if meta is not None:
+        if meta.get('etag'):
+            send_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            send_headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        resp = req.get(url, params=params, headers=send_headers, timeout=timeout, verify=verify)
+    except req.RequestException:
+        if meta is not None:
+            print(f"[HTTP快取] 連線失敗，改用舊資料: {url}")
+            return CachedResponse(meta['status'], body, {'Content-Type': meta.get('content_type')}, from_cache=True)
+        raise
+
+    if resp.status_code == 304 and meta is not None:
+        _refresh_meta(key, meta, ttl)
+        return CachedResponse(meta['status'], body, {'Content-Type': meta.get('content_type')}, from_cache=True)
+
+    no_store = 'no-store' in resp.headers.get('Cache-Control', '')
+    if resp.status_code == 200 and not no_store and (validate is None or validate(resp.content)):
+        try:
+            _store(key, url, params, resp.headers, resp.status_code, resp.content, ttl)
+        except OSError as e:
+            print(f"[HTTP快取] 寫入失敗: {e}")
+
+    return CachedResponse(resp.status_code, resp.content, dict(resp.headers))
+
+
+def is_json(content):
+    """validate 用：內容是否為合法 JSON"""
+    try:
+        json.loads(content)
+        return True
+    except ValueError:
+        return False
+
+
+# ── 命令列工具 ──────────────────────────────────
+
+def cache_stats():
+    entries = _scan()
+    now = time.time()
+    stats = {'entries': len(entries), 'bytes': sum(s for _, s, _ in entries),
+             'immutable': 0, 'fresh': 0, 'expired': 0, 'hosts': {}}
+    for key, _, _ in entries:
+        meta, _ = _read_entry(key)
+        if meta is None:
+            continue
+        if meta.get('ttl') is None:
+            stats['immutable'] += 1
+        elif _is_fresh(meta, now):
+            stats['fresh'] += 1
+        else:
+            stats['expired'] += 1
+        host = meta['url'].split('/')[2] if '://' in meta['url'] else meta['url']
+        stats['hosts'][host] = stats['hosts'].get(host, 0) + 1
+    return stats
+
+
+def purge(expired_only=False, older_than_days=None, match=None):
+    """刪除快取項目，回傳刪除筆數"""
+    global _total_bytes
+    now = time.time()
+    removed = 0
+    for key, _, _ in _scan():
+        meta, _ = _read_entry(key)
+        if meta is not None:
+            if expired_only and _is_fresh(meta, now):
+                continue
+            if older_than_days is not None and now - meta['stored_at'] < older_than_days * 86400:
+                continue
+            if match and match not in meta['url']:
+                continue
+        _remove(key)
+        removed += 1
+    with _lock:
+        _total_bytes = None
+    return removed
+
+
+def warm(days=60):
+    """預先抓取最近 days 個交易日的 T86 與 TPEX 三大法人日報表"""
+    from app_v3 import _recent_trading_dates, _fetch_t86_table, _fetch_tpex_insti_table
+
+    dates = _recent_trading_dates(days)
+    ok = 0
+    for date_str in dates:
+        for fn in (_fetch_t86_table, _fetch_tpex_insti_table):
+            try:
+                if fn(date_str):
+                    ok += 1
+            except Exception as e:
+                print(f"  - {date_str} {fn.__name__}: 失敗 ({e})")
+    print(f"[HTTP快取] 預熱完成：{ok}/{len(dates) * 2} 張日報表")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP 回應快取管理')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats', help='顯示快取統計')
+    p_warm = sub.add_parser('warm', help='預熱三大法人日報表')
+    p_warm.add_argument('--days', type=int, default=60)
+    p_purge = sub.add_parser('purge', help='清除快取')
+    p_purge.add_argument('--expired', action='store_true', help='只清除已過期項目')
+    p_purge.add_argument('--older-than', type=float, default=None, metavar='DAYS')
+    p_purge.add_argument('--match', default=None, help='只清除 URL 含此字串的項目')
+    args = parser.parse_args()
+
+    if args.cmd == 'stats':
+        s = cache_stats()
+        print(f"快取目錄: {CACHE_DIR}")
+        print(f"項目數: {s['entries']}  容量: {s['bytes'] / 1024 / 1024:.1f} MB / {MAX_CACHE_BYTES / 1024 / 1024:.0f} MB")
+        print(f"永久: {s['immutable']}  有效: {s['fresh']}  過期: {s['expired']}")
+        for host, n in sorted(s['hosts'].items(), key=lambda x: -x[1]):
+            print(f"  {host}: {n}")
+    elif args.cmd == 'warm':
+        warm(args.days)
+    elif args.cmd == 'purge':
+        n = purge(args.expired, args.older_than, args.match)
+        print(f"已刪除 {n} 筆快取")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+增量技術指標引擎（每支股票保留滾動狀態，新 K 棒 / 盤中跳動 O(1) 更新）
+
+calculate_technicals / technicals.last_row_features 每次重建快照都從整段歷史重算
+MA5 / MA20 / RSI14。這裡為每支股票保留：
+  - 最近 SIZE 筆收盤的環形緩衝（deque）與各 MA 視窗的累計和
+  - 最近 RSI_PERIOD 筆漲跌的 gain / loss 緩衝與累計和
+新的一根 K 棒 push()、同一根 K 棒的盤中新價 replace_last()，都只需常數時間。
+
+數值與 calculate_technicals 相同（簡單平均 RSI，第一筆漲跌視為 0，
+需累積 n 筆收盤才有值；loss 全為 0 時 RSI = 100，gain / loss 皆為 0 時為 NaN）。
+"""
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+MA_WINDOWS = (5, 20)
+RSI_PERIOD = 14
+
+
+class IndicatorState:
+    """單一股票的滾動指標狀態"""
+
+    def __init__(self, ma_windows=MA_WINDOWS, rsi_period=RSI_PERIOD):
+        self.ma_windows = tuple(ma_windows)
+        self.rsi_period = rsi_period
+        self.size = max(max(self.ma_windows), rsi_period + 1)
+        self.reset()
+
+    def reset(self):
+        self.closes = deque(maxlen=self.size)
+        self.sums = {n: 0.0 for n in self.ma_windows}
+        self.gains = deque(maxlen=self.rsi_period)
+        self.losses = deque(maxlen=self.rsi_period)
+        self.sum_gain = 0.0
+        self.sum_loss = 0.0
+        self.n_gain = 0         # 視窗內非零 gain / loss 筆數
+        self.n_loss = 0
+        self.count = 0          # 序列總長度（決定各指標是否已有足夠資料）
+        self.last_date = None
+        self._since_resync = 0
+
+    # ── 更新 ────────────────────────────────
+
+    def push(self, close, bar_date=None):
+        """加入一根新的 K 棒收盤價"""
+        close = float(close)
+        delta = close - self.closes[-1] if self.closes else 0.0
+        for n in self.ma_windows:
+            self.sums[n] += close
+            if len(self.closes) >= n:
+                self.sums[n] -= self.closes[-n]
+        self.closes.append(close)
+
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        if len(self.gains) == self.rsi_period:
+            self._drop_delta(self.gains[0], self.losses[0])
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self._add_delta(gain, loss)
+
+        self.count += 1
+        self.last_date = bar_date
+        self._since_resync += 1
+        if self._since_resync >= self.size:
+            self._resync()
+
+    def replace_last(self, close):
+        """最後一根 K 棒尚未收盤：以新價取代其收盤價（盤中跳動）"""
+        if not self.closes:
+            return self.push(close)
+        close = float(close)
+        old = self.closes[-1]
+        for n in self.ma_windows:
+            self.sums[n] += close - old
+        self.closes[-1] = close
+
+        delta = close - self.closes[-2] if len(self.closes) >= 2 else 0.0
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        self._drop_delta(self.gains[-1], self.losses[-1])
+        self._add_delta(gain, loss)
+        self.gains[-1] = gain
+        self.losses[-1] = loss
+
+    def update(self, close, bar_date):
+        """同一日期 -> replace_last；新的日期 -> push"""
+        if self.closes and bar_date == self.last_date:
+            self.replace_last(close)
+        else:
+            self.push(close, bar_date)
+
+    def _add_delta(self, gain, loss):
+        self.sum_gain += gain
+        self.sum_loss += loss
+        self.n_gain += gain > 0
+        self.n_loss += loss > 0
+
+    def _drop_delta(self, gain, loss):
+        self.sum_gain -= gain
+        self.sum_loss -= loss
+        self.n_gain -= gain > 0
+        self.n_loss -= loss > 0
+
+    def seed(self, closes, bar_date=None, count=None):
+        """由歷史收盤重建狀態；只需最後 SIZE 筆，count 為完整序列長度"""
+        self.reset()
+        closes = np.asarray(closes, dtype=float)
+        for c in closes[-self.size:]:
+            self.push(c)
+        self.count = len(closes) if count is None else int(count)
+        self.last_date = bar_date
+
+    def _resync(self):
+        """定期由緩衝重算累計和，避免浮點誤差累積"""
+        buf = list(self.closes)
+        for n in self.ma_windows:
+            self.sums[n] = float(sum(buf[-n:])) if len(buf) >= n else float(sum(buf))
+        self.sum_gain = float(sum(self.gains))
+        self.sum_loss = float(sum(self.losses))
+        self._since_resync = 0
+
+    # ── 讀取 ────────────────────────────────
+
+    def ma(self, n):
+        if self.count < n:
+            return np.nan
+        return self.sums[n] / n
+
+    def rsi(self):
+        if self.count < self.rsi_period:
+            return np.nan
+        # 以視窗內非零筆數判斷，避免累計和殘留的極小誤差造成 RSI 跳到 100 / NaN
+        if not self.n_loss:
+            return 100.0 if self.n_gain else np.nan
+        avg_gain = self.sum_gain / self.rsi_period if self.n_gain else 0.0
+        avg_loss = self.sum_loss / self.rsi_period
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    def values(self):
+        out = {'close': self.closes[-1] if self.closes else np.nan}
+        for n in self.ma_windows:
+            out[f"ma{n}"] = self.ma(n)
+        out['rsi'] = self.rsi()
+        return out
+
+
+class IndicatorBook:
+    """
+    全部股票的指標狀態（程序內共用）。
+    sync_panel() 以技術面板的最後一列對齊狀態：
+      - 同一日期：盤中新價，O(1) 取代
+      - 下一個交易日：O(1) push
+      - 其他情況（第一次看到、資料缺漏）：由面板尾端重建
+    """
+
+    def __init__(self, ma_windows=MA_WINDOWS, rsi_period=RSI_PERIOD):
+        self.ma_windows = tuple(ma_windows)
+        self.rsi_period = rsi_period
+        self.states = {}
+        self.lock = threading.Lock()
+        self.stats = {'tick': 0, 'push': 0, 'seed': 0}
+
+    def __len__(self):
+        return len(self.states)
+
+    def get(self, symbol):
+        return self.states.get(symbol)
+
+    def update(self, symbol, close, bar_date):
+        """單筆更新（新 K 棒或盤中跳動）；尚無狀態的股票略過，回傳是否有更新"""
+        with self.lock:
+            st = self.states.get(symbol)
+            if st is None or close is None or not close > 0:
+                return False
+            st.update(close, _to_date(bar_date))
+            return True
+
+    def sync_panel(self, panel):
+        """以 technicals.Panel 更新所有股票狀態，回傳與 last_row_features 相同鍵值的陣列"""
+        close = panel['Close']
+        T = close.shape[0]
+        n = len(panel.symbols)
+        out = {k: np.full(n, np.nan) for k in ['close'] + [f"ma{w}" for w in self.ma_windows] + ['rsi']}
+        with self.lock:
+            for j, sym in enumerate(panel.symbols):
+                length = int(panel.lengths[j])
+                if length == 0:
+                    self.states.pop(sym, None)
+                    continue
+                last_date = _to_date(panel.dates[-1, j])
+                prev_date = _to_date(panel.dates[-2, j]) if length >= 2 else None
+                st = self.states.get(sym)
+
+                if st is not None and st.closes and st.last_date == last_date:
+                    st.replace_last(close[-1, j])
+                    self.stats['tick'] += 1
+                elif st is not None and st.closes and prev_date is not None and st.last_date == prev_date \
+                        and st.closes[-1] == close[-2, j]:
+                    st.push(close[-1, j], last_date)
+                    self.stats['push'] += 1
+                else:
+                    st = IndicatorState(self.ma_windows, self.rsi_period)
+                    st.seed(close[T - min(length, st.size):, j], last_date, length)
+                    self.states[sym] = st
+                    self.stats['seed'] += 1
+                st.count = length
+
+                for k, v in st.values().items():
+                    out[k][j] = v
+        return out
+
+
+def _to_date(value):
+    """numpy datetime64 / Timestamp / 字串 -> 'YYYY-MM-DD'；NaT / None -> None"""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    if pd.isna(ts):
+        return None
+    return ts.strftime('%Y-%m-%d')
@@ -0,0 +1,158 @@
+"""
+搜尋目標預熱
+
+使用者幾乎都是搜尋剛出現在智慧推薦 / 強勢選股表格中的股票。每次快照重建後，
+把兩張表的前 PREFETCH_TOP_K 檔與最近搜尋過的股票排入佇列，由單一背景執行緒
+依序預熱 K 棒、基本面、三大法人等快取，點進個股時就不必再等外部資料來源。
+
+低優先：有前景 API 請求進行中時暫停，每項工作之間再間隔 PREFETCH_PAUSE 秒；
+同一檔同一種資料在 PREFETCH_TTL 秒內只預熱一次。
+多個 gunicorn worker 時各自預熱自己收到的目標（最近搜尋只記在各自的程序裡）；
+傳入 runner_lock（file_lock.FileLock）讓同一時間只有一個 worker 在預熱，每項工作完成即釋放，
+避免多個 worker 同時對外部資料來源發出請求。
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') == '1'
+PREFETCH_TOP_K = int(os.getenv('PREFETCH_TOP_K', '10'))
+PREFETCH_RECENT = int(os.getenv('PREFETCH_RECENT', '20'))      # 記住最近搜尋結果的檔數
+PREFETCH_PAUSE = float(os.getenv('PREFETCH_PAUSE', '0.5'))
+PREFETCH_TTL = float(os.getenv('PREFETCH_TTL', '300'))
+IDLE_POLL = 0.2
+
+# 佇列優先順序（數字小的先做）
+PRIORITY_SMART = 0
+PRIORITY_STRONG = 1
+PRIORITY_RECENT = 2
+
+
+class Prefetcher:
+    """warmers: {資料種類: fn(stock)}，stock 至少需要 code 與 market"""
+
+    def __init__(self, warmers, top_k=PREFETCH_TOP_K, recent=PREFETCH_RECENT, pause=PREFETCH_PAUSE,
+                 ttl=PREFETCH_TTL, enabled=PREFETCH_ENABLED, runner_lock=None):
+        self.warmers = warmers
+        self.runner_lock = runner_lock
+        self.top_k = top_k
+        self.pause = pause
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = {'queued': 0, 'warmed': 0, 'failed': 0, 'skipped': 0}
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._recent = deque(maxlen=recent)
+        self._warmed = {}             # (資料種類, code) -> 完成時間（超過 ttl 即清除）
+        self._foreground = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+
+    # ── 前景請求 ──
+    def begin_foreground(self):
+        with self._lock:
+            self._foreground += 1
+
+    def end_foreground(self):
+        with self._lock:
+            self._foreground -= 1
+            if self._foreground == 0:
+                self._idle.notify_all()
+
+    def _wait_idle(self):
+        with self._lock:
+            while self._foreground > 0:
+                self._idle.wait(IDLE_POLL)
+
+    # ── 排程 ──
+    def record_search(self, stocks):
+        """記住搜尋結果，下一次快照重建時一併預熱"""
+        with self._lock:
+            for s in stocks:
+                self._recent.appendleft({'code': s['code'], 'market': s['market']})
+
+    def on_snapshot(self, snap):
+        """快照重建完成：排入智慧推薦、強勢選股的前 top_k 檔與最近搜尋的股票"""
+        with self._lock:
+            recent = list(self._recent)
+        self.enqueue(snap.smart_pick_db[:self.top_k], PRIORITY_SMART)
+        self.enqueue(snap.strong_stock_db[:self.top_k], PRIORITY_STRONG)
+        self.enqueue(recent, PRIORITY_RECENT)
+
+    def enqueue(self, stocks, priority):
+        if not self.enabled:
+            return
+        seen = set()
+        for s in stocks:
+            if s['code'] in seen:
+                continue
+            seen.add(s['code'])
+            for kind in self.warmers:
+                self._queue.put((priority, next(self._seq), kind, {'code': s['code'], 'market': s['market']}))
+                with self._lock:
+                    self.stats['queued'] += 1
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+                self._thread.start()
+
+    # ── 背景執行 ──
+    def _run(self):
+        while True:
+            _, _, kind, stock = self._queue.get()
+            try:
+                self._warm(kind, stock)
+            finally:
+                self._queue.task_done()
+
+    def _prune_locked(self, now):
+        expired = [key for key, at in self._warmed.items() if now - at >= self.ttl]
+        for key in expired:
+            del self._warmed[key]
+
+    def _acquire_runner(self):
+        """等到其他 worker 的預熱工作結束（跨程序的 runner_lock 不可阻塞等待，以輪詢代替）"""
+        if self.runner_lock is None:
+            return
+        while not self.runner_lock.acquire():
+            time.sleep(IDLE_POLL)
+
+    def _release_runner(self):
+        if self.runner_lock is not None:
+            self.runner_lock.release()
+
+    def _warm(self, kind, stock):
+        key = (kind, stock['code'])
+        now = time.time()
+        with self._lock:
+            self._prune_locked(now)
+            skip = key in self._warmed
+            if skip:
+                self.stats['skipped'] += 1
+        if skip:
+            return
+        self._wait_idle()
+        self._acquire_runner()
+        try:
+            self.warmers[kind](stock)
+            with self._lock:
+                self._warmed[key] = time.time()
+                self.stats['warmed'] += 1
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            print(f"[預熱] {stock['code']} {kind} 失敗: {e}")
+        finally:
+            self._release_runner()
+        time.sleep(self.pause)
+
+    def join(self):
+        """等待佇列清空（測試與命令列用）"""
+        self._queue.join()
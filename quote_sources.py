@@ -0,0 +1,287 @@
+"""
+報價來源（可抽換）
+
+update_stock_database.py 依序嘗試多個來源，前一個來源缺少的股票才交給下一個來源：
+  - ExchangeBulkSource：TWSE / TPEX 官方全市場日報表，兩個請求就涵蓋整個上市櫃
+  - ExchangeRealtimeSource：TWSE 基本市況報導 (MIS) 盤中即時報價，一次請求查多支股票
+  - YahooBatchSource（定義在 update_stock_database.py）：yf.download 批次下載，作為備援
+
+所有來源回傳格式一致：symbol ("2330.TW" / "6415.TWO") -> {close, open, prev_close, change_pct, volume}
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from http_cache import cached_get, is_json
+
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
+    'Accept': 'application/json, text/javascript, */*',
+}
+
+
+def symbol_for(stock):
+    """股票 dict -> Yahoo 代號（上市 .TW，上櫃 .TWO）"""
+    suffix = '.TW' if stock['market'] == 'LISTED' else '.TWO'
+    return f"{stock['code']}{suffix}"
+
+
+def _parse_float(s):
+    """'1,234.50' / '+0.50' / '-1.2' -> float；'--'、'X0.00'、空字串等無法解析者回傳 None"""
+    s = str(s).replace(',', '').replace(' ', '').strip()
+    if s.startswith('X'):       # TWSE 不比價標記
+        s = s[1:]
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def expected_trading_day(now=None):
+    """應有收盤資料的交易日 (YYYYMMDD)：台北的今天，週末退回週五（國定假日不處理）"""
+    day = (now or datetime.now(ZoneInfo('Asia/Taipei'))).date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y%m%d')
+
+
+def parse_table_date(s):
+    """報表日期 '20260211' / '2026/02/11' / 民國 '115/02/11' -> 'YYYYMMDD'；無法解析回傳 None"""
+    parts = re.findall(r'\d+', str(s or ''))
+    if len(parts) == 1 and len(parts[0]) == 8:
+        return parts[0]
+    if len(parts) != 3:
+        return None
+    year, month, day = (int(p) for p in parts)
+    if year < 1911:
+        year += 1911
+    return f"{year:04d}{month:02d}{day:02d}"
+
+
+class StaleTableError(ValueError):
+    """全市場報表的日期不是預期的交易日（收盤資料尚未公布）"""
+
+
+def build_quote(close, open_p, change, volume):
+    """由收盤、開盤、漲跌價差、成交股數組出標準報價；資料不完整回傳 None"""
+    if close is None or close <= 0 or change is None:
+        return None
+    prev_close = close - change
+    if prev_close <= 0:
+        return None
+    return {
+        'close':      round(close, 2),
+        'open':       round(open_p if open_p else close, 2),
+        'prev_close': round(prev_close, 2),
+        'change_pct': round(change / prev_close * 100, 2),
+        'volume':     int(volume or 0),
+    }
+
+
+class QuoteSource:
+    """
+    報價來源基底類別：fetch(stocks) 回傳 symbol -> quote，抓不到的股票不要放進結果。
+    可選擇在 self.failures (symbol -> 原因) 記錄抓不到的理由。
+    """
+    name = 'base'
+
+    def __init__(self):
+        self.failures = {}
+
+    def fetch(self, stocks):
+        raise NotImplementedError
+
+
+class ExchangeBulkSource(QuoteSource):
+    """
+    TWSE STOCK_DAY_ALL + TPEX 上櫃收盤行情：每個市場一次請求。
+    收盤資料公布前，兩個報表回傳的都是前一個交易日的內容；報表日期與 expected_date
+    不符時整個市場視為失敗，交給下一個來源。
+    """
+    name = 'exchange'
+
+    TWSE_URL = 'https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL'
+    TPEX_URL = 'https://www.tpex.org.tw/web/stock/aftertrading/otc_quotes_no1430/stk_wn1430_result.php'
+
+    # 收盤後才會換成當天的報表，只做短暫快取
+    TTL = 300
+
+    def __init__(self, twse_url=None, tpex_url=None, timeout=15, expected_date=None):
+        super().__init__()
+        self.twse_url = twse_url or self.TWSE_URL
+        self.tpex_url = tpex_url or self.TPEX_URL
+        self.timeout = timeout
+        self.expected_date = expected_date
+
+    def _check_date(self, market, raw):
+        expected = self.expected_date or expected_trading_day()
+        date = parse_table_date(raw)
+        if date != expected:
+            raise StaleTableError(f"{market} 報表日期 {raw or '未知'}，預期 {expected}")
+
+    def _get_json(self, url, params, referer):
+        resp = cached_get(url, params=params, headers={**_HEADERS, 'Referer': referer},
+                          timeout=self.timeout, verify=False, ttl=self.TTL, validate=is_json)
+        return resp.json()
+
+    def fetch_twse(self):
+        """回傳 code -> quote（上市）"""
+        data = self._get_json(self.twse_url, {'response': 'json'}, 'https://www.twse.com.tw/')
+        if data.get('stat') != 'OK':
+            return {}
+        self._check_date('TWSE', data.get('date'))
+        fields = data.get('fields', [])
+        col = {name: i for i, name in enumerate(fields)}
+        i_code  = col.get('證券代號', 0)
+        i_vol   = col.get('成交股數', 2)
+        i_open  = col.get('開盤價', 4)
+        i_close = col.get('收盤價', 7)
+        i_chg   = col.get('漲跌價差', 8)
+
+        quotes = {}
+        for row in data.get('data', []):
+            q = build_quote(_parse_float(row[i_close]), _parse_float(row[i_open]),
+                            _parse_float(row[i_chg]), _parse_float(row[i_vol]))
+            if q:
+                quotes[str(row[i_code]).strip()] = q
+        return quotes
+
+    def fetch_tpex(self):
+        """回傳 code -> quote（上櫃）"""
+        data = self._get_json(self.tpex_url, {'l': 'zh-tw', 'o': 'json', 'se': 'EW'}, 'https://www.tpex.org.tw/')
+
+        # 新版 API 以 tables[0] 回傳並附欄位名稱；舊版為 aaData 固定欄位順序
+        if data.get('tables'):
+            table = data['tables'][0]
+            fields, rows = table.get('fields', []), table.get('data', [])
+            date = data.get('date') or table.get('date')
+        else:
+            fields, rows = [], data.get('aaData', [])
+            date = data.get('reportDate')
+        self._check_date('TPEX', date)
+        col = {name.strip(): i for i, name in enumerate(fields)}
+        i_code  = col.get('代號', 0)
+        i_close = col.get('收盤', 2)
+        i_chg   = col.get('漲跌', 3)
+        i_open  = col.get('開盤', 4)
+        i_vol   = col.get('成交股數', 8)
+
+        quotes = {}
+        for row in rows:
+            q = build_quote(_parse_float(row[i_close]), _parse_float(row[i_open]),
+                            _parse_float(row[i_chg]), _parse_float(row[i_vol]))
+            if q:
+                quotes[str(row[i_code]).strip()] = q
+        return quotes
+
+    def fetch(self, stocks):
+        tables, reasons = {}, {}
+        for market, fn in (('LISTED', self.fetch_twse), ('OTC', self.fetch_tpex)):
+            if not any(s['market'] == market for s in stocks):
+                continue
+            try:
+                tables[market] = fn()
+            except StaleTableError as e:
+                print(f"[報價來源] {e}，改用下一個來源")
+                tables[market], reasons[market] = {}, 'stale_table'
+            except Exception as e:
+                print(f"[報價來源] {market} 全市場報表抓取失敗: {e}")
+                tables[market], reasons[market] = {}, 'table_error'
+
+        results = {}
+        self.failures = {}
+        for s in stocks:
+            q = tables.get(s['market'], {}).get(s['code'])
+            if q:
+                results[symbol_for(s)] = q
+            else:
+                self.failures[symbol_for(s)] = reasons.get(s['market'], 'not_in_table')
+        return results
+
+
+class ExchangeRealtimeSource(QuoteSource):
+    """TWSE MIS 盤中即時報價（上市、上櫃皆可查），每次請求 CHUNK 支，多執行緒並行"""
+    name = 'mis'
+
+    URL = 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp'
+    CHUNK = 50
+    TTL = 15
+
+    def __init__(self, url=None, timeout=10, workers=4):
+        super().__init__()
+        self.url = url or self.URL
+        self.timeout = timeout
+        self.workers = workers
+
+    @staticmethod
+    def _last_price(row):
+        """
+        最近成交價 z；今日尚未成交（累積量 v 為 0）時以昨收 y 代替。
+        已有成交但這次快照沒有 z ('-') 時回傳 None，交給下一個來源（不以買價代替成交價）。
+        """
+        price = _parse_float(row.get('z', '-'))
+        if price is None and not _parse_float(row.get('v', '0')):
+            price = _parse_float(row.get('y', '-'))
+        return price
+
+    def _fetch_chunk(self, stocks):
+        ex_ch = '|'.join(f"{'tse' if s['market'] == 'LISTED' else 'otc'}_{s['code']}.tw" for s in stocks)
+        resp = cached_get(self.url, params={'ex_ch': ex_ch, 'json': '1', 'delay': '0'},
+                          headers={**_HEADERS, 'Referer': 'https://mis.twse.com.tw/'},
+                          timeout=self.timeout, verify=False, ttl=self.TTL, validate=is_json)
+        quotes = {}
+        for row in resp.json().get('msgArray', []):
+            price = self._last_price(row)
+            prev_close = _parse_float(row.get('y', '-'))
+            if price is None or prev_close is None:
+                continue
+            volume = (_parse_float(row.get('v', '0')) or 0) * 1000   # v 單位為張
+            q = build_quote(price, _parse_float(row.get('o', '-')), price - prev_close, volume)
+            if q:
+                quotes[str(row.get('c', '')).strip()] = q
+        return quotes
+
+    def fetch(self, stocks):
+        chunks = [stocks[i:i + self.CHUNK] for i in range(0, len(stocks), self.CHUNK)]
+
+        def _safe(chunk):
+            try:
+                return chunk, self._fetch_chunk(chunk)
+            except Exception as e:
+                print(f"[報價來源] MIS 即時報價抓取失敗: {e}")
+                return chunk, {}
+
+        results = {}
+        self.failures = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            for chunk, quotes in ex.map(_safe, chunks):
+                for s in chunk:
+                    q = quotes.get(s['code'])
+                    if q:
+                        results[symbol_for(s)] = q
+                    else:
+                        self.failures[symbol_for(s)] = 'no_quote'
+        return results
+
+
+def fetch_quotes(stocks, sources, on_source_done=None):
+    """
+    依序使用各來源抓取報價，前一來源缺少的股票交給下一個來源。
+    每個來源完成後呼叫 on_source_done(source, got)（例如寫入 checkpoint）。
+    回傳 (quotes, used)：used 為 source name -> 成功筆數。
+    """
+    quotes = {}
+    used = {}
+    remaining = list(stocks)
+    for src in sources:
+        if not remaining:
+            break
+        got = src.fetch(remaining) or {}
+        quotes.update(got)
+        if on_source_done:
+            on_source_done(src, got)
+        used[src.name] = len(got)
+        remaining = [s for s in remaining if symbol_for(s) not in quotes]
+        print(f"[報價來源] {src.name}: 取得 {len(got)} 支，剩餘 {len(remaining)} 支")
+    return quotes, used
@@ -0,0 +1,232 @@
+"""
+宣告式選股規則引擎
+
+條件與分數權重寫在 strategy_rules.json，不必改程式即可新增 / 調整策略：
+
+  "smart_pick": {
+    "params":       {"rsi_low": 55, "rsi_high": 80},
+    "base_score":   "strong_score + 2",
+    "base_reasons": ["跑贏大盤 ({alpha:+.2f}%)"],
+    "rules": [
+      {"name": "ma_bull", "when": "price > ma5 > ma20", "weight": 3, "reason": "均線多頭排列"},
+      {"name": "rsi_ok",  "when": "rsi_low <= rsi <= rsi_high", "weight": 2, "reason": "RSI 強勢範疇 ({rsi:.1f})"}
+    ],
+    "threshold": 6
+  }
+
+每個運算式以 ast 解析後編譯成 numpy 運算，對整批股票一次算出布林遮罩 / 分數，
+新增一條規則只多一次陣列運算。支援：數字、欄位 / 參數名稱、+ - * /、比較（可串接）、
+and / or / not、abs / min / max。NaN 參與的比較一律為 False。
+
+規則欄位：
+  when      條件運算式
+  weight    成立時加分（預設 0）
+  required  true 時不成立即淘汰
+  reason    成立時附加的說明，可用 {欄位:格式} 帶入該股數值
+策略欄位 threshold：總分需 >= threshold 才入選（null 代表不限；可填參數名稱以便參數掃描）。
+"""
+import ast
+import json
+import os
+import threading
+
+import numpy as np
+
+RULES_FILE = os.getenv('STRATEGY_RULES_FILE', 'strategy_rules.json')
+
+
+class RuleError(ValueError):
+    pass
+
+
+_COMPARE = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Lt: np.less, ast.LtE: np.less_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+_FUNCS = {'abs': np.abs, 'min': np.minimum, 'max': np.maximum}
+
+
+def compile_expr(text):
+    """運算式字串 -> fn(env)，env 為 名稱 -> 純量或陣列"""
+    try:
+        tree = ast.parse(str(text), mode='eval')
+    except SyntaxError as e:
+        raise RuleError(f"運算式語法錯誤: {text} ({e.msg})")
+    return _compile(tree.body, text)
+
+
+def _compile(node, src):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        return lambda env: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+
+        def _lookup(env):
+            if name not in env:
+                raise RuleError(f"未知的欄位或參數 '{name}'（運算式: {src}）")
+            return env[name]
+        return _lookup
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(v, src) for v in node.values]
+        reduce = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return lambda env: reduce.reduce([np.asarray(p(env), dtype=bool) for p in parts])
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile(node.operand, src)
+        if isinstance(node.op, ast.Not):
+            return lambda env: np.logical_not(operand(env))
+        if isinstance(node.op, ast.USub):
+            return lambda env: np.negative(operand(env))
+        if isinstance(node.op, ast.UAdd):
+            return operand
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        fn = _BINARY[type(node.op)]
+        left, right = _compile(node.left, src), _compile(node.right, src)
+        return lambda env: fn(left(env), right(env))
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        # a < b < c  ->  (a < b) & (b < c)
+        terms = [_compile(node.left, src)] + [_compile(c, src) for c in node.comparators]
+        ops = [_COMPARE[type(op)] for op in node.ops]
+
+        def _chain(env):
+            values = [t(env) for t in terms]
+            mask = ops[0](values[0], values[1])
+            for i in range(1, len(ops)):
+                mask = np.logical_and(mask, ops[i](values[i], values[i + 1]))
+            return mask
+        return _chain
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCS \
+            and not node.keywords:
+        fn = _FUNCS[node.func.id]
+        args = [_compile(a, src) for a in node.args]
+        if node.func.id == 'abs' and len(args) == 1:
+            return lambda env: fn(args[0](env))
+        if node.func.id != 'abs' and len(args) == 2:
+            return lambda env: fn(args[0](env), args[1](env))
+
+    raise RuleError(f"不支援的語法 '{ast.unparse(node)}'（運算式: {src}）")
+
+
+class Rule:
+    def __init__(self, spec):
+        if 'when' not in spec:
+            raise RuleError(f"規則缺少 when: {spec}")
+        self.name = spec.get('name', spec['when'])
+        self.when = spec['when']
+        self.weight = spec.get('weight', 0)
+        self.required = bool(spec.get('required', False))
+        self.reason = spec.get('reason')
+        self.mask_fn = compile_expr(self.when)
+
+
+class StrategyResult:
+    """evaluate() 的結果：score / passed 為長度 N 的陣列，fired 為 規則名稱 -> 遮罩"""
+
+    def __init__(self, strategy, env, score, passed, fired):
+        self.strategy = strategy
+        self.env = env
+        self.score = score
+        self.passed = passed
+        self.fired = fired
+
+    def score_of(self, i):
+        """分數轉回 Python 數字（整數權重時維持 int）"""
+        v = float(self.score[i])
+        return int(v) if v.is_integer() else round(v, 2)
+
+    def reasons(self, i):
+        row = {k: (v[i] if isinstance(v, np.ndarray) and v.ndim else v) for k, v in self.env.items()}
+        out = [_format(t, row) for t in self.strategy.base_reasons]
+        for rule in self.strategy.rules:
+            if rule.reason and self.fired[rule.name][i]:
+                out.append(_format(rule.reason, row))
+        return out
+
+
+def _format(template, row):
+    try:
+        return template.format(**row)
+    except (KeyError, ValueError, TypeError) as e:
+        raise RuleError(f"說明文字格式錯誤 '{template}': {e}")
+
+
+class Strategy:
+    def __init__(self, name, spec):
+        self.name = name
+        self.description = spec.get('description', '')
+        self.params = dict(spec.get('params', {}))
+        self.base_score = compile_expr(spec.get('base_score', 0))
+        self.base_reasons = list(spec.get('base_reasons', []))
+        self.rules = [Rule(r) for r in spec.get('rules', [])]
+        threshold = spec.get('threshold')
+        self.threshold = compile_expr(threshold) if isinstance(threshold, str) else threshold
+
+    def evaluate(self, columns, params=None):
+        """
+        columns: 欄位名稱 -> 長度 N 的陣列（數值欄位供運算式使用，其他欄位僅供說明文字帶入）
+        params:  覆寫策略預設參數（參數掃描用）
+        """
+        n = len(next(iter(columns.values()))) if columns else 0
+        env = {**self.params, **(params or {}), **{k: np.asarray(v) for k, v in columns.items()}}
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = np.broadcast_to(np.asarray(self.base_score(env), dtype=float), (n,)).copy()
+            passed = np.ones(n, dtype=bool)
+            fired = {}
+            for rule in self.rules:
+                mask = np.broadcast_to(np.asarray(rule.mask_fn(env), dtype=bool), (n,))
+                fired[rule.name] = mask
+                if rule.weight:
+                    score += np.where(mask, rule.weight, 0)
+                if rule.required:
+                    passed &= mask
+        if self.threshold is not None:
+            threshold = self.threshold(env) if callable(self.threshold) else self.threshold
+            passed &= score >= threshold
+        return StrategyResult(self, env, score, passed, fired)
+
+
+def load_strategies(path=None):
+    """讀取規則檔並編譯所有策略；格式錯誤時拋出 RuleError"""
+    path = path or RULES_FILE
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: Strategy(name, spec) for name, spec in data.get('strategies', {}).items()}
+
+
+_cache = {'path': None, 'mtime': None, 'strategies': {}, 'failed_mtime': None}
+_cache_lock = threading.Lock()
+
+
+def get_strategy(name, path=None):
+    """
+    依名稱取得策略；規則檔修改後自動重新載入（不需重啟服務）。
+    新檔案有誤時記錄錯誤並繼續使用上一份成功載入的策略，直到檔案修正為止。
+    """
+    path = path or RULES_FILE
+    with _cache_lock:
+        mtime = None
+        try:
+            mtime = os.path.getmtime(path)
+            if _cache['path'] != path or _cache['mtime'] != mtime:
+                strategies = load_strategies(path)
+                _cache['strategies'] = strategies
+                _cache['path'], _cache['mtime'], _cache['failed_mtime'] = path, mtime, None
+                print(f"[規則引擎] 已載入 {len(strategies)} 個策略: {', '.join(strategies)}")
+        except (OSError, ValueError) as e:
+            if _cache['path'] != path:
+                raise RuleError(f"無法載入規則檔 {path}: {e}") from e
+            if _cache['failed_mtime'] != (mtime or 'missing'):     # 同一版錯誤的檔案只記錄一次
+                _cache['failed_mtime'] = mtime or 'missing'
+                print(f"[規則引擎] 規則檔 {path} 載入失敗，沿用上一版策略: {e}")
+        if name not in _cache['strategies']:
+            raise RuleError(f"找不到策略 '{name}'（{path}）")
+        return _cache['strategies'][name]
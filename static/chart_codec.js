@@ -0,0 +1,31 @@
+// 圖表 binary 格式解碼（格式說明見 chart_payload.py）
+// 回傳 { candles, volumes, intraday }，可直接交給 Lightweight Charts
+const CHART_BINARY_MAGIC = 'TWCB';
+const CHART_BINARY_VERSION = 1;
+
+function decodeChartBinary(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    if (magic !== CHART_BINARY_MAGIC || view.getUint8(4) !== CHART_BINARY_VERSION) {
+        throw new Error('圖表資料格式不符');
+    }
+    const intraday = (view.getUint8(5) & 1) === 1;
+    const scale = Math.pow(10, view.getUint8(6));
+    const n = view.getUint32(8, true);
+    let tick = view.getFloat64(16, true);
+
+    const volume = new Float64Array(buffer, 24, n);
+    const deltas = new Int32Array(buffer, 24 + 8 * n, n);
+    const prices = new Int32Array(buffer, 24 + 12 * n, 4 * n);
+
+    const candles = new Array(n), volumes = new Array(n);
+    for (let i = 0; i < n; i++) {
+        tick += deltas[i];
+        // 日 K 的時間為 1970-01-01 起的日數，轉回 YYYY-MM-DD
+        const time = intraday ? tick : new Date(tick * 86400000).toISOString().slice(0, 10);
+        const open = prices[i] / scale, close = prices[3 * n + i] / scale;
+        candles[i] = { time, open, high: prices[n + i] / scale, low: prices[2 * n + i] / scale, close };
+        volumes[i] = { time, value: volume[i], color: close >= open ? '#ef5350' : '#26a69a' };
+    }
+    return { candles, volumes, intraday };
+}
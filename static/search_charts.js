@@ -9,6 +9,13 @@ function displaySearchResults(data) {
 
     let html = '<div style="display: grid; gap: 30px; margin-top: 20px;">';
 
+    // 部分資料在時間上限內未完成（K 線 / 籌碼 / 法人歷史），顯示提示
+    if (data.partial) {
+        html += `<div style="background:#fff8e1; border:1px solid #ffe082; border-radius:8px; padding:10px 15px; color:#8d6e00; font-size:0.9em;">
+            ⚠️ 部分資料載入逾時，顯示已取得的內容，可稍後重新搜尋
+        </div>`;
+    }
+
     data.results.forEach((stock, index) => {
         const changeClass = stock.change_pct >= 0 ? 'positive' : 'negative';
         const changeSymbol = stock.change_pct >= 0 ? '+' : '';
@@ -47,7 +54,6 @@ function displaySearchResults(data) {
                 </div>
                 
                 <!-- K線圖切換 -->
-                ${stock.chart_data_daily && stock.chart_data_daily.length > 0 ? `
                 <div style="margin-bottom: 25px;">
                     <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px;">
                         <div style="display: flex; gap: 10px;">
@@ -71,7 +77,7 @@ function displaySearchResults(data) {
                     <div id="wrapper-daily-${stock.code}" style="display: block;">
                         <!-- 價格圖 -->
                         <div style="font-size:0.8em; color:#888; margin-bottom:3px; padding-left:4px;">▎ 價格 / K 線</div>
-                        <div id="chart-daily-${stock.code}" style="height: 320px; background: white; border: 1px solid #e0e0e0; border-radius: 4px 4px 0 0;"></div>
+                        <div id="chart-daily-${stock.code}" style="height: 320px; background: white; border: 1px solid #e0e0e0; border-radius: 4px 4px 0 0;">${_chartPlaceholder('載入日K線中...')}</div>
                         <!-- 成交量圖 -->
                         <div style="font-size:0.8em; color:#888; margin-top:8px; margin-bottom:3px; padding-left:4px;">▎ 成交量</div>
                         <div id="chart-volume-daily-${stock.code}" style="height: 120px; background: white; border: 1px solid #e0e0e0; border-radius: 0 0 4px 4px;"></div>
@@ -81,16 +87,22 @@ function displaySearchResults(data) {
                     <div id="wrapper-5min-${stock.code}" style="display: none;">
                         <!-- 價格圖 -->
                         <div style="font-size:0.8em; color:#888; margin-bottom:3px; padding-left:4px;">▎ 價格 / K 線</div>
-                        <div id="chart-5min-${stock.code}" style="height: 320px; background: white; border: 1px solid #e0e0e0; border-radius: 4px 4px 0 0;"></div>
+                        <div id="chart-5min-${stock.code}" style="height: 320px; background: white; border: 1px solid #e0e0e0; border-radius: 4px 4px 0 0;">${_chartPlaceholder('載入5分K線中...')}</div>
                         <!-- 成交量圖 -->
                         <div style="font-size:0.8em; color:#888; margin-top:8px; margin-bottom:3px; padding-left:4px;">▎ 成交量</div>
                         <div id="chart-volume-5min-${stock.code}" style="height: 120px; background: white; border: 1px solid #e0e0e0; border-radius: 0 0 4px 4px;"></div>
                     </div>
                 </div>
-                ` : ''}
                 
+                <!-- 股本與前 5 大法人持股 -->
+                <div id="holders-${stock.code}">
+                    ${stock.shares_outstanding !== undefined ? renderHolders(stock) : _chartPlaceholder('載入股本與持股資料中...')}
+                </div>
+
                 <!-- 籌碼資訊：三大法人 -->
-                ${renderInstitutional(stock)}
+                <div id="inst-${stock.code}">
+                    ${stock.institutional_history ? renderInstitutional(stock) : _chartPlaceholder('載入三大法人資料中...')}
+                </div>
             </div>
         `;
     });
@@ -98,36 +110,183 @@ function displaySearchResults(data) {
     html += '</div>';
     searchResults.innerHTML = html;
 
-    // 初始化圖表
+    // 初始化圖表：full=1 的舊格式直接繪製內嵌資料，否則等卡片捲入畫面時才向後端載入
+    _searchObserver && _searchObserver.disconnect();
+    _searchObserver = ('IntersectionObserver' in window) ? new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            _searchObserver.unobserve(entry.target);
+            loadStockDetails(entry.target.dataset.code);
+        });
+    }, { rootMargin: '200px' }) : null;
+
     setTimeout(() => {
         data.results.forEach((stock) => {
-            console.log(`正在準備繪製 ${stock.code} 圖表...`);
-            try {
-                if (stock.chart_data_daily && stock.chart_data_daily.length > 0) {
-                    createSplitChart(
-                        `chart-daily-${stock.code}`,
-                        `chart-volume-daily-${stock.code}`,
-                        stock.chart_data_daily,
-                        stock.volume_data_daily,
-                        false
-                    );
-                }
-                if (stock.chart_data_5min && stock.chart_data_5min.length > 0) {
-                    createSplitChart(
-                        `chart-5min-${stock.code}`,
-                        `chart-volume-5min-${stock.code}`,
-                        stock.chart_data_5min,
-                        stock.volume_data_5min,
-                        true
-                    );
-                }
-            } catch (err) {
-                console.error(`繪製 ${stock.code} 圖表失敗:`, err);
+            _searchStocks[stock.code] = stock;
+            if (stock.chart_data_daily) {
+                drawEmbeddedCharts(stock);
+                return;
+            }
+            const card = document.getElementById(`inst-${stock.code}`).parentElement;
+            card.dataset.code = stock.code;
+            if (_searchObserver) {
+                _searchObserver.observe(card);
+            } else {
+                loadStockDetails(stock.code);
             }
         });
     }, 100);
 }
 
+// ── 圖表資料延遲載入 ─────────────────────────────
+const _searchStocks = {};      // code -> 搜尋結果（含已載入的圖表資料）
+const _chartRequests = {};     // `${code}:${kind}` -> Promise，避免重複請求
+let _searchObserver = null;
+
+function _chartPlaceholder(text) {
+    return `<div style="display:flex; align-items:center; justify-content:center; height:100%; min-height:60px; color:#999; font-size:0.9em;">${text}</div>`;
+}
+
+// 精簡欄位格式 {t, o, h, l, c, v} -> Lightweight Charts 的 candles / volumes
+function expandColumns(bars) {
+    const n = bars.t.length;
+    const candles = new Array(n), volumes = new Array(n);
+    for (let i = 0; i < n; i++) {
+        const time = bars.t[i], open = bars.o[i], close = bars.c[i];
+        candles[i] = { time, open, high: bars.h[i], low: bars.l[i], close };
+        volumes[i] = { time, value: bars.v[i], color: close >= open ? '#ef5350' : '#26a69a' };
+    }
+    return { candles, volumes };
+}
+
+// 依回應格式解碼：binary（chart_codec.js）、精簡欄位 JSON 或一般 JSON
+function _readChartResponse(r) {
+    const type = r.headers.get('Content-Type') || '';
+    if (r.ok && type.startsWith('application/octet-stream')) {
+        return r.arrayBuffer().then(decodeChartBinary);
+    }
+    return r.json().then(body => {
+        if (!r.ok) throw new Error(body.error || r.statusText);
+        return body.format === 'columns' ? expandColumns(body.bars) : body;
+    });
+}
+
+function _fetchStockPart(code, kind, url) {
+    const key = `${code}:${kind}`;
+    if (!_chartRequests[key]) {
+        const stock = _searchStocks[code];
+        const sep = url.includes('?') ? '&' : '?';
+        _chartRequests[key] = fetch(`${url}${sep}market=${stock.market}`)
+            .then(_readChartResponse)
+            .catch(err => {
+                delete _chartRequests[key];     // 失敗時允許重試
+                throw err;
+            });
+    }
+    return _chartRequests[key];
+}
+
+// 卡片進入畫面：載入日K、股本 / 持股與三大法人（法人圖需要日K收盤價對照）
+function loadStockDetails(code) {
+    const stock = _searchStocks[code];
+    const daily = _fetchStockPart(code, 'daily', `/api/chart/${code}/daily?format=binary`)
+        .then(body => {
+            stock.chart_data_daily = body.candles;
+            stock.volume_data_daily = body.volumes;
+            _drawOrEmpty(code, 'daily', body.candles, body.volumes, false);
+        })
+        .catch(err => _showChartError(`chart-daily-${code}`, err));
+
+    _fetchStockPart(code, 'holders', `/api/holders/${code}`)
+        .then(body => {
+            Object.assign(stock, {
+                shares_outstanding: body.shares_outstanding,
+                float_shares: body.float_shares,
+                institutional_holders: body.institutional_holders,
+            });
+            document.getElementById(`holders-${code}`).innerHTML = renderHolders(stock);
+        })
+        .catch(err => _showChartError(`holders-${code}`, err));
+
+    _fetchStockPart(code, 'institutional', `/api/institutional/${code}`)
+        .then(body => daily.then(() => {
+            stock.institutional_history = body.institutional_history;
+            document.getElementById(`inst-${code}`).innerHTML = renderInstitutional(stock);
+        }))
+        .catch(err => _showChartError(`inst-${code}`, err));
+}
+
+function loadIntradayChart(code) {
+    const stock = _searchStocks[code];
+    if (!stock || stock.chart_data_5min) return;
+    _fetchStockPart(code, 'intraday', `/api/chart/${code}/intraday?format=binary`)
+        .then(body => {
+            stock.chart_data_5min = body.candles;
+            stock.volume_data_5min = body.volumes;
+            _drawOrEmpty(code, '5min', body.candles, body.volumes, true);
+        })
+        .catch(err => _showChartError(`chart-5min-${code}`, err));
+}
+
+function _drawOrEmpty(code, type, candles, volumes, isIntraday) {
+    if (!candles || candles.length === 0) {
+        document.getElementById(`chart-${type}-${code}`).innerHTML = _chartPlaceholder('暫無資料');
+        return;
+    }
+    createSplitChart(`chart-${type}-${code}`, `chart-volume-${type}-${code}`, candles, volumes, isIntraday);
+}
+
+function _showChartError(containerId, err) {
+    console.error(`載入 ${containerId} 失敗:`, err);
+    const el = document.getElementById(containerId);
+    if (el) el.innerHTML = _chartPlaceholder(`❌ 載入失敗：${err.message}`);
+}
+
+function _escapeHtml(s) {
+    return String(s).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+}
+
+// 股本、流通股數與前 5 大法人持股（資料來自 Yahoo，數天更新一次）
+function renderHolders(stock) {
+    const fmtShares = n => n ? `${(n / 1e8).toFixed(2)} 億股` : '–';
+    let html = `<div style="margin-top:20px; background:#f5f5f5; border-radius:8px; padding:15px 20px;">
+        <div style="display:flex; gap:40px; margin-bottom:10px;">
+            <div><span style="color:#666; font-size:0.9em;">股本</span>
+                 <span style="margin-left:8px; font-weight:bold; color:#333;">${fmtShares(stock.shares_outstanding)}</span></div>
+            <div><span style="color:#666; font-size:0.9em;">流通股數</span>
+                 <span style="margin-left:8px; font-weight:bold; color:#333;">${fmtShares(stock.float_shares)}</span></div>
+        </div>`;
+
+    const holders = stock.institutional_holders;
+    if (!holders || holders.length === 0) {
+        html += `<div style="color:#999; font-size:0.9em;">🏢 暫無法人持股資料</div></div>`;
+        return html;
+    }
+    html += `<table style="width:100%; border-collapse:collapse; font-size:0.9em;">
+        <tr style="color:#666; text-align:left;"><th>🏢 前 5 大法人持股</th><th style="text-align:right;">持股</th><th style="text-align:right;">比例</th></tr>`;
+    holders.forEach(h => {
+        const pct = h.pctHeld !== undefined && h.pctHeld !== null ? `${(h.pctHeld * 100).toFixed(2)}%` : '–';
+        const shares = h.Shares ? Number(h.Shares).toLocaleString() : '–';
+        html += `<tr style="border-top:1px solid #e0e0e0;">
+            <td style="padding:4px 0;">${_escapeHtml(h.Holder || '–')}</td>
+            <td style="text-align:right;">${shares}</td>
+            <td style="text-align:right;">${pct}</td>
+        </tr>`;
+    });
+    return html + '</table></div>';
+}
+
+// full=1 舊格式：資料已內嵌在搜尋結果
+function drawEmbeddedCharts(stock) {
+    console.log(`正在準備繪製 ${stock.code} 圖表...`);
+    try {
+        _drawOrEmpty(stock.code, 'daily', stock.chart_data_daily, stock.volume_data_daily, false);
+        _drawOrEmpty(stock.code, '5min', stock.chart_data_5min, stock.volume_data_5min, true);
+    } catch (err) {
+        console.error(`繪製 ${stock.code} 圖表失敗:`, err);
+    }
+}
+
 /**
  * 建立「上方K線圖 + 下方成交量圖」，並同步兩張圖的時間軸
  */
@@ -262,6 +421,8 @@ function switchChartType(code, type) {
         btn5min && (btn5min.style.background = '#1976d2', btn5min.style.color = 'white');
         document.getElementById(`wrapper-daily-${code}`).style.display = 'none';
         document.getElementById(`wrapper-5min-${code}`).style.display = 'block';
+        // 5分K 第一次切換時才載入（容器顯示後寬度才正確）
+        loadIntradayChart(code);
     }
 }
 
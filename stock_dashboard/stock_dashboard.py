@@ -14,6 +14,17 @@ from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import json
 import os
+import sys
+
+# 共用上層目錄的 K 棒快取（已收盤 K 棒存在磁碟、只增量下載）；找不到時直接向 yfinance 下載
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT_DIR)
+# 快取目錄固定在上層目錄的 .cache（與 app_v3 共用），不隨 streamlit 的啟動目錄改變
+os.environ.setdefault('BAR_CACHE_DIR', os.path.join(_ROOT_DIR, '.cache', 'bars'))
+try:
+    from bar_cache import get_bars
+except ImportError:
+    get_bars = None
 
 # --- 頁面設定 ---
 st.set_page_config(
@@ -122,6 +133,8 @@ def get_market_status():
 def get_stock_data(ticker, period="1y", interval="1d"):
     """獲取股票歷史數據"""
     try:
+        if get_bars is not None:
+            return get_bars(ticker, interval, period=period)
         data = yf.download(ticker, period=period, interval=interval, progress=False)
         if isinstance(data.columns, pd.MultiIndex):
             data.columns = data.columns.get_level_values(0)
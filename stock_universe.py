@@ -0,0 +1,146 @@
+"""
+台股股票清單（universe）快取
+
+twstock.codes 含所有證券類別（權證、ETF、債券...），每次都走訪一遍很慢。
+這裡把篩選後的普通股清單 (code, name, market) 存成版本化檔案 .cache/stock_universe.json，
+只有 twstock 代碼表 CSV 變動時才重建，並記錄上市 / 下市 / 轉市場的差異。
+
+命令列：
+  python stock_universe.py            # 需要時重建並顯示差異
+  python stock_universe.py --force    # 強制重建
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+from datetime import datetime
+
+UNIVERSE_FILE = os.path.join('.cache', 'stock_universe.json')
+LEGACY_UNIVERSE_FILE = 'stock_universe.json'     # 舊版放在專案根目錄
+MAX_DIFF_HISTORY = 20       # 保留最近幾次的差異紀錄
+
+
+def _twstock_code_files():
+    """不 import twstock，直接找到它的代碼表 CSV 路徑"""
+    spec = importlib.util.find_spec('twstock')
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    codes_dir = os.path.join(list(spec.submodule_search_locations)[0], 'codes')
+    return [os.path.join(codes_dir, name) for name in ('twse_equities.csv', 'tpex_equities.csv')]
+
+
+def twstock_fingerprint():
+    """twstock 代碼表內容的 sha1；代碼表更新 (twstock.__update_codes) 後就會改變"""
+    h = hashlib.sha1()
+    for path in _twstock_code_files():
+        try:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        except OSError:
+            continue
+    return h.hexdigest()
+
+
+def build_universe():
+    """走訪 twstock.codes，取出 4 碼普通股"""
+    import twstock
+
+    stocks = []
+    for code, info in twstock.codes.items():
+        if info.type == '股票' and code.isdigit() and len(code) == 4:
+            market = 'LISTED' if info.market == '上市' else 'OTC'
+            stocks.append({'code': code, 'name': info.name, 'market': market})
+    stocks.sort(key=lambda s: s['code'])
+    return stocks
+
+
+def diff_universe(old_stocks, new_stocks):
+    """比較兩版清單：新上市、下市、轉市場（上櫃轉上市等）、更名"""
+    old = {s['code']: s for s in old_stocks}
+    new = {s['code']: s for s in new_stocks}
+    return {
+        'listed':      [new[c] for c in sorted(new.keys() - old.keys())],
+        'delisted':    [old[c] for c in sorted(old.keys() - new.keys())],
+        'transferred': [{'code': c, 'name': new[c]['name'], 'from': old[c]['market'], 'to': new[c]['market']}
+                        for c in sorted(new.keys() & old.keys()) if old[c]['market'] != new[c]['market']],
+        'renamed':     [{'code': c, 'from': old[c]['name'], 'to': new[c]['name']}
+                        for c in sorted(new.keys() & old.keys()) if old[c]['name'] != new[c]['name']],
+    }
+
+
+def load_universe_artifact(path=UNIVERSE_FILE):
+    if not os.path.exists(path) and path == UNIVERSE_FILE:
+        path = LEGACY_UNIVERSE_FILE          # 新位置還沒有時沿用舊檔，下次重建即寫到新位置
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"載入股票清單快取失敗: {e}")
+        return None
+
+
+def _save_artifact(artifact, path=UNIVERSE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def print_diff(diff):
+    for s in diff['listed']:
+        print(f"  ＋ 新上市櫃: {s['code']} {s['name']} ({s['market']})")
+    for s in diff['delisted']:
+        print(f"  － 下市櫃:   {s['code']} {s['name']} ({s['market']})")
+    for t in diff['transferred']:
+        print(f"  ⇄ 轉市場:   {t['code']} {t['name']} {t['from']} → {t['to']}")
+    for r in diff['renamed']:
+        print(f"  ✎ 更名:     {r['code']} {r['from']} → {r['to']}")
+
+
+def get_universe(force=False, path=UNIVERSE_FILE):
+    """
+    取得股票清單。代碼表未變動時直接讀快取檔；否則重建、比對差異並寫入新版本。
+    回傳 (stocks, diff)；沒有重建時 diff 為 None。
+    """
+    fingerprint = twstock_fingerprint()
+    artifact = load_universe_artifact(path)
+    if not force and artifact and artifact.get('fingerprint') == fingerprint:
+        return artifact['stocks'], None
+
+    stocks = build_universe()
+    old_stocks = artifact['stocks'] if artifact else []
+    diff = diff_universe(old_stocks, stocks)
+    history = (artifact or {}).get('history', [])
+    if artifact:
+        history = ([{'version': artifact['version'] + 1, 'generated_at': datetime.now().isoformat(timespec='seconds'),
+                     **diff}] + history)[:MAX_DIFF_HISTORY]
+
+    _save_artifact({
+        'version':      (artifact['version'] + 1) if artifact else 1,
+        'fingerprint':  fingerprint,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'total':        len(stocks),
+        'stocks':       stocks,
+        'history':      history,
+    }, path)
+    return stocks, diff if artifact else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='台股股票清單快取')
+    parser.add_argument('--force', action='store_true', help='忽略快取，強制重建')
+    args = parser.parse_args()
+
+    stocks, diff = get_universe(force=args.force)
+    artifact = load_universe_artifact()
+    print(f"股票清單版本 {artifact['version']}（{artifact['generated_at']}）：共 {len(stocks)} 支")
+    if diff:
+        print_diff(diff)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+參數掃描：以歷史資料評估多組篩選條件 / 規則參數的表現
+
+特徵（漲跌幅、MA、RSI、實體高點連續天數、未來報酬...）只在主程序計算一次，
+放進 multiprocessing.shared_memory；各 worker 直接以 numpy 陣列掛上共享記憶體，
+不複製價格面板。每組參數 = 一次 backtest.replay + summarize。
+
+參數名稱：
+  min_price / max_price / min_market_cap / min_volume   篩選條件（市值單位：元，成交量單位：張）
+  candidate_limit                                        強勢候選檔數
+  <策略>.<參數>                                          strategy_rules.json 的策略參數，例如
+                                                         smart_pick.rsi_low、smart_pick.min_score
+
+命令列：
+  python sweep.py --grid min_price=10,20,50 min_volume=500,1000 smart_pick.rsi_low=50,55,60 \\
+                  smart_pick.min_score=5,6,7 --start 2023-01-01
+  python sweep.py --grid-file grid.json          # {"min_price": [10, 20], ...}
+  python sweep.py --show                         # 只顯示已完成的結果
+
+結果逐筆附加到 JSONL 檔（預設 .cache/sweep/results.jsonl），中斷後重跑會跳過已完成的參數組合。
+檔案第一行記錄這次掃描的 start / end 與歷史資料指紋；條件不同時拒絕續跑，請改用新的 --results。
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backtest
+
+RESULTS_FILE = os.path.join('.cache', 'sweep', 'results.jsonl')
+SWEEP_WORKERS = int(os.getenv('SWEEP_WORKERS', '0')) or os.cpu_count() or 1
+FILTER_KEYS = ('min_price', 'max_price', 'min_market_cap', 'min_volume')
+DEFAULT_SORT = 'smart.5d.excess'
+
+
+# ── 共享記憶體 ──────────────────────────────────
+
+def share_arrays(arrays):
+    """把 numpy 陣列複製進共享記憶體；回傳 (blocks, specs)，specs 可傳給子程序"""
+    blocks, specs = [], {}
+    for key, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        specs[key] = (shm.name, a.shape, a.dtype.str)
+    return blocks, specs
+
+
+def attach_arrays(specs):
+    """依 specs 掛上共享記憶體，回傳 (blocks, arrays)；陣列不會被複製"""
+    blocks, arrays = [], {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return blocks, arrays
+
+
+_worker = {}
+
+
+def _init_worker(specs, scalars):
+    blocks, arrays = attach_arrays(specs)
+    _worker['blocks'] = blocks           # 保留參照，避免共享記憶體被提前關閉
+    _worker['feats'] = {**arrays, **scalars}
+
+
+# ── 參數組合 ──────────────────────────────────
+
+def expand_grid(grid):
+    """{'a': [1, 2], 'b': [3]} -> [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]"""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def combo_key(combo):
+    return json.dumps(combo, sort_keys=True)
+
+
+def split_params(combo):
+    """參數組合 -> (filters, candidate_limit, strategy_params)"""
+    filters, strategy_params = {}, {}
+    candidate_limit = backtest.CANDIDATE_LIMIT
+    for key, value in combo.items():
+        if key in FILTER_KEYS:
+            filters[key] = value
+        elif key == 'candidate_limit':
+            candidate_limit = int(value)
+        elif '.' in key:
+            strategy, param = key.split('.', 1)
+            strategy_params.setdefault(strategy, {})[param] = value
+        else:
+            raise ValueError(f"未知的參數 '{key}'")
+    return filters, candidate_limit, strategy_params
+
+
+def _parse_value(s):
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+def parse_grid_args(items):
+    """['min_price=10,20', 'smart_pick.rsi_low=50,55'] -> grid dict"""
+    grid = {}
+    for item in items:
+        key, _, values = item.partition('=')
+        if not values:
+            raise ValueError(f"格式應為 名稱=值1,值2: {item}")
+        grid[key.strip()] = [_parse_value(v) for v in values.split(',')]
+    return grid
+
+
+# ── 執行 ──────────────────────────────────
+
+def _flatten(report):
+    """summarize 報告 -> 單層指標 dict（smart.5d.excess 這類鍵）"""
+    flat = {'days': report['days']}
+    for layer, stats in report['layers'].items():
+        for k, v in stats.items():
+            if isinstance(v, dict):
+                for m, x in v.items():
+                    flat[f"{layer}.{k}.{m}"] = x
+            else:
+                flat[f"{layer}.{k}"] = v
+    return flat
+
+
+def evaluate_combo(combo, start=None, end=None, feats=None):
+    """在 worker（或主程序，傳入 feats 時）評估一組參數"""
+    feats = feats if feats is not None else _worker['feats']
+    filters, candidate_limit, strategy_params = split_params(combo)
+    t0 = time.time()
+    masks = backtest.replay(feats, filters, candidate_limit, strategy_params)
+    report = backtest.summarize(feats, masks, feats['dates'], start, end, feats['horizons'])
+    return {'key': combo_key(combo), 'params': combo, 'metrics': _flatten(report),
+            'seconds': round(time.time() - t0, 3)}
+
+
+def history_fingerprint(path):
+    """歷史資料檔內容的 sha1（重建 daily.npz 後指紋就會改變）"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sweep_context(start, end, history_path):
+    """決定結果是否可沿用的條件：回測區間與歷史資料"""
+    return {'start': start, 'end': end, 'history': history_fingerprint(history_path)}
+
+
+def load_context(path=RESULTS_FILE):
+    """結果檔第一行記錄的掃描條件；沒有檔案時為 None，舊格式（沒有記錄）為 {}"""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            return json.loads(f.readline()).get('context', {})
+        except ValueError:
+            return {}
+
+
+def load_results(path=RESULTS_FILE):
+    """讀取已完成的結果；最後一行寫到一半（程序中斷）時略過"""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if 'key' in row:
+                results[row['key']] = row
+    return results
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def run_sweep(grid, start=None, end=None, history_path=backtest.HISTORY_FILE,
+              results_path=RESULTS_FILE, workers=SWEEP_WORKERS):
+    combos = expand_grid(grid)
+    context = sweep_context(start, end, history_path)
+    previous = load_context(results_path)
+    if previous is not None and previous != context:
+        raise ValueError(f"{results_path} 是以不同的回測區間或歷史資料產生的"
+                         f"（{previous or '舊格式，沒有記錄'}），請改用新的 --results 或刪除舊檔")
+    done = load_results(results_path)
+    todo = [c for c in combos if combo_key(c) not in done]
+    print(f"[參數掃描] 共 {len(combos)} 組，已完成 {len(combos) - len(todo)} 組，待執行 {len(todo)} 組")
+    if not todo:
+        return [done[combo_key(c)] for c in combos]
+
+    hist = backtest.History.load(history_path)
+    t0 = time.time()
+    feats = backtest.compute_features(hist)
+    arrays = {k: v for k, v in feats.items() if isinstance(v, np.ndarray)}
+    arrays['dates'] = hist.dates
+    scalars = {k: v for k, v in feats.items() if not isinstance(v, np.ndarray)}
+    scalars['horizons'] = backtest.HORIZONS
+    print(f"[參數掃描] 特徵計算完成（{time.time() - t0:.1f}s），"
+          f"共享 {sum(a.nbytes for a in arrays.values()) / 1024 / 1024:.0f} MB 給 {workers} 個 worker")
+
+    os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+    blocks, specs = share_arrays(arrays)
+    del feats, arrays
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(specs, scalars)) as ex, \
+                open(results_path, 'a', encoding='utf-8') as out:
+            if not out.tell():
+                out.write(json.dumps({'context': context}) + '\n')
+            elif not _ends_with_newline(results_path):
+                out.write('\n')            # 上次中斷時最後一行沒寫完
+            futures = {ex.submit(evaluate_combo, c, start, end): c for c in todo}
+            for i, fut in enumerate(as_completed(futures), 1):
+                try:
+                    row = fut.result()
+                except Exception as e:
+                    print(f"  - {combo_key(futures[fut])} 失敗: {e}")
+                    continue
+                out.write(json.dumps(row, ensure_ascii=False) + '\n')
+                out.flush()
+                done[row['key']] = row
+                if i % 10 == 0 or i == len(todo):
+                    print(f"  進度 {i}/{len(todo)}（{time.time() - t0:.1f}s）")
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return [done[combo_key(c)] for c in combos if combo_key(c) in done]
+
+
+def print_summary(rows, sort_key=DEFAULT_SORT, top=20):
+    """依指標排序列出前 top 組參數"""
+    rows = [r for r in rows if not np.isnan(r['metrics'].get(sort_key, np.nan))]
+    rows.sort(key=lambda r: r['metrics'][sort_key], reverse=True)
+    if not rows:
+        print("沒有可顯示的結果")
+        return
+    param_keys = sorted({k for r in rows for k in r['params']})
+    cols = ['smart.avg_per_day', 'smart.turnover', 'smart.5d.mean', 'smart.5d.hit_rate', 'smart.5d.excess',
+            'strong.5d.excess']
+    if sort_key not in cols:
+        cols.append(sort_key)
+    print(f"\n依 {sort_key} 排序（前 {min(top, len(rows))} / {len(rows)} 組）")
+    print('  '.join(f"{k:>18}" for k in param_keys + cols))
+    for r in rows[:top]:
+        params = [f"{r['params'].get(k, ''):>18}" for k in param_keys]
+        metrics = [f"{r['metrics'].get(c, float('nan')):>18.4f}" for c in cols]
+        print('  '.join(params + metrics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='選股參數掃描')
+    parser.add_argument('--grid', nargs='*', default=[], help='名稱=值1,值2 ...')
+    parser.add_argument('--grid-file', help='JSON 檔：{"名稱": [值...]}')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--results', default=RESULTS_FILE)
+    parser.add_argument('--history', default=backtest.HISTORY_FILE)
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS)
+    parser.add_argument('--sort', default=DEFAULT_SORT)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--show', action='store_true', help='只顯示已完成的結果')
+    args = parser.parse_args()
+
+    if args.show:
+        print_summary(list(load_results(args.results).values()), args.sort, args.top)
+        return
+
+    grid = {}
+    if args.grid_file:
+        with open(args.grid_file, 'r', encoding='utf-8') as f:
+            grid.update(json.load(f))
+    grid.update(parse_grid_args(args.grid))
+    if not grid:
+        parser.error('請以 --grid 或 --grid-file 指定參數')
+
+    try:
+        rows = run_sweep(grid, args.start, args.end, args.history, args.results, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    print_summary(rows, args.sort, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+面板技術指標引擎（日期 × 股票 二維陣列）
+
+把 yf.download(group_by='ticker') 的結果轉成 (T × N) 的 numpy 陣列，
+一次算完所有股票的 MA / RSI / 實體高點，取代逐檔切片 + pandas rolling。
+
+每支股票的有效資料列（所有欄位皆非 NaN，等同逐檔 dropna()）會「靠下對齊」，
+因此最後一列就是每支股票自己的最新一筆，各種 rolling 視窗也與逐檔計算一致。
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+def panel_field(df, field, symbols):
+    """從 yf.download 結果取出單一欄位的 (日期 × 股票) DataFrame，欄位順序對齊 symbols"""
+    if isinstance(df.columns, pd.MultiIndex):
+        level = 1 if field in df.columns.get_level_values(1) else 0
+        if field not in df.columns.get_level_values(level):
+            return None
+        panel = df.xs(field, axis=1, level=level)
+    else:
+        if field not in df.columns:
+            return None
+        panel = df[[field]]
+        panel.columns = symbols[:1]
+    return panel.reindex(columns=symbols)
+
+
+class Panel:
+    """
+    靠下對齊的價格面板：
+      data[field]  (T × N) 陣列，每欄上方以 NaN 補齊
+      lengths      每支股票的有效列數
+      dates        (T × N) 每格對應的日期（補齊處為 NaT）
+    """
+
+    def __init__(self, symbols, data, lengths, dates):
+        self.symbols = list(symbols)
+        self.data = data
+        self.lengths = lengths
+        self.dates = dates
+
+    def __getitem__(self, field):
+        return self.data[field]
+
+    def frame(self, j):
+        """第 j 支股票的 DataFrame（只含有效列），供逐檔函式使用"""
+        n = int(self.lengths[j])
+        rows = slice(self.dates.shape[0] - n, None)
+        return pd.DataFrame({f: a[rows, j] for f, a in self.data.items()},
+                            index=pd.DatetimeIndex(self.dates[rows, j]))
+
+
+def build_panel(df, symbols, fields=FIELDS):
+    """yf.download 結果 -> Panel；缺少的股票長度為 0"""
+    arrays = {}
+    for f in fields:
+        p = panel_field(df, f, symbols)
+        if p is not None:
+            arrays[f] = p.to_numpy(dtype=float)
+    n = len(symbols)
+    if not arrays:
+        empty = np.empty((0, n))
+        return Panel(symbols, {f: empty for f in fields}, np.zeros(n, dtype=int),
+                     np.empty((0, n), dtype='datetime64[ns]'))
+
+    valid = np.logical_and.reduce([~np.isnan(a) for a in arrays.values()])
+    order = np.argsort(valid, axis=0, kind='stable')      # 無效列排到上方，有效列保持時間順序
+    aligned = {f: np.take_along_axis(np.where(valid, a, np.nan), order, axis=0) for f, a in arrays.items()}
+    lengths = valid.sum(axis=0)
+
+    index = np.asarray(df.index.tz_localize(None) if getattr(df.index, 'tz', None) else df.index,
+                       dtype='datetime64[ns]')
+    dates = np.take_along_axis(np.broadcast_to(index[:, None], valid.shape), order, axis=0).copy()
+    dates[np.arange(valid.shape[0])[:, None] < valid.shape[0] - lengths] = np.datetime64('NaT')
+    return Panel(symbols, aligned, lengths, dates)
+
+
+def rolling_mean(a, n):
+    """沿日期軸的 n 期簡單平均；視窗不足或含 NaN 時為 NaN（同 pandas rolling(n).mean()）"""
+    out = np.full(a.shape, np.nan)
+    if a.shape[0] >= n:
+        out[n - 1:] = sliding_window_view(a, n, axis=0).mean(axis=-1)
+    return out
+
+
+def rsi(close, n=14):
+    """
+    與 calculate_technicals 相同的簡單平均 RSI：
+    第一筆漲跌視為 0，需累積 n 筆有效收盤才有值。
+    """
+    delta = np.diff(close, axis=0, prepend=np.nan)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    avg_gain = rolling_mean(gain, n)
+    avg_loss = rolling_mean(loss, n)
+    enough = rolling_mean((~np.isnan(close)).astype(float), n) == 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        out = 100 - (100 / (1 + rs))
+    return np.where(enough, out, np.nan)
+
+
+def body_high(open_, close):
+    """實體 K 棒高點：紅 K 取收盤、綠 K 取開盤，即 max(Open, Close)"""
+    return np.maximum(open_, close)
+
+
+def last_row_features(panel, tail=21):
+    """
+    每支股票最新一列的指標向量：close, open, ma5, ma20, rsi, body_high, length。
+    只取最後 tail 列計算（MA20 / RSI14 所需的最長視窗）。
+    """
+    close = panel['Close'][-tail:]
+    open_ = panel['Open'][-tail:]
+    if not len(close):
+        nan = np.full(len(panel.symbols), np.nan)
+        return {'close': nan, 'open': nan, 'ma5': nan, 'ma20': nan, 'rsi': nan,
+                'body_high': nan, 'length': panel.lengths}
+    return {
+        'close':     close[-1],
+        'open':      open_[-1],
+        'ma5':       rolling_mean(close, 5)[-1],
+        'ma20':      rolling_mean(close, 20)[-1],
+        'rsi':       rsi(close, 14)[-1],
+        'body_high': body_high(open_, close)[-1],
+        'length':    panel.lengths,
+    }
+
+
+def high_days_batch(open_, close, lengths):
+    """
+    calc_high_days 的批次版：一次計算多支股票「參考價連續高於前幾日實體高點」的天數。
+
+    open_ / close 為靠下對齊的 (T × N) 陣列，lengths 為每欄的資料列數（上方補齊列不算）。
+    參考價為最後一筆收盤；若為 NaN 或 <= 0 則改用前一筆（資料需 >= 3 筆）。
+    回傳 (counts, ref_rows, usable)：
+      counts    連續天數
+      ref_rows  參考價所在的列
+      usable    False 代表資料不足（對應 calc_high_days 回傳 (False, '', 0)）
+    """
+    T, N = close.shape
+    lengths = np.asarray(lengths)
+    if T < 2:
+        return np.zeros(N, dtype=int), np.full(N, T - 1), np.zeros(N, dtype=bool)
+
+    ref_last = close[-1]
+    fallback = np.isnan(ref_last) | (ref_last <= 0)
+    usable = (lengths >= 2) & ~(fallback & (lengths < 3))
+    ref_rows = np.where(fallback, T - 2, T - 1)
+    ref = np.where(fallback, close[-2], ref_last)
+
+    # 參考列之前的資料，依時間由近到遠排列；使用前一筆為參考價時整體下移一列
+    pad = np.full((1, N), np.nan)
+    prior_open = np.where(fallback, np.vstack([pad, open_[:-2]]), open_[:-1])[::-1]
+    prior_close = np.where(fallback, np.vstack([pad, close[:-2]]), close[:-1])[::-1]
+
+    with np.errstate(invalid='ignore'):
+        valid = (prior_open > 0) & (prior_close > 0)          # NaN 比較結果為 False
+        above = ref >= (np.maximum(prior_open, prior_close) - 0.001)
+    counts = np.cumprod(valid & above, axis=0).sum(axis=0)
+    return np.where(usable, counts, 0), ref_rows, usable
+
+
+def calc_high_days_batch(panel):
+    """對 Panel 的每支股票回傳與 calc_high_days 相同的 (is_strong, label, count) tuple list"""
+    counts, ref_rows, usable = high_days_batch(panel['Open'], panel['Close'], panel.lengths)
+    results = []
+    for j in range(len(panel.symbols)):
+        if not usable[j]:
+            results.append((False, '', 0))
+            continue
+        count = int(counts[j])
+        ref_date = pd.Timestamp(panel.dates[ref_rows[j], j]).strftime('%Y-%m-%d')
+        status_icon = "🔥" if count >= 3 else "📈"
+        label = f"{status_icon} 連續高過前 {count} 日實體高點 (基準:{ref_date})"
+        results.append((count >= 1, label, count))
+    return results
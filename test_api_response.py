@@ -0,0 +1,78 @@
+"""
+API 回應層測試：壓縮、ETag / 304、Cache-Control
+
+執行: python -m pytest -q test_api_response.py
+"""
+import gzip
+import json
+
+import pytest
+
+import app_v3
+
+
+def make_snapshot(version, n=300):
+    snap = app_v3.PipelineSnapshot({}, {'change_pct': 0.5}, {'change_pct': 0.3})
+    snap.version = version
+    snap.base_pool = [{'code': f"{1000 + i}", 'name': f"股票{i}", 'price': 50.0 + i, 'change_pct': i % 7 - 3.0,
+                       'volume': 1000 + i, 'market_cap': 1e9 * i, 'market': 'LISTED' if i % 2 else 'OTC'}
+                      for i in range(n)]
+    snap.outperformer_db = [{**s, 'alpha': s['change_pct'] - 0.4} for s in snap.base_pool if s['change_pct'] > 0]
+    snap.outperformer_db.sort(key=lambda s: s['alpha'], reverse=True)
+    return snap
+
+
+@pytest.fixture
+def client(monkeypatch):
+    snap = {'current': make_snapshot('v1')}
+    monkeypatch.setattr(app_v3, 'get_or_update_snapshot', lambda filters, deadline=None: snap['current'])
+    app_v3.app.config['TESTING'] = True
+    client = app_v3.app.test_client()
+    client.snap = snap
+    return client
+
+
+def test_screen_etag_and_304(client):
+    body = {'min_price': 10, 'max_price': 1000, 'min_volume': 1000}
+    first = client.post('/api/screen', json=body)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/') and first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.post('/api/screen', json=body, headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+
+    # 篩選條件不同 -> 不同 ETag
+    other = client.post('/api/screen', json={**body, 'min_price': 20}, headers={'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+    # 快照重建 -> 舊 ETag 失效
+    client.snap['current'] = make_snapshot('v2')
+    assert client.post('/api/screen', json=body, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_gzip_when_accepted(client):
+    body = {'min_price': 10}
+    plain = client.post('/api/screen', json=body)
+    zipped = client.post('/api/screen', json=body, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert 'Content-Encoding' not in plain.headers
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert len(zipped.data) < len(plain.data) / 3
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+    assert zipped.headers['ETag'] == plain.headers['ETag']
+
+
+def test_small_and_error_responses_untouched(client):
+    resp = client.get('/api/search', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 400
+    assert 'Content-Encoding' not in resp.headers and 'ETag' not in resp.headers
+
+
+def test_content_hash_etag_for_other_apis(client, monkeypatch):
+    monkeypatch.setattr(app_v3, 'load_stock_database', lambda: {'stocks': [
+        {'code': '2330', 'name': '台積電', 'market': 'LISTED', 'price': 1000.0}]})
+    monkeypatch.setattr(app_v3, 'apply_cached_quotes', lambda stocks: None)
+    first = client.get('/api/search?q=2330')
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/search?q=2330', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
@@ -0,0 +1,90 @@
+"""
+回測引擎測試：整段歷史一次算出的特徵，需與即時流程在「當天下載 25 日資料」時算出的結果一致
+
+執行: python -m pytest -q test_backtest.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app_v3 import calc_high_days, calculate_technicals
+from backtest import History, compute_features, replay, summarize
+
+
+def _random_history(seed=0, T=120, N=40):
+    rng = np.random.default_rng(seed)
+    close = np.round(50 * np.exp(np.cumsum(rng.normal(0.003, 0.03, (T, N)), axis=0)), 2)
+    open_ = np.round(close * (1 + rng.normal(0, 0.01, (T, N))), 2)
+    halted = rng.random((T, N)) < 0.03          # 停牌日
+    close[halted] = np.nan
+    open_[halted] = np.nan
+    close[:30, :5] = np.nan                     # 較晚上市
+    open_[:30, :5] = np.nan
+    volume = rng.uniform(5e5, 5e6, (T, N))
+    index_close = np.round(10000 * np.exp(np.cumsum(rng.normal(0, 0.01, (T, 2)), axis=0)), 2)
+    dates = pd.bdate_range('2024-01-01', periods=T).to_numpy(dtype='datetime64[D]')
+    markets = np.where(np.arange(N) % 3 == 0, 'OTC', 'LISTED')
+    return History(dates, [str(1000 + j) for j in range(N)], markets, np.full(N, 1e8),
+                   open_, close, volume, index_close)
+
+
+def _live_window(hist, t, j, lookback=24):
+    """即時流程在第 t 天看到的資料：該股最近 lookback + 1 根有效 K 棒"""
+    df = pd.DataFrame({'Open': hist.open[:t + 1, j], 'Close': hist.close[:t + 1, j]},
+                      index=pd.DatetimeIndex(hist.dates[:t + 1])).dropna()
+    return df.iloc[-(lookback + 1):]
+
+
+def test_features_match_live_calculations():
+    hist = _random_history()
+    feats = compute_features(hist)
+    rng = np.random.default_rng(1)
+    checked = 0
+    for t, j in zip(rng.integers(0, hist.close.shape[0], 400), rng.integers(0, hist.close.shape[1], 400)):
+        if np.isnan(hist.close[t, j]):
+            continue
+        window = _live_window(hist, t, j)
+        _, _, count = calc_high_days(window)
+        assert feats['high_days'][t, j] == count
+        assert feats['bars'][t, j] == len(window)
+
+        tech = calculate_technicals(window.copy()).iloc[-1]
+        for key, col in (('ma5', 'MA5'), ('ma20', 'MA20'), ('rsi', 'RSI')):
+            if np.isnan(tech[col]):
+                assert np.isnan(feats[key][t, j])
+            else:
+                assert feats[key][t, j] == pytest.approx(tech[col], rel=1e-9)
+        checked += 1
+    assert checked > 300
+
+
+def test_replay_layers_are_nested_and_filtered():
+    hist = _random_history(seed=2)
+    feats = compute_features(hist)
+    masks = replay(feats, {'min_price': 20, 'max_price': 200, 'min_volume': 1000}, candidate_limit=10)
+
+    assert not (masks['smart'] & ~masks['strong']).any()
+    assert not (masks['strong'] & ~masks['outperformer']).any()
+    assert (masks['strong'].sum(axis=1) <= 10).all()
+    picked = hist.close[masks['outperformer']]
+    assert ((picked >= 20) & (picked <= 200)).all()
+    assert (feats['change_pct'][masks['outperformer']] > feats['idx_chg'][masks['outperformer']]).all()
+
+
+def test_summary_forward_returns_and_turnover():
+    # 一支穩定上漲的股票，對照持平的指數：每天都是強勢股，換手率 0，未來報酬為正
+    T = 40
+    close = np.round(100 * 1.01 ** np.arange(T), 2)[:, None]
+    hist = History(pd.bdate_range('2024-01-01', periods=T).to_numpy(dtype='datetime64[D]'),
+                   ['2330'], ['LISTED'], [1e9], close * 0.995, close,
+                   np.full((T, 1), 5e6), np.full((T, 2), 10000.0))
+    feats = compute_features(hist, horizons=(1, 5))
+    masks = replay(feats)
+    report = summarize(feats, masks, hist.dates, start=str(hist.dates[25]), horizons=(1, 5))
+
+    strong = report['layers']['strong']
+    assert strong['avg_per_day'] == 1.0
+    assert strong['turnover'] == 0.0
+    assert strong['1d']['hit_rate'] == 1.0
+    assert strong['5d']['mean'] == pytest.approx(1.01 ** 5 - 1, abs=1e-3)
+    assert strong['5d']['n'] == report['days'] - 5
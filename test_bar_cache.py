@@ -0,0 +1,192 @@
+"""
+K 棒快取測試：已收盤 K 棒只附加、不重抓；未收盤 K 棒依 TTL 更新
+
+執行: python -m pytest -q test_bar_cache.py
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import bar_cache
+from technicals import build_panel
+
+
+class FakeYahoo:
+    """模擬 Yahoo：依 start 回傳到「今天」為止的日 K，今天的 K 棒收盤價可變"""
+
+    def __init__(self):
+        self.calls = []
+        self.today_close = 110.0
+        self.scale = 1.0            # 模擬分割後 Yahoo 回溯調整歷史價格
+        self.adj = None             # 模擬除權息：今天以前的 Adj Close = Close × adj（None 時不附 Adj Close）
+        self.empty = False          # 模擬下載失敗 / 沒有資料
+
+    def bars(self, symbol, start):
+        today = pd.Timestamp.now(tz='Asia/Taipei').normalize()
+        idx = pd.date_range(pd.Timestamp(start).tz_localize('Asia/Taipei'), today, freq='D')
+        base = 100.0 if symbol.startswith('2330') else 50.0
+        close = [(base + i.day) * self.scale for i in idx]
+        df = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1000.0}, index=idx)
+        df.iloc[-1, df.columns.get_loc('Close')] = self.today_close
+        if self.adj is not None:
+            df['Adj Close'] = df['Close']
+            df.iloc[:-1, df.columns.get_loc('Adj Close')] *= self.adj
+        return df
+
+    def __call__(self, symbols, interval, start, timeout=None):
+        self.calls.append((tuple(symbols), pd.Timestamp(start).normalize()))
+        if self.empty:
+            return {s: bar_cache._clean(None) for s in symbols}
+        return {s: self.bars(s, start) for s in symbols}
+
+
+@pytest.fixture
+def yahoo(monkeypatch, tmp_path):
+    fake = FakeYahoo()
+    monkeypatch.setattr(bar_cache, 'BAR_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(bar_cache, '_download', fake)
+    monkeypatch.setattr(bar_cache, '_series', {})
+    return fake
+
+
+def test_closed_bars_are_cached_and_open_bar_refreshed(yahoo, monkeypatch):
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    today = bar_cache._today()
+    assert len(df) == 11 and df['Close'].iloc[-1] == 110.0
+    assert len(yahoo.calls) == 1
+
+    # TTL 內：完全不下載
+    bar_cache.get_bars('2330.TW', period='5d')
+    assert len(yahoo.calls) == 1
+
+    # TTL 過期：只從最後一根已收盤 K 棒（昨天）起下載
+    monkeypatch.setattr(bar_cache, 'OPEN_BAR_TTL', -1)
+    yahoo.today_close = 120.0
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    assert yahoo.calls[-1][1] == today - pd.Timedelta(days=1)
+    assert df['Close'].iloc[-1] == 120.0 and len(df) == 11
+
+    # 磁碟上只有已收盤 K 棒；重新載入後內容一致
+    csv_path, _ = bar_cache._paths('2330.TW', '1d')
+    assert len(pd.read_csv(csv_path)) == 10
+    monkeypatch.setattr(bar_cache, '_series', {})
+    monkeypatch.setattr(bar_cache, 'OPEN_BAR_TTL', 60)
+    reloaded = bar_cache.get_bars('2330.TW', period='10d')
+    pd.testing.assert_frame_equal(reloaded, df, check_freq=False)
+
+
+def test_backfill_only_when_range_extends_past_cache(yahoo):
+    bar_cache.get_bars('2330.TW', period='5d')
+    df = bar_cache.get_bars('2330.TW', period='20d')
+    assert len(yahoo.calls) == 2
+    assert len(df) == 21 and df.index.is_monotonic_increasing and not df.index.duplicated().any()
+
+
+def test_new_closed_bars_are_appended(yahoo, monkeypatch):
+    bar_cache.get_bars('2330.TW', period='10d')
+    s = bar_cache._series[('2330.TW', '1d')]
+    # 模擬隔天：快取只到前天，今天以前的 K 棒都已收盤
+    s.closed = s.closed.iloc[:-3]
+    s.fetched_at = 0
+    csv_path, _ = bar_cache._paths('2330.TW', '1d')
+    s.closed.to_csv(csv_path)
+    before = open(csv_path, encoding='utf-8').read()
+
+    bar_cache.get_bars('2330.TW', period='10d')
+    after = open(csv_path, encoding='utf-8').read()
+    assert after.startswith(before)                 # 只附加，不改寫舊內容
+    assert len(pd.read_csv(csv_path)) == 10
+
+
+def test_many_matches_download_layout(yahoo):
+    bar_cache.get_bars('2330.TW', period='25d')
+    data = bar_cache.get_bars_many(['2330.TW', '6415.TWO'], period='25d')
+    # 2330 已在快取中（TTL 內），只有 6415 需要下載
+    assert yahoo.calls[-1][0] == ('6415.TWO',)
+    panel = build_panel(data, ['2330.TW', '6415.TWO'])
+    assert list(panel.lengths) == [26, 26]
+
+
+def test_interval_lookback_is_clamped():
+    since = bar_cache._range_start('60d', interval='1m')
+    assert since >= bar_cache._today() - pd.Timedelta(days=7)
+    with pytest.raises(ValueError):
+        bar_cache._range_start('max')
+
+
+def test_intraday_split_closed():
+    idx = pd.date_range('2024-06-03 09:00', periods=4, freq='5min', tz='Asia/Taipei')
+    df = pd.DataFrame({'Close': [1.0, 2.0, 3.0, 4.0]}, index=idx)
+    closed, open_bar = bar_cache._split_closed(df, '5m', now=pd.Timestamp('2024-06-03 09:17', tz='Asia/Taipei'))
+    assert len(closed) == 3 and len(open_bar) == 1
+
+
+def test_range_start_uses_taipei_today(monkeypatch):
+    # UTC 16:30 時台北已是隔天
+    fake_now = pd.Timestamp('2024-06-03 16:30', tz='UTC')
+    monkeypatch.setattr(pd.Timestamp, 'now', classmethod(lambda cls, tz=None: fake_now.tz_convert(tz)
+                                                         if tz else fake_now.tz_localize(None)))
+    assert bar_cache._range_start('1d') == pd.Timestamp('2024-06-03')
+
+
+def test_empty_backfill_does_not_mark_range_covered(yahoo):
+    yahoo.empty = True
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    assert df.empty
+    s = bar_cache._series[('2330.TW', '1d')]
+    assert s.covered_from is None
+    assert not os.path.exists(bar_cache._paths('2330.TW', '1d')[1])
+
+    # 資料來源恢復後重新回補
+    yahoo.empty = False
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    assert len(yahoo.calls) == 2 and len(df) == 11
+
+
+def test_adjusted_history_triggers_full_reload(yahoo, monkeypatch):
+    bar_cache.get_bars('2330.TW', period='10d')
+    monkeypatch.setattr(bar_cache, 'OPEN_BAR_TTL', -1)
+    yahoo.scale = 0.5
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    # 重疊 K 棒價格不一致：更新後再自涵蓋起點整段重抓
+    assert len(yahoo.calls) == 3
+    assert yahoo.calls[-1][1] == bar_cache._today() - pd.Timedelta(days=10)
+    expected = yahoo.bars('2330.TW', bar_cache._today() - pd.Timedelta(days=10))
+    assert (df['Close'].iloc[:-1].values == expected['Close'].iloc[:-1].values).all()
+    csv_path, _ = bar_cache._paths('2330.TW', '1d')
+    assert pd.read_csv(csv_path)['Close'].iloc[0] == expected['Close'].iloc[0]
+
+
+def test_serves_dividend_adjusted_prices(yahoo):
+    yahoo.adj = 0.9
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    raw = yahoo.bars('2330.TW', bar_cache._today() - pd.Timedelta(days=10))
+    assert list(df.columns) == bar_cache.FIELDS
+    assert df['Close'].iloc[:-1].tolist() == pytest.approx((raw['Close'].iloc[:-1] * 0.9).tolist())
+    assert df['Open'].iloc[:-1].tolist() == pytest.approx((raw['Open'].iloc[:-1] * 0.9).tolist())
+    assert df['Close'].iloc[-1] == yahoo.today_close and (df['Volume'] == 1000.0).all()
+    # 磁碟上保留原始價與 Adj Close
+    stored = pd.read_csv(bar_cache._paths('2330.TW', '1d')[0])
+    assert stored['Close'].iloc[0] == raw['Close'].iloc[0]
+    assert stored['Adj Close'].iloc[0] == pytest.approx(raw['Close'].iloc[0] * 0.9)
+
+
+def test_new_dividend_triggers_full_reload(yahoo, monkeypatch):
+    yahoo.adj = 1.0
+    bar_cache.get_bars('2330.TW', period='10d')
+    monkeypatch.setattr(bar_cache, 'OPEN_BAR_TTL', -1)
+    yahoo.adj = 0.95            # 原始收盤價不變，只有 Adj Close 被回溯調整
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    assert len(yahoo.calls) == 3
+    raw = yahoo.bars('2330.TW', bar_cache._today() - pd.Timedelta(days=10))
+    assert df['Close'].iloc[0] == pytest.approx(raw['Close'].iloc[0] * 0.95)
+
+
+def test_legacy_cache_without_adj_close_loads(yahoo):
+    bar_cache.get_bars('2330.TW', period='10d')
+    csv_path, _ = bar_cache._paths('2330.TW', '1d')
+    pd.read_csv(csv_path, index_col=0).drop(columns='Adj Close').to_csv(csv_path)
+    bar_cache._series.clear()
+    df = bar_cache.get_bars('2330.TW', period='10d')
+    assert len(yahoo.calls) == 2 and len(df) == 11        # 讀回舊檔，只更新最後一根
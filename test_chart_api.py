@@ -0,0 +1,134 @@
+"""
+搜尋 / 個股圖表 API 測試（以假的 yfinance 資料，不連網）
+
+執行: python -m pytest -q test_chart_api.py
+"""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import app_v3
+import chart_payload
+
+
+def _bars(n, freq='D'):
+    idx = pd.date_range('2024-06-03 09:00', periods=n, freq=freq, tz='Asia/Taipei')
+    return pd.DataFrame({'Open': 100.0, 'High': 102.0, 'Low': 99.0, 'Close': 101.0, 'Volume': 1000.0}, index=idx)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def daily(symbol, period='60d', start=None, end=None, deadline=None):
+        calls.append(('daily', symbol, period, start, end))
+        return _bars(int(period[:-1]) if not start else 5)
+
+    def intraday(symbol, period='7d', interval='5m', deadline=None):
+        calls.append(('intraday', symbol, period, interval))
+        return _bars(54, '5min')
+
+    monkeypatch.setattr(app_v3, 'fetch_daily_bars', daily)
+    monkeypatch.setattr(app_v3, 'fetch_intraday_bars', intraday)
+    monkeypatch.setattr(app_v3, 'fetch_institutional_history', lambda code, market, n_days, deadline=None: [{'date': '2024-06-28'}] * n_days)
+    monkeypatch.setattr(app_v3, 'load_stock_database', lambda: {'stocks': [
+        {'code': '2330', 'name': '台積電', 'market': 'LISTED', 'price': 1000.0, 'change_pct': 1.0, 'volume': 1, 'market_cap': 1},
+        {'code': '6415', 'name': '矽力-KY', 'market': 'OTC', 'price': 400.0, 'change_pct': 1.0, 'volume': 1, 'market_cap': 1},
+    ]})
+    app_v3.app.config['TESTING'] = True
+    client = app_v3.app.test_client()
+    client.calls = calls
+    return client
+
+
+def test_search_returns_metadata_only(client):
+    data = client.get('/api/search?q=2330').get_json()
+    assert data['count'] == 1
+    stock = data['results'][0]
+    assert stock['code'] == '2330'
+    assert 'chart_data_daily' not in stock and 'institutional_history' not in stock
+    assert client.calls == []
+
+
+def test_daily_chart_range_and_cache_headers(client):
+    resp = client.get('/api/chart/6415/daily?days=20')
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert 'max-age=' in resp.headers['Cache-Control']
+    assert body['code'] == '6415' and len(body['candles']) == 20 and len(body['volumes']) == 20
+    assert client.calls[-1] == ('daily', '6415.TWO', '20d', None, None)
+
+    client.get('/api/chart/2330/daily?start=2024-01-01&end=2024-03-31')
+    assert client.calls[-1] == ('daily', '2330.TW', '60d', '2024-01-01', '2024-03-31')
+
+
+def test_intraday_chart(client):
+    body = client.get('/api/chart/2330/intraday?interval=15m&days=30').get_json()
+    assert body['interval'] == '15m'
+    assert isinstance(body['candles'][0]['time'], int)
+    assert client.calls[-1] == ('intraday', '2330.TW', '30d', '15m')
+
+
+@pytest.mark.parametrize('url', [
+    '/api/chart/2330/daily?days=0',
+    '/api/chart/2330/daily?days=abc',
+    '/api/chart/2330/daily?start=2024-13-01',
+    '/api/chart/2330/intraday?interval=3m',
+    '/api/chart/2330/intraday?interval=1m&days=30',
+    '/api/institutional/2330?days=999',
+])
+def test_invalid_ranges_are_rejected(client, url):
+    assert client.get(url).status_code == 400
+
+
+def test_unknown_code_is_404(client):
+    assert client.get('/api/chart/9999/daily').status_code == 404
+
+
+def test_institutional_endpoint(client):
+    body = client.get('/api/institutional/2330?days=5').get_json()
+    assert len(body['institutional_history']) == 5
+
+
+def test_columns_format(client):
+    rows = client.get('/api/chart/2330/daily?days=20').get_json()
+    body = client.get('/api/chart/2330/daily?days=20&format=columns').get_json()
+    assert body['format'] == 'columns'
+    assert body['bars']['t'] == [c['time'] for c in rows['candles']]
+    assert body['bars']['v'] == [v['value'] for v in rows['volumes']]
+    assert client.get('/api/chart/2330/daily?format=xml').status_code == 400
+
+
+def test_binary_format(client):
+    resp = client.get('/api/chart/2330/intraday?format=binary')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/octet-stream'
+    assert 'max-age=' in resp.headers['Cache-Control']
+    bars = chart_payload.from_binary(resp.data)
+    assert len(bars['time']) == 54 and bars['close'][0] == 101.0
+
+
+def test_stock_index_reloads_only_when_database_changes(tmp_path, monkeypatch):
+    path = tmp_path / 'stock_database.json'
+    monkeypatch.setattr(app_v3, 'DATABASE_FILE', str(path))
+    monkeypatch.setattr(app_v3, '_stock_index', {'mtime': None, 'by_code': {}})
+    loads = []
+    original = app_v3.load_stock_database
+    monkeypatch.setattr(app_v3, 'load_stock_database', lambda: loads.append(1) or original())
+
+    def write(stocks, mtime):
+        path.write_text(json.dumps({'stocks': stocks}), encoding='utf-8')
+        os.utime(path, (mtime, mtime))
+
+    write([{'code': '2330', 'market': 'LISTED'}], 1000)
+    with app_v3.app.test_request_context('/api/chart/2330/daily'):
+        assert app_v3._find_stock('2330')['market'] == 'LISTED'
+        assert app_v3._find_stock('6415') is None
+    assert len(loads) == 1                     # 同一版資料庫只載入一次
+
+    write([{'code': '2330', 'market': 'LISTED'}, {'code': '6415', 'market': 'OTC'}], 2000)
+    with app_v3.app.test_request_context('/api/chart/6415/daily'):
+        assert app_v3._find_stock('6415')['market'] == 'OTC'
+    assert len(loads) == 2
@@ -0,0 +1,107 @@
+"""
+圖表資料序列化測試：向量化結果與逐列組出的格式一致
+
+執行: python -m pytest -q test_chart_payload.py
+"""
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import chart_payload
+
+
+def _hist(n, freq='D', seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range('2024-06-03 09:00', periods=n, freq=freq, tz='Asia/Taipei')
+    close = 100 + rng.normal(0, 1, n).cumsum()
+    open_ = close + rng.normal(0, 0.5, n)
+    return pd.DataFrame({'Open': open_, 'High': np.maximum(open_, close) + 0.3, 'Low': np.minimum(open_, close) - 0.3,
+                         'Close': close, 'Volume': rng.integers(0, 10_000, n).astype(float)}, index=idx)
+
+
+def _legacy_rows(hist, intraday):
+    """原本 /api/search 逐列組資料的寫法"""
+    candles, volumes = [], []
+    for ts, row in hist.iterrows():
+        t = int(ts.timestamp()) if intraday else ts.strftime('%Y-%m-%d')
+        candles.append({'time': t, 'open': round(row['Open'], 2), 'high': round(row['High'], 2),
+                        'low': round(row['Low'], 2), 'close': round(row['Close'], 2)})
+        volumes.append({'time': t, 'value': int(row['Volume']),
+                        'color': '#ef5350' if row['Close'] >= row['Open'] else '#26a69a'})
+    return candles, volumes
+
+
+@pytest.mark.parametrize('intraday,freq', [(False, 'D'), (True, '5min')])
+def test_rows_match_legacy(intraday, freq):
+    hist = _hist(300, freq)
+    candles, volumes = chart_payload.chart_rows(hist, intraday)
+    expected_candles, expected_volumes = _legacy_rows(hist, intraday)
+    assert volumes == expected_volumes
+    assert [c['time'] for c in candles] == [c['time'] for c in expected_candles]
+    for got, exp in zip(candles, expected_candles):
+        for k in ('open', 'high', 'low', 'close'):
+            assert got[k] == pytest.approx(exp[k], abs=0.0100001)
+
+
+def test_columns_roundtrip_and_nan_rows_dropped():
+    hist = _hist(10, '5min')
+    hist.iloc[3, 0] = np.nan
+    cols = chart_payload.chart_columns(hist, intraday=True)
+    assert len(cols['time']) == 9
+
+    body = json.loads(chart_payload.dumps({'bars': chart_payload.to_columns(cols)}))['bars']
+    candles, volumes = chart_payload.to_rows(cols)
+    assert body['t'] == [c['time'] for c in candles]
+    assert body['c'] == [c['close'] for c in candles]
+    assert body['v'] == [v['value'] for v in volumes]
+
+
+def test_dumps_without_orjson(monkeypatch):
+    monkeypatch.setattr(chart_payload, 'orjson', None)
+    cols = chart_payload.chart_columns(_hist(3))
+    body = json.loads(chart_payload.dumps({'name': '台積電', 'bars': chart_payload.to_columns(cols)}))
+    assert body['name'] == '台積電' and len(body['bars']['t']) == 3
+
+
+def test_empty_history():
+    assert chart_payload.chart_rows(pd.DataFrame()) == ([], [])
+
+
+@pytest.mark.parametrize('intraday,freq', [(False, 'D'), (True, '5min')])
+def test_binary_roundtrip(intraday, freq):
+    cols = chart_payload.chart_columns(_hist(200, freq), intraday)
+    data = chart_payload.to_binary(cols, intraday)
+    assert len(data) == 24 + 28 * 200
+    back = chart_payload.from_binary(data)
+    assert back['time'].tolist() == cols['time'].tolist()
+    np.testing.assert_array_equal(back['volume'], cols['volume'])
+    for k in ('open', 'high', 'low', 'close'):
+        np.testing.assert_allclose(back[k], cols[k], atol=1e-9)
+
+
+def test_binary_empty_and_bad_magic():
+    data = chart_payload.to_binary(chart_payload.chart_columns(pd.DataFrame()))
+    assert len(chart_payload.from_binary(data)['time']) == 0
+    with pytest.raises(ValueError):
+        chart_payload.from_binary(b'XXXX' + data[4:])
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='需要 node')
+def test_js_decoder_matches_rows(tmp_path):
+    hist = _hist(50, 'D')
+    cols = chart_payload.chart_columns(hist)
+    path = tmp_path / 'chart.bin'
+    path.write_bytes(chart_payload.to_binary(cols))
+    script = (f"{open('static/chart_codec.js', encoding='utf-8').read()}\n"
+              f"const b = require('fs').readFileSync({json.dumps(str(path))});\n"
+              "const out = decodeChartBinary(b.buffer.slice(b.byteOffset, b.byteOffset + b.length));\n"
+              "process.stdout.write(JSON.stringify(out));")
+    out = json.loads(subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout)
+    candles, volumes = chart_payload.to_rows(cols)
+    assert out['intraday'] is False
+    assert out['candles'] == candles
+    assert [v['value'] for v in out['volumes']] == [v['value'] for v in volumes]
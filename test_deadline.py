@@ -0,0 +1,76 @@
+"""
+請求期限測試：期限傳入各抓取函式、逾時回傳部分結果、partial 快照不長期沿用
+
+執行: python -m pytest -q test_deadline.py
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app_v3
+from deadline import Deadline, DeadlineExceeded
+
+
+def test_deadline_timeout_and_wait():
+    d = Deadline(0.2)
+    assert 0 < d.timeout(15) <= 0.2
+    assert Deadline().timeout(15) == 15 and not Deadline().expired
+
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        futures = [ex.submit(time.sleep, 0.05), ex.submit(time.sleep, 1), ex.submit(time.sleep, 1)]
+        done, not_done = d.wait(futures)
+        assert futures[0] in done and len(not_done) == 2
+        assert futures[2].cancelled()            # 尚未開始的工作被取消
+
+    time.sleep(0.2)
+    with pytest.raises(DeadlineExceeded):
+        d.timeout(15)
+
+
+def test_institutional_history_returns_partial(monkeypatch):
+    def fetch(code, date_str, timeout):
+        time.sleep(0.05 if int(date_str[-1]) % 2 else 2)
+        return {'date': date_str}
+    monkeypatch.setattr(app_v3, '_fetch_twse_institutional', fetch)
+
+    d = Deadline(0.5)
+    start = time.time()
+    rows = app_v3.fetch_institutional_history('2330', 'LISTED', n_days=20, deadline=d)
+    assert time.time() - start < 1.0
+    assert rows and all(int(r['date'][-1]) % 2 for r in rows)
+    assert d.partial_parts == ['institutional']
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    base = [{'code': '2330', 'name': '台積電', 'price': 1000.0, 'change_pct': 2.0, 'volume': 10_000_000,
+             'market_cap': 1e13, 'market': 'LISTED'}]
+    monkeypatch.setattr(app_v3, 'filter_and_rank_stocks',
+                        lambda **kw: {'listed_all': base, 'otc_all': []})
+    monkeypatch.setattr(app_v3, 'GLOBAL_SNAPSHOT', None)
+    monkeypatch.setattr(app_v3.PREFETCHER, 'enabled', False)
+    monkeypatch.setattr(app_v3, '_realtime_cache', {})
+
+
+def test_expired_deadline_builds_partial_snapshot_without_network(pipeline):
+    filters = {'min_price': 10, 'max_price': 1000, 'min_market_cap': 0, 'min_volume': 1000}
+    start = time.time()
+    snap = app_v3.get_or_update_snapshot(filters, Deadline(0))
+    assert time.time() - start < 1.0
+    assert snap.partial and snap.partial_parts == ['history', 'indices', 'realtime']
+    assert [s['code'] for s in snap.base_pool] == ['2330']
+
+    # TTL 內沿用，過期後重建
+    assert app_v3.get_or_update_snapshot(filters, Deadline(0)) is snap
+    snap.built_at -= app_v3.PARTIAL_SNAPSHOT_TTL + 1
+    assert app_v3.get_or_update_snapshot(filters, Deadline(0)) is not snap
+
+
+def test_partial_flag_in_responses(pipeline, monkeypatch):
+    monkeypatch.setattr(app_v3, 'API_DEADLINE', 0)
+    client = app_v3.app.test_client()
+    body = client.post('/api/screen', json={}).get_json()
+    assert body['partial'] is True and 'history' in body['partial_parts']
+    assert client.post('/api/strong', json={}).get_json()['partial'] is True
+    assert client.post('/api/recommend', json={}).get_json()['partial'] is True
@@ -0,0 +1,17 @@
+"""
+單一執行者鎖測試
+
+執行: python -m pytest -q test_file_lock.py
+"""
+from file_lock import FileLock
+
+
+def test_only_one_holder(tmp_path):
+    first = FileLock('job', directory=str(tmp_path))
+    second = FileLock('job', directory=str(tmp_path))
+    assert first.acquire() and first.held
+    assert not second.acquire()
+    assert FileLock('other', directory=str(tmp_path)).acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
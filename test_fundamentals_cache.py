@@ -0,0 +1,121 @@
+"""
+基本面快取測試：有效期內不重抓、過期先回舊資料再背景更新、關注清單
+
+執行: python -m pytest -q test_fundamentals_cache.py
+"""
+import threading
+import time
+
+import pytest
+
+import fundamentals_cache as fc
+
+
+@pytest.fixture
+def yahoo(monkeypatch, tmp_path):
+    calls = []
+
+    def fetch(symbol):
+        calls.append(symbol)
+        time.sleep(0.05)
+        return {'shares_outstanding': 100 * len(calls), 'float_shares': 50, 'institutional_holders': None}
+
+    monkeypatch.setattr(fc, 'FUNDAMENTALS_DIR', str(tmp_path))
+    monkeypatch.setattr(fc, '_fetch', fetch)
+    return calls
+
+
+def _age(symbol, days):
+    entry = fc.load_entry(symbol)
+    entry['fetched_at'] -= days * fc.DAY
+    fc._save_entry(entry)
+
+
+def _age_requested(symbol, days):
+    with open(fc._path(symbol, 'requested'), 'w', encoding='utf-8') as f:
+        f.write(str(fc.last_requested(symbol) - days * fc.DAY))
+
+
+def test_cached_until_refresh_days(yahoo):
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 100
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 100
+    assert yahoo == ['2330.TW']
+
+
+def test_concurrent_misses_fetch_once(yahoo):
+    threads = [threading.Thread(target=fc.get_fundamentals, args=('2330.TW',)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert yahoo == ['2330.TW']
+
+
+def test_stale_entry_served_then_refreshed(yahoo):
+    fc.get_fundamentals('2330.TW')
+    _age('2330.TW', fc.REFRESH_DAYS + 1)
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 100     # 先回舊資料
+    fc._refresher.submit(lambda: None).result()                           # 等背景更新完成
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 200
+    assert yahoo == ['2330.TW', '2330.TW']
+
+
+def test_refresh_due_only_watched_and_stale(yahoo):
+    for sym in ('2330.TW', '2317.TW', '6415.TWO'):
+        fc.get_fundamentals(sym)
+    _age('2330.TW', fc.REFRESH_DAYS + 1)                                   # 過期、關注中
+    _age('2317.TW', fc.REFRESH_DAYS + 1)
+    _age_requested('2317.TW', fc.WATCH_DAYS + 1)                           # 過期、但很久沒人查
+    assert fc.refresh_due(pause=0) == 1
+    assert yahoo[3:] == ['2330.TW']
+
+
+def test_warm_skips_fresh(yahoo):
+    fc.get_fundamentals('2330.TW')
+    assert fc.warm(['2330.TW', '2317.TW']) == (1, 0, 1)
+    assert fc.warm(['2330.TW'], force=True) == (1, 0, 0)
+    assert fc.last_requested('2330.TW') > 0                                # 重抓不影響關注時間
+
+
+def test_stale_request_does_not_block_or_clobber_refresh(yahoo):
+    fc.get_fundamentals('2330.TW')
+    _age('2330.TW', fc.REFRESH_DAYS + 1)
+    _age_requested('2330.TW', 2)
+
+    # 另一個更新正持有鎖：查詢不能等待，直接回舊資料
+    lock = fc._lock('2330.TW')
+    lock.acquire()
+    try:
+        t0 = time.time()
+        assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 100
+        assert time.time() - t0 < 0.5
+        assert time.time() - fc.last_requested('2330.TW') < 5
+    finally:
+        lock.release()
+
+    fc._refresher.submit(lambda: None).result()                           # 等背景更新完成
+    entry = fc.load_entry('2330.TW')
+    assert entry['data']['shares_outstanding'] == 200                     # 更新結果沒有被舊資料蓋回
+    assert fc._is_fresh(entry, fc.REFRESH_DAYS)
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 200
+
+
+def test_sync_fetch_respects_deadline(yahoo, monkeypatch):
+    release = threading.Event()
+
+    def slow(symbol):
+        release.wait(5)
+        return {'shares_outstanding': 300, 'float_shares': 50, 'institutional_holders': None}
+
+    monkeypatch.setattr(fc, '_fetch', slow)
+    t0 = time.time()
+    with pytest.raises(fc.DeadlineExceeded):
+        fc.get_fundamentals('2330.TW', deadline=fc.Deadline(0.1))
+    assert time.time() - t0 < 1
+    # 呼叫端放棄等待後抓取仍會完成並寫入快取
+    release.set()
+    for _ in range(50):
+        if fc.load_entry('2330.TW'):
+            break
+        time.sleep(0.02)
+    assert fc.get_fundamentals('2330.TW')['shares_outstanding'] == 300
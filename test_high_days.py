@@ -0,0 +1,113 @@
+"""
+calc_high_days 批次版等價測試：逐檔 iterrows 版本與 technicals.calc_high_days_batch 結果必須完全相同
+
+執行: python -m pytest -q test_high_days.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app_v3 import calc_high_days
+from technicals import Panel, build_panel, calc_high_days_batch
+
+
+def _panel_from_frames(frames):
+    """把多個逐檔 DataFrame（可含 NaN）靠下對齊成 Panel，不做 dropna"""
+    T = max((len(h) for h in frames), default=0)
+    N = len(frames)
+    data = {f: np.full((T, N), np.nan) for f in ('Open', 'Close')}
+    dates = np.full((T, N), np.datetime64('NaT'), dtype='datetime64[ns]')
+    for j, h in enumerate(frames):
+        n = len(h)
+        if not n:
+            continue
+        data['Open'][T - n:, j] = h['Open'].to_numpy(dtype=float)
+        data['Close'][T - n:, j] = h['Close'].to_numpy(dtype=float)
+        dates[T - n:, j] = h.index.to_numpy(dtype='datetime64[ns]')
+    lengths = np.array([len(h) for h in frames], dtype=int)
+    return Panel([f"S{j}" for j in range(N)], data, lengths, dates)
+
+
+def _hist(opens, closes, end='2024-06-28'):
+    idx = pd.bdate_range(end=end, periods=len(closes))
+    return pd.DataFrame({'Open': opens, 'Close': closes}, index=idx, dtype=float)
+
+
+def _assert_equivalent(frames):
+    expected = [calc_high_days(h) for h in frames]
+    got = calc_high_days_batch(_panel_from_frames(frames))
+    assert got == expected
+
+
+def _random_walk(rng, n, start=100.0):
+    close = start * np.exp(np.cumsum(rng.normal(0.002, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    return np.round(open_, 2), np.round(close, 2)
+
+
+EDGE_CASES = {
+    'empty':               _hist([], []),
+    'single_row':          _hist([10], [10]),
+    'two_rows_up':         _hist([10, 11], [10.5, 12]),
+    'two_rows_down':       _hist([10, 11], [10.5, 9]),
+    'last_nan_short':      _hist([10, 11], [10.5, np.nan]),
+    'last_zero_short':     _hist([10, 11], [10.5, 0]),
+    'last_nan_fallback':   _hist([10, 10, 11, 12], [10.5, 10.8, 12.5, np.nan]),
+    'last_zero_fallback':  _hist([10, 10, 11, 12], [10.5, 10.8, 12.5, 0]),
+    'last_neg_fallback':   _hist([10, 10, 11, 12], [10.5, 10.8, 12.5, -1]),
+    'both_last_nan':       _hist([10, 10, 11, 12], [10.5, 10.8, np.nan, np.nan]),
+    'all_higher':          _hist([1, 2, 3, 4, 5], [1.5, 2.5, 3.5, 4.5, 9]),
+    'gap_in_history':      _hist([10, 10, np.nan, 10, 10], [10, 10, 10, 10, 11]),
+    'zero_open_in_history': _hist([10, 0, 10, 10], [10, 10, 10, 11]),
+    'tolerance_equal':     _hist([10, 10, 10], [10.0005, 10.0, 10.0]),
+    'tolerance_miss':      _hist([10, 10, 10], [10.01, 10.0, 10.0]),
+    'green_bar_open_high': _hist([12, 10, 11.5], [10, 10.5, 11.9]),
+}
+
+
+@pytest.mark.parametrize('name', sorted(EDGE_CASES))
+def test_edge_case_matches(name):
+    _assert_equivalent([EDGE_CASES[name]])
+
+
+def test_edge_cases_batched_together():
+    # 長度不同的股票放在同一個面板，補齊列不可影響結果
+    _assert_equivalent(list(EDGE_CASES.values()))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_histories_match(seed):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(200):
+        n = int(rng.integers(0, 60))
+        opens, closes = _random_walk(rng, n)
+        if n and rng.random() < 0.15:
+            closes[-1] = rng.choice([np.nan, 0.0])
+        if n > 3 and rng.random() < 0.1:
+            k = int(rng.integers(0, n - 2))
+            opens[k] = rng.choice([np.nan, 0.0])
+        frames.append(_hist(opens, closes, end=f"2024-06-{int(rng.integers(20, 29))}"))
+    _assert_equivalent(frames)
+
+
+def test_build_panel_path_matches_per_symbol():
+    # run_full_sync 的實際路徑：yf.download 形式 -> build_panel -> 批次計算
+    rng = np.random.default_rng(42)
+    idx = pd.bdate_range(end='2024-06-28', periods=40)
+    symbols = [f"{1000 + j}.TW" for j in range(30)]
+    cols = {}
+    for j, sym in enumerate(symbols):
+        opens, closes = _random_walk(rng, len(idx))
+        if j % 7 == 0:
+            opens[:15] = np.nan        # 較晚上市
+            closes[:15] = np.nan
+        for f, v in (('Open', opens), ('High', np.maximum(opens, closes)),
+                     ('Low', np.minimum(opens, closes)), ('Close', closes), ('Volume', np.full(len(idx), 1e6))):
+            cols[(sym, f)] = v
+    df = pd.DataFrame(cols, index=idx)
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+
+    panel = build_panel(df, symbols)
+    expected = [calc_high_days(df[sym].dropna()) for sym in symbols]
+    assert calc_high_days_batch(panel) == expected
@@ -0,0 +1,84 @@
+"""
+HTTP 快取測試：條件式請求 (304) 沿用舊內容、LRU 容量淘汰、交易日 TTL
+
+執行: python -m pytest -q test_http_cache.py
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import http_cache
+
+
+class _EtagHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        etag = f'"{self.path}-v1"'
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = (self.path.ljust(100, '.')).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, 'CACHE_DIR', str(tmp_path / 'http'))
+    monkeypatch.setattr(http_cache, '_total_bytes', None)
+    _EtagHandler.requests = []
+    srv = HTTPServer(('127.0.0.1', 0), _EtagHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def test_revalidation_304_returns_cached_body(server):
+    url = f"{server}/quotes"
+    first = http_cache.cached_get(url, ttl=0)
+    assert first.status_code == 200 and not first.from_cache
+
+    second = http_cache.cached_get(url, ttl=60)      # 已過期：帶 If-None-Match 重新驗證
+    assert _EtagHandler.requests[-1] == ('/quotes', '"/quotes-v1"')
+    assert second.status_code == 200 and second.from_cache
+    assert second.content == first.content
+
+    http_cache.cached_get(url, ttl=60)               # 304 後更新了儲存時間：不再發請求
+    assert len(_EtagHandler.requests) == 2
+
+
+def _body_path(url):
+    return http_cache._paths(http_cache.cache_key(url))[1]
+
+
+def test_lru_eviction_keeps_recently_used(server, monkeypatch):
+    monkeypatch.setattr(http_cache, 'MAX_CACHE_BYTES', 350)
+    for i, name in enumerate('abc'):
+        http_cache.cached_get(f"{server}/{name}", ttl=None)
+        os.utime(_body_path(f"{server}/{name}"), (1000 + i, 1000 + i))
+    http_cache.cached_get(f"{server}/a", ttl=None)   # 命中快取：a 變成最近使用
+    assert len(_EtagHandler.requests) == 3
+
+    http_cache.cached_get(f"{server}/d", ttl=None)   # 超過容量：淘汰最久未使用的 b
+    assert [os.path.exists(_body_path(f"{server}/{n}")) for n in 'abcd'] == [True, False, True, True]
+    assert http_cache._total_bytes == 300
+
+
+def test_ttl_for_trading_date():
+    today = datetime.now()
+    assert http_cache.ttl_for_trading_date((today - timedelta(days=1)).strftime('%Y%m%d')) is None
+    assert http_cache.ttl_for_trading_date(today.strftime('%Y%m%d')) == http_cache.INTRADAY_TTL
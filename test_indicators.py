@@ -0,0 +1,104 @@
+"""
+增量指標狀態測試：逐筆 push / replace_last 的結果必須與整段重算 (calculate_technicals) 一致
+
+執行: python -m pytest -q test_indicators.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app_v3 import calculate_technicals
+from indicators import IndicatorBook, IndicatorState
+from technicals import Panel, last_row_features
+
+
+def _reference(closes):
+    hist = calculate_technicals(pd.DataFrame({'Close': closes}, dtype=float))
+    last = hist.iloc[-1]
+    return {'ma5': last['MA5'], 'ma20': last['MA20'], 'rsi': last['RSI']}
+
+
+def _assert_close(got, expected):
+    for k, v in expected.items():
+        if np.isnan(v):
+            assert np.isnan(got[k]), k
+        else:
+            assert got[k] == pytest.approx(v, rel=1e-9, abs=1e-9), k
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_push_matches_full_recompute(seed):
+    rng = np.random.default_rng(seed)
+    closes = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, 120))), 2)
+    st = IndicatorState()
+    for i, c in enumerate(closes):
+        st.push(c)
+        _assert_close(st.values(), _reference(closes[:i + 1]))
+
+
+def test_replace_last_matches_full_recompute():
+    rng = np.random.default_rng(7)
+    closes = list(np.round(50 + np.cumsum(rng.normal(0, 0.5, 30)), 2))
+    st = IndicatorState()
+    for c in closes:
+        st.push(c)
+    for tick in np.round(closes[-1] + rng.normal(0, 0.5, 50), 2):
+        st.update(tick, None)       # 與最後一根同一日期 -> 取代
+        _assert_close(st.values(), _reference(closes[:-1] + [tick]))
+
+
+def test_flat_series_rsi():
+    st = IndicatorState()
+    for _ in range(20):
+        st.push(10.0)
+    assert np.isnan(st.rsi())                  # gain / loss 皆為 0
+    for c in (10.1, 10.2, 10.3):
+        st.push(c)
+    assert st.rsi() == 100.0                   # 只有上漲
+    _assert_close(st.values(), _reference([10.0] * 20 + [10.1, 10.2, 10.3]))
+
+
+def test_seed_from_tail_matches_full_history():
+    rng = np.random.default_rng(3)
+    closes = np.round(100 + np.cumsum(rng.normal(0, 1, 80)), 2)
+    st = IndicatorState()
+    st.seed(closes[-st.size:], count=len(closes))
+    _assert_close(st.values(), _reference(closes))
+
+
+def _panel(closes_by_symbol, dates):
+    """每支股票的收盤序列（同一組日期，可有較晚上市者）靠下對齊成 Panel"""
+    T, N = len(dates), len(closes_by_symbol)
+    close = np.full((T, N), np.nan)
+    date_arr = np.full((T, N), np.datetime64('NaT'), dtype='datetime64[ns]')
+    lengths = np.zeros(N, dtype=int)
+    for j, c in enumerate(closes_by_symbol):
+        n = len(c)
+        close[T - n:, j] = c
+        date_arr[T - n:, j] = dates[T - n:]
+        lengths[j] = n
+    return Panel([f"S{j}" for j in range(N)], {'Close': close, 'Open': close}, lengths, date_arr)
+
+
+def test_book_sync_panel_matches_last_row_features():
+    rng = np.random.default_rng(11)
+    days = pd.bdate_range(end='2024-06-28', periods=60).to_numpy(dtype='datetime64[ns]')
+    full = [np.round(100 + np.cumsum(rng.normal(0, 1, 60)), 2) for _ in range(8)]
+    book = IndicatorBook()
+
+    # 模擬每天以 25 日視窗重建，盤中多次跳動後收盤
+    for end in range(30, 61):
+        window = slice(end - 25, end)
+        for tick in range(3):
+            closes = [c[window].copy() for c in full]
+            if tick < 2:
+                for c in closes:
+                    c[-1] = round(c[-1] + rng.normal(0, 0.5), 2)
+            closes[0] = closes[0][-12:]     # 資料較短的股票
+            panel = _panel(closes, days[window])
+            got = book.sync_panel(panel)
+            expected = last_row_features(panel)
+            for k in ('close', 'ma5', 'ma20', 'rsi'):
+                np.testing.assert_allclose(got[k], expected[k], rtol=1e-9, atol=1e-9, equal_nan=True)
+
+    assert book.stats['tick'] > 0 and book.stats['push'] > 0
@@ -0,0 +1,105 @@
+"""
+搜尋目標預熱測試：優先順序、前景請求時暫停、TTL 內不重複預熱
+
+執行: python -m pytest -q test_prefetch.py
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import app_v3
+from prefetch import Prefetcher
+
+
+def _stock(code):
+    return {'code': code, 'market': 'LISTED', 'name': code}
+
+
+def _prefetcher(calls, **kw):
+    warmers = {'daily': lambda s: calls.append(('daily', s['code'])),
+               'fundamentals': lambda s: calls.append(('fundamentals', s['code']))}
+    return Prefetcher(warmers, pause=0, enabled=True, **kw)
+
+
+def test_snapshot_order_and_dedupe():
+    calls = []
+    p = _prefetcher(calls, top_k=2)
+    p.record_search([_stock('9999')])
+    p.begin_foreground()                 # 先擋住，讓所有工作都進佇列後再依優先順序執行
+    snap = SimpleNamespace(smart_pick_db=[_stock('2330'), _stock('2317'), _stock('2454')],
+                           strong_stock_db=[_stock('2330'), _stock('3008')])
+    p.on_snapshot(snap)
+    p.end_foreground()
+    p.join()
+    codes = [c for _, c in calls]
+    assert codes == ['2330', '2330', '2317', '2317', '3008', '3008', '9999', '9999']
+    assert p.stats['skipped'] == 2       # 強勢表格的 2330 在 TTL 內已預熱過
+
+
+def test_waits_for_foreground_requests():
+    calls = []
+    p = _prefetcher(calls)
+    p.begin_foreground()
+    p.enqueue([_stock('2330')], 0)
+    time.sleep(0.3)
+    assert calls == []
+    p.end_foreground()
+    p.join()
+    assert len(calls) == 2
+
+
+def test_failures_are_counted():
+    def boom(stock):
+        raise RuntimeError('down')
+    p = Prefetcher({'daily': boom}, pause=0, enabled=True)
+    p.enqueue([_stock('2330')], 0)
+    p.join()
+    assert p.stats['failed'] == 1
+
+
+def test_api_requests_mark_foreground(monkeypatch):
+    seen = []
+    monkeypatch.setattr(app_v3.PREFETCHER, '_foreground', 0)
+    monkeypatch.setattr(app_v3, 'load_stock_database', lambda: {'stocks': [_stock('2330')]})
+    monkeypatch.setattr(app_v3, 'apply_cached_quotes',
+                        lambda stocks: seen.append(app_v3.PREFETCHER._foreground))
+    app_v3.app.test_client().get('/api/search?q=2330')
+    assert seen == [1] and app_v3.PREFETCHER._foreground == 0
+    assert app_v3.PREFETCHER._recent[0]['code'] == '2330'
+
+
+def test_warmed_entries_expire(monkeypatch):
+    calls = []
+    p = _prefetcher(calls, ttl=60)
+    p.enqueue([_stock('2330'), _stock('2317')], 0)
+    p.join()
+    assert len(p._warmed) == 4
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    p.enqueue([_stock('2330')], 0)
+    p.join()
+    assert len(calls) == 6                          # TTL 過後重新預熱
+    assert set(p._warmed) == {('daily', '2330'), ('fundamentals', '2330')}     # 過期項目已清除
+
+
+def test_workers_take_turns_on_runner_lock(tmp_path):
+    from file_lock import FileLock
+
+    first, second = [], []
+    a = _prefetcher(first, runner_lock=FileLock('prefetch', directory=str(tmp_path)))
+    b = _prefetcher(second, runner_lock=FileLock('prefetch', directory=str(tmp_path)))
+    other = FileLock('prefetch', directory=str(tmp_path))
+    assert other.acquire()                          # 另一個 worker 正在預熱
+    a.enqueue([_stock('2330')], 0)
+    b.enqueue([_stock('2317')], 0)
+    time.sleep(0.5)
+    assert first == [] and second == []             # 等待鎖，不同時發出請求
+
+    other.release()
+    a.join()
+    b.join()
+    # 各 worker 的目標都會被預熱，鎖在每項工作後釋放
+    assert first == [('daily', '2330'), ('fundamentals', '2330')]
+    assert second == [('daily', '2317'), ('fundamentals', '2317')]
+    assert not a.runner_lock.held and not b.runner_lock.held
@@ -0,0 +1,158 @@
+"""
+報價來源測試：以本地 stub server 回放錄製好的 TWSE / TPEX 全市場報表
+
+執行: python -m pytest -q test_quote_sources.py
+"""
+import os
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import http_cache
+from quote_sources import ExchangeBulkSource, ExchangeRealtimeSource, QuoteSource, fetch_quotes, parse_table_date
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_fixtures')
+
+ROUTES = {
+    '/twse': 'twse_stock_day_all.json',
+    '/tpex': 'tpex_daily_close.json',
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.hits.append(path)
+        name = ROUTES.get(path)
+        if not name:
+            self.send_response(404)
+            self.end_headers()
+            return
+        with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, 'CACHE_DIR', str(tmp_path / 'http'))
+    _StubHandler.hits = []
+    srv = HTTPServer(('127.0.0.1', 0), _StubHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+STOCKS = [
+    {'code': '2330', 'name': '台積電', 'market': 'LISTED'},
+    {'code': '2317', 'name': '鴻海',   'market': 'LISTED'},
+    {'code': '1101', 'name': '台泥',   'market': 'LISTED'},
+    {'code': '6415', 'name': '矽力-KY', 'market': 'OTC'},
+    {'code': '3105', 'name': '穩懋',   'market': 'OTC'},
+    {'code': '8299', 'name': '群聯',   'market': 'OTC'},
+]
+
+
+FIXTURE_DATE = '20260211'
+
+
+def _exchange(server, twse='/twse', tpex='/tpex', expected_date=FIXTURE_DATE):
+    return ExchangeBulkSource(twse_url=f"{server}{twse}", tpex_url=f"{server}{tpex}", expected_date=expected_date)
+
+
+def test_exchange_source_parses_both_markets(stub_server):
+    src = _exchange(stub_server)
+    quotes = src.fetch(STOCKS)
+
+    assert quotes['2330.TW'] == {
+        'close': 1060.0, 'open': 1055.0, 'prev_close': 1045.0,
+        'change_pct': 1.44, 'volume': 31245678,
+    }
+    assert quotes['2317.TW']['prev_close'] == 218.5
+    assert quotes['2317.TW']['change_pct'] == -0.92
+    assert quotes['6415.TWO'] == {
+        'close': 412.5, 'open': 420.0, 'prev_close': 420.0,
+        'change_pct': -1.79, 'volume': 1234567,
+    }
+    assert quotes['3105.TWO']['change_pct'] == 2.99
+    # 無成交的股票不回傳，交給下一個來源
+    assert '1101.TW' not in quotes
+    assert '8299.TWO' not in quotes
+    # 每個市場只發一次請求
+    assert sorted(_StubHandler.hits) == ['/tpex', '/twse']
+
+
+def test_exchange_source_uses_cache(stub_server):
+    src = _exchange(stub_server)
+    src.fetch(STOCKS)
+    src.fetch(STOCKS)
+    assert len(_StubHandler.hits) == 2
+
+
+def test_fetch_quotes_falls_back_for_missing(stub_server):
+    class FakeYahoo(QuoteSource):
+        name = 'yahoo'
+        asked = []
+
+        def fetch(self, stocks):
+            self.asked.extend(s['code'] for s in stocks)
+            return {'1101.TW': {'close': 40.0, 'open': 40.0, 'prev_close': 40.0,
+                                'change_pct': 0.0, 'volume': 0}}
+
+    src = _exchange(stub_server)
+    yahoo = FakeYahoo()
+    quotes, used = fetch_quotes(STOCKS, [src, yahoo])
+
+    assert sorted(yahoo.asked) == ['1101', '8299']
+    assert used == {'exchange': 4, 'yahoo': 1}
+    assert len(quotes) == 5
+
+
+def test_exchange_source_failure_is_not_fatal(stub_server):
+    src = _exchange(stub_server, twse="/missing")
+    quotes = src.fetch(STOCKS)
+    assert '2330.TW' not in quotes
+    assert '6415.TWO' in quotes
+
+
+def test_table_date_formats():
+    assert parse_table_date('20260211') == '20260211'
+    assert parse_table_date('115/02/11') == '20260211'
+    assert parse_table_date('2026/02/11') == '20260211'
+    assert parse_table_date(None) is None
+
+
+def test_stale_table_falls_back_to_next_source(stub_server):
+    class FakeYahoo(QuoteSource):
+        name = 'yahoo'
+
+        def fetch(self, stocks):
+            self.asked = [s['code'] for s in stocks]
+            return {}
+
+    # 收盤資料尚未公布：報表仍是前一交易日，整個市場交給下一個來源
+    src = _exchange(stub_server, expected_date='20260212')
+    yahoo = FakeYahoo()
+    quotes, used = fetch_quotes(STOCKS, [src, yahoo])
+    assert used['exchange'] == 0 and not quotes
+    assert len(yahoo.asked) == len(STOCKS)
+    assert set(src.failures.values()) == {'stale_table'}
+
+
+def test_mis_last_price_never_uses_bid():
+    last = ExchangeRealtimeSource._last_price
+    assert last({'z': '1060.0000', 'b': '1055.0000_', 'y': '1045.0000', 'v': '1200'}) == 1060.0
+    # 今日尚未成交：以昨收代替
+    assert last({'z': '-', 'b': '1040.0000_', 'y': '1045.0000', 'v': '0'}) == 1045.0
+    # 已成交但快照缺成交價：不猜，交給下一個來源
+    assert last({'z': '-', 'b': '1055.0000_', 'y': '1045.0000', 'v': '1200'}) is None
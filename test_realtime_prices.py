@@ -0,0 +1,124 @@
+"""
+即時校準測試：向量化的 _last_two_closes / fetch_realtime_prices 與原本逐支迴圈結果一致
+
+執行: python -m pytest -q test_realtime_prices.py
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app_v3
+
+
+def legacy_fetch_realtime_prices(stocks, df):
+    """改寫前的逐支迴圈（下載結果由參數傳入），作為比對基準"""
+    symbols = [app_v3._yahoo_symbol(s) for s in stocks]
+    sym_to_code = {sym: s['code'] for sym, s in zip(symbols, stocks)}
+    for sym in symbols:
+        try:
+            sub = df[sym] if sym in df.columns.get_level_values(0) else None
+            if sub is None or sub.empty:
+                continue
+            sub = sub.dropna(how='all')
+            if sub.empty:
+                continue
+            latest = sub.iloc[-1]
+            current_price = round(float(latest['Close']), 2)
+            if len(sub) >= 2:
+                prev_close = float(sub.iloc[-2]['Close'])
+            else:
+                s_obj = next((x for x in stocks if x['code'] == sym_to_code[sym]), None)
+                if not s_obj:
+                    continue
+                prev_close = s_obj['price'] / (1 + s_obj['change_pct'] / 100)
+            change_pct = round(((current_price - prev_close) / prev_close) * 100, 2)
+            volume = int(latest['Volume']) if 'Volume' in latest else 0
+            for s in stocks:
+                if s['code'] == sym_to_code[sym]:
+                    s['price'] = current_price
+                    s['change_pct'] = change_pct
+                    if volume > 0:
+                        s['volume'] = volume
+        except Exception:
+            continue
+    return stocks
+
+
+def _download_frame(symbols, n_days, seed):
+    """模擬 yf.download(group_by='ticker')：部分股票某些日子整列缺值"""
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range('2026-02-09', periods=n_days, freq='D')
+    frames = {}
+    for sym in symbols:
+        close = rng.uniform(10, 500, n_days).round(2)
+        volume = rng.integers(0, 5, n_days) * 1000.0
+        df = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': volume}, index=idx)
+        df[rng.random(n_days) < 0.3] = np.nan
+        frames[sym] = df
+    return pd.concat(frames, axis=1)
+
+
+def _stocks(n, seed):
+    rng = np.random.default_rng(seed)
+    return [{'code': f"{1000 + i}", 'market': 'LISTED' if i % 3 else 'OTC',
+             'price': round(float(rng.uniform(10, 500)), 2), 'change_pct': round(float(rng.uniform(-9, 9)), 2),
+             'volume': 100} for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(app_v3, '_realtime_cache', {})
+
+
+@pytest.mark.parametrize('seed,n_days', [(1, 2), (2, 2), (3, 3), (4, 5)])
+def test_matches_legacy_loop(monkeypatch, seed, n_days):
+    stocks = _stocks(60, seed)
+    df = _download_frame([app_v3._yahoo_symbol(s) for s in stocks], n_days, seed)
+    monkeypatch.setattr(app_v3.yf, 'download', lambda *a, **k: df)
+
+    expected = legacy_fetch_realtime_prices(copy.deepcopy(stocks), df)
+    got = app_v3.fetch_realtime_prices(copy.deepcopy(stocks))
+    assert got == expected
+
+
+def test_last_two_closes_skips_missing_rows():
+    df = _download_frame(['A', 'B'], 3, 0)
+    df.loc[df.index[1], 'A'] = np.nan          # A：中間缺一天
+    df.loc[df.index[:], 'B'] = np.nan          # B：完全沒有資料
+    last, prev, volume, n_valid = app_v3._last_two_closes(df, ['A', 'B'])
+    closes = df['A']['Close']
+    assert (last[0], prev[0], n_valid[0]) == (closes.iloc[2], closes.iloc[0], 2)
+    assert n_valid[1] == 0 and np.isnan(last[1])
+
+
+def test_single_row_with_minus_100_percent_is_skipped(monkeypatch):
+    stocks = [{'code': '1000', 'market': 'OTC', 'price': 10.0, 'change_pct': -100.0, 'volume': 0},
+              {'code': '1001', 'market': 'LISTED', 'price': 10.0, 'change_pct': 0.0, 'volume': 0}]
+    df = _download_frame([app_v3._yahoo_symbol(s) for s in stocks], 2, 0)
+    df.iloc[0] = np.nan                         # 兩支都只剩一筆
+    monkeypatch.setattr(app_v3.yf, 'download', lambda *a, **k: df)
+
+    got = app_v3.fetch_realtime_prices(copy.deepcopy(stocks))
+    assert got[0] == stocks[0]                  # 無法逆推昨收：維持資料庫報價
+    assert got[1]['price'] == round(float(df['1001.TW']['Close'].iloc[1]), 2)
+    assert got[1]['change_pct'] == pytest.approx((got[1]['price'] - 10.0) / 10.0 * 100, abs=0.01)
+
+
+def test_apply_cached_quotes_skips_stale_entries(monkeypatch):
+    now = 1_800_000_000.0
+    monkeypatch.setattr(app_v3.time, 'time', lambda: now)
+    fresh_after = app_v3.datetime.fromtimestamp(now - 30).isoformat(timespec='seconds')
+    app_v3._realtime_cache.update({
+        '1000.TW':  {'price': 11.0, 'change_pct': 1.0, 'volume': 5, 'ts': now - 10},
+        '1001.TW':  {'price': 12.0, 'change_pct': 2.0, 'volume': 5, 'ts': now - app_v3.REALTIME_FRESH_SECONDS - 1},
+        '1002.TW':  {'price': 13.0, 'change_pct': 3.0, 'volume': 5, 'ts': now - 40},
+    })
+    stocks = [{'code': '1000', 'market': 'LISTED', 'price': 10.0, 'change_pct': 0.0, 'volume': 1},
+              {'code': '1001', 'market': 'LISTED', 'price': 10.0, 'change_pct': 0.0, 'volume': 1},
+              # 資料庫記錄比快取報價新：以資料庫為準
+              {'code': '1002', 'market': 'LISTED', 'price': 10.0, 'change_pct': 0.0, 'volume': 1,
+               'updated_at': fresh_after}]
+    assert app_v3.apply_cached_quotes(stocks) == 1
+    assert [s['price'] for s in stocks] == [11.0, 10.0, 10.0]
@@ -0,0 +1,136 @@
+"""
+規則引擎測試：運算式編譯，以及 strategy_rules.json 的 smart_pick 與原本寫死的評分邏輯一致
+
+執行: python -m pytest -q test_rules.py
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from rules import RuleError, Strategy, compile_expr, get_strategy
+
+
+def test_chained_compare_and_nan():
+    env = {'price': np.array([12.0, 10.0, np.nan, 12.0]),
+           'ma5': np.array([11.0, 11.0, 11.0, np.nan]),
+           'ma20': np.array([10.0, 10.0, 10.0, 10.0])}
+    mask = compile_expr('price > ma5 > ma20')(env)
+    assert mask.tolist() == [True, False, False, False]
+
+
+def test_boolean_arithmetic_and_functions():
+    env = {'a': np.array([1.0, -3.0, 5.0]), 'b': np.array([2.0, 2.0, 2.0]), 'k': 2}
+    assert compile_expr('abs(a) * k > b + 1')(env).tolist() == [False, True, True]
+    assert compile_expr('not (a > 0) or max(a, b) >= 5')(env).tolist() == [False, True, True]
+
+
+@pytest.mark.parametrize('expr', ['__import__("os")', 'a.b', 'a[0]', 'lambda: 1', 'a if b else c', '"x" > a'])
+def test_rejects_unsupported_syntax(expr):
+    with pytest.raises(RuleError):
+        compile_expr(expr)
+
+
+def test_unknown_name_raises():
+    fn = compile_expr('foo > 1')
+    with pytest.raises(RuleError):
+        fn({'bar': np.zeros(3)})
+
+
+def _legacy_smart_pick(s):
+    """run_full_sync 原本寫死的智慧推薦評分"""
+    tech = s['tech']
+    price, ma5, ma20, rsi = tech['close'], tech['ma5'], tech['ma20'], tech['rsi']
+    score = s['strong_score'] + 2
+    reasons = [f"跑贏大盤 ({s['alpha']:+.2f}%)", s['reasons'][0]]
+    if price > ma5 > ma20:
+        score += 3
+        reasons.append("均線多頭排列")
+    if 55 <= rsi <= 80:
+        score += 2
+        reasons.append(f"RSI 強勢範疇 ({rsi:.1f})")
+    return (score, reasons) if score >= 6 else None
+
+
+def test_smart_pick_rules_match_legacy_scoring():
+    rng = np.random.default_rng(0)
+    strong_db = []
+    for i in range(300):
+        close = float(rng.uniform(10, 100))
+        strong_db.append({
+            'alpha': float(rng.normal(2, 2)), 'strong_score': int(rng.integers(1, 8)),
+            'reasons': [f"📈 連續高過前 {i} 日實體高點"],
+            'tech': {'close': close,
+                     'ma5': close * float(rng.uniform(0.9, 1.05)),
+                     'ma20': float('nan') if i % 17 == 0 else close * float(rng.uniform(0.85, 1.05)),
+                     'rsi': float(rng.choice([rng.uniform(30, 95), 55.0, 80.0]))},
+        })
+
+    smart = get_strategy('smart_pick').evaluate({
+        'price':         np.array([s['tech']['close'] for s in strong_db]),
+        'ma5':           np.array([s['tech']['ma5'] for s in strong_db]),
+        'ma20':          np.array([s['tech']['ma20'] for s in strong_db]),
+        'rsi':           np.array([s['tech']['rsi'] for s in strong_db]),
+        'strong_score':  np.array([s['strong_score'] for s in strong_db], dtype=float),
+        'alpha':         np.array([s['alpha'] for s in strong_db]),
+        'strong_reason': np.array([s['reasons'][0] for s in strong_db], dtype=object),
+    })
+    for i, s in enumerate(strong_db):
+        expected = _legacy_smart_pick(s)
+        assert bool(smart.passed[i]) == (expected is not None)
+        if expected:
+            assert (smart.score_of(i), smart.reasons(i)) == expected
+
+
+def test_user_strategy_from_file(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'strategies': {'cheap_volume': {
+        'params': {'max_price': 50},
+        'rules': [
+            {'name': 'cheap', 'when': 'price <= max_price', 'required': True},
+            {'name': 'liquid', 'when': 'volume >= 1000', 'weight': 1.5, 'reason': '量 {volume:.0f}'},
+        ],
+        'threshold': 1,
+    }}}), encoding='utf-8')
+
+    st = get_strategy('cheap_volume', path=str(path))
+    res = st.evaluate({'price': np.array([30.0, 30.0, 80.0]), 'volume': np.array([2000.0, 10.0, 5000.0])})
+    assert res.passed.tolist() == [True, False, False]
+    assert res.score_of(0) == 1.5
+    assert res.reasons(0) == ['量 2000']
+    # 參數覆寫
+    assert st.evaluate({'price': np.array([80.0]), 'volume': np.array([5000.0])},
+                       params={'max_price': 100}).passed.tolist() == [True]
+
+
+def test_invalid_rule_file_is_rejected():
+    with pytest.raises(RuleError):
+        Strategy('bad', {'rules': [{'when': 'price >'}]})
+
+
+def test_broken_reload_keeps_last_good_strategies(tmp_path, capsys):
+    path = tmp_path / 'rules.json'
+
+    def write(text, mtime):
+        path.write_text(text, encoding='utf-8')
+        os.utime(path, (mtime, mtime))
+
+    spec = {'strategies': {'cheap': {'rules': [{'name': 'cheap', 'when': 'price <= 50', 'required': True}]}}}
+    write(json.dumps(spec), 1000)
+    good = get_strategy('cheap', path=str(path))
+
+    # 存檔到一半 / 語法錯誤：沿用上一版，錯誤只記錄一次
+    write('{"strategies": {"cheap": {"rules": [{"when": "price >"}]}}}', 2000)
+    assert get_strategy('cheap', path=str(path)) is good
+    assert get_strategy('cheap', path=str(path)) is good
+    assert capsys.readouterr().out.count('載入失敗') == 1
+
+    spec['strategies']['cheap']['rules'][0]['when'] = 'price <= 80'
+    write(json.dumps(spec), 3000)
+    fixed = get_strategy('cheap', path=str(path))
+    assert fixed is not good
+    assert fixed.evaluate({'price': np.array([70.0])}).passed.tolist() == [True]
+
+    with pytest.raises(RuleError):
+        get_strategy('cheap', path=str(tmp_path / 'missing.json'))
@@ -0,0 +1,106 @@
+"""
+/api/screen 分頁、欄位選擇與排序測試
+
+執行: python -m pytest -q test_screen_api.py
+"""
+import pytest
+
+import app_v3
+from test_api_response import make_snapshot
+
+
+@pytest.fixture
+def client(monkeypatch):
+    snap = make_snapshot('v1')
+    monkeypatch.setattr(app_v3, 'get_or_update_snapshot', lambda filters, deadline=None: snap)
+    app_v3.app.config['TESTING'] = True
+    client = app_v3.app.test_client()
+    client.snap = snap
+    return client
+
+
+def _legacy(snap):
+    """原本 /api/screen 的組法"""
+    fmt = app_v3.format_screen_row
+    return {
+        'listed_stocks': [fmt(s) for s in snap.outperformer_db if s['market'] == 'LISTED'],
+        'otc_stocks': [fmt(s) for s in snap.outperformer_db if s['market'] == 'OTC'],
+        'listed_all': sorted([fmt(s) for s in snap.base_pool if s['market'] == 'LISTED'],
+                             key=lambda x: x['daily_change_pct'], reverse=True),
+        'otc_all': sorted([fmt(s) for s in snap.base_pool if s['market'] == 'OTC'],
+                          key=lambda x: x['daily_change_pct'], reverse=True),
+    }
+
+
+def test_default_output_unchanged(client):
+    body = client.post('/api/screen', json={'min_price': 10}).get_json()
+    for name, rows in _legacy(client.snap).items():
+        assert body[name] == rows
+    assert 'page' not in body
+    assert body['stats']['listed_outperformers'] == len(body['listed_stocks'])
+
+
+def test_offset_limit_fields(client):
+    full = client.post('/api/screen', json={}).get_json()
+    body = client.post('/api/screen', json={'offset': 10, 'limit': 20, 'fields': 'symbol,daily_change_pct'}).get_json()
+    assert body['listed_all'] == [{'symbol': r['symbol'], 'daily_change_pct': r['daily_change_pct']}
+                                  for r in full['listed_all'][10:30]]
+    assert body['page']['totals']['listed_all'] == len(full['listed_all'])
+    # stats 仍為整體數量
+    assert body['stats'] == full['stats']
+
+
+@pytest.mark.parametrize('key,field', [('volume', 'volume'), ('market_cap', 'market_cap'),
+                                       ('change_pct', 'daily_change_pct')])
+def test_sort_keys(client, key, field):
+    body = client.post('/api/screen', json={'sort': key, 'limit': 50}).get_json()
+    values = [r[field] for r in body['otc_all']]
+    assert len(values) == 50 and values == sorted(values, reverse=True)
+
+
+def test_sort_by_alpha_uses_market_index(client):
+    body = client.post('/api/screen', json={'sort': 'alpha', 'fields': ['symbol', 'daily_change_pct', 'market']}).get_json()
+    alphas = [r['daily_change_pct'] - (0.5 if r['market'] == 'LISTED' else 0.3) for r in body['listed_all']]
+    assert alphas == sorted(alphas, reverse=True)
+
+
+def test_sort_only_request_reports_page(client):
+    body = client.post('/api/screen', json={'sort': 'volume'}).get_json()
+    assert body['page']['sort'] == 'volume' and body['page']['limit'] is None
+    assert body['page']['totals']['otc_all'] == len(body['otc_all'])
+    volumes = [r['volume'] for r in body['otc_all']]
+    assert volumes == sorted(volumes, reverse=True)
+
+
+def test_orderings_are_cached_per_snapshot(client):
+    client.post('/api/screen', json={'sort': 'volume', 'limit': 5})
+    rows = client.snap._screen_rows[('listed_all', 'volume')]
+    client.post('/api/screen', json={'sort': 'volume', 'offset': 5, 'limit': 5})
+    assert client.snap._screen_rows[('listed_all', 'volume')] is rows
+
+
+@pytest.mark.parametrize('body', [{'sort': 'price'}, {'fields': 'symbol,foo'}, {'limit': 0}, {'offset': -1},
+                                  {'limit': 'abc'}])
+def test_invalid_page_params(client, body):
+    assert client.post('/api/screen', json=body).status_code == 400
+
+
+def test_invalid_params_are_rejected_before_etag_check(client):
+    # ETag 只看快照版本與請求內容，錯誤參數即使帶著相符的 If-None-Match 也要回 400
+    body = {'limit': 0}
+    etag = app_v3.make_etag('screen', client.snap.version, app_v3.json.dumps(body).encode())
+    resp = client.post('/api/screen', data=app_v3.json.dumps(body), content_type='application/json',
+                       headers={'If-None-Match': etag})
+    assert resp.status_code == 400
+    # 同樣的算法對合法請求確實會得到 304
+    body = {'limit': 5}
+    etag = app_v3.make_etag('screen', client.snap.version, app_v3.json.dumps(body).encode())
+    resp = client.post('/api/screen', data=app_v3.json.dumps(body), content_type='application/json',
+                       headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+
+@pytest.mark.parametrize('url', ['/api/screen', '/api/strong', '/api/recommend'])
+def test_invalid_filters_return_400(client, url):
+    assert client.post(url, json={'min_price': 'abc'}).status_code == 400
+    assert client.post(url, data='[1]', content_type='application/json').status_code == 400
@@ -0,0 +1,112 @@
+"""
+/api/search 平行資料補充測試：以假的資料來源模擬成功、失敗與逾時
+
+執行: python -m pytest -q test_search_enrich.py
+"""
+import time
+
+import pytest
+
+import app_v3
+
+STOCKS = [
+    {'code': '2330', 'name': '台積電', 'market': 'LISTED', 'price': 1000.0},
+    {'code': '6415', 'name': '矽力-KY', 'market': 'OTC', 'price': 400.0},
+]
+
+
+@pytest.fixture
+def fake_parts(monkeypatch):
+    calls = []
+
+    def fast(stock, symbol, deadline):
+        calls.append(symbol)
+        time.sleep(0.05)
+        return {'chart_data_daily': [{'time': '2024-06-28', 'close': stock['price']}], 'volume_data_daily': []}
+
+    def slow(stock, symbol, deadline):
+        time.sleep(0.2 if stock['code'] == '2330' else 3)
+        return {'institutional_history': [{'date': '20240628'}]}
+
+    def broken(stock, symbol, deadline):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(app_v3, 'SEARCH_PARTS', {
+        'daily':         (fast,   {'chart_data_daily': [], 'volume_data_daily': []}),
+        'institutional': (slow,   {'institutional_history': []}),
+        'holders':       (broken, {'institutional_holders': None}),
+    })
+    return calls
+
+
+def test_parts_run_concurrently_and_merge(fake_parts):
+    start = time.time()
+    results, partial = app_v3.enrich_search_results(STOCKS, deadline=app_v3.Deadline(1.0), call_timeout=0.5)
+    elapsed = time.time() - start
+
+    assert elapsed < 1.5                         # 不必等 3 秒的慢呼叫
+    assert sorted(fake_parts) == ['2330.TW', '6415.TWO']
+    assert partial is True
+
+    tsmc, sily = results
+    assert tsmc['chart_data_daily'][0]['close'] == 1000.0
+    assert tsmc['institutional_history'] == [{'date': '20240628'}]
+    assert tsmc['partial_parts'] == ['holders']
+    # 逾時與失敗的部分保留預設值
+    assert sily['institutional_history'] == []
+    assert sily['institutional_holders'] is None
+    assert sily['partial_parts'] == ['holders', 'institutional']
+    # 原本的欄位保留、不改到輸入
+    assert sily['price'] == 400.0 and 'chart_data_daily' not in STOCKS[1]
+
+
+def test_not_partial_when_everything_finishes(monkeypatch):
+    monkeypatch.setattr(app_v3, 'SEARCH_PARTS', {
+        'info': (lambda s, sym, deadline: {'shares_outstanding': 1}, {'shares_outstanding': 0}),
+    })
+    results, partial = app_v3.enrich_search_results(STOCKS)
+    assert partial is False
+    assert all(r['shares_outstanding'] == 1 and 'partial_parts' not in r for r in results)
+
+
+def test_parts_get_request_deadline(monkeypatch):
+    """每個 part 拿到的期限 = min(單一呼叫上限, 請求剩餘時間)，並一路傳到底層抓取函式"""
+    seen = {}
+
+    def fake_bars(symbol, *args, deadline=None, **kwargs):
+        seen[symbol] = deadline.remaining()
+        raise app_v3.DeadlineExceeded('timeout')
+
+    monkeypatch.setattr(app_v3, 'fetch_daily_bars', fake_bars)
+    monkeypatch.setattr(app_v3, 'SEARCH_PARTS', {'daily': app_v3.SEARCH_PARTS['daily']})
+    results, partial = app_v3.enrich_search_results(STOCKS, deadline=app_v3.Deadline(0.5), call_timeout=5)
+    assert partial is True and all(r['partial_parts'] == ['daily'] for r in results)
+    assert set(seen) == {'2330.TW', '6415.TWO'} and all(0 < v <= 0.5 for v in seen.values())
+
+
+def test_partial_institutional_history_is_flagged(monkeypatch):
+    def fake_history(code, market, n_days=30, deadline=None):
+        deadline.mark_partial('institutional')
+        return [{'date': '20240628'}]
+
+    monkeypatch.setattr(app_v3, 'fetch_institutional_history', fake_history)
+    monkeypatch.setattr(app_v3, 'SEARCH_PARTS', {'institutional': app_v3.SEARCH_PARTS['institutional']})
+    results, partial = app_v3.enrich_search_results(STOCKS[:1], deadline=app_v3.Deadline(1.0))
+    assert partial is True and results[0]['partial_parts'] == ['institutional']
+    assert results[0]['institutional_history'] == [{'date': '20240628'}]    # 已抓到的部分照用
+
+
+def test_holders_part_reads_fundamentals_once(monkeypatch):
+    calls = []
+
+    def fake_fundamentals(symbol, max_age_days=None, deadline=None):
+        calls.append(symbol)
+        return {'shares_outstanding': 10, 'float_shares': 8, 'institutional_holders': [{'Holder': 'A'}],
+                'sector': 'Technology'}
+
+    monkeypatch.setattr(app_v3, 'get_fundamentals', fake_fundamentals)
+    monkeypatch.setattr(app_v3, 'SEARCH_PARTS', {'holders': app_v3.SEARCH_PARTS['holders']})
+    results, partial = app_v3.enrich_search_results(STOCKS[:1])
+    assert partial is False and calls == ['2330.TW']
+    assert {k: results[0][k] for k in ('shares_outstanding', 'float_shares', 'institutional_holders')} == \
+        {'shares_outstanding': 10, 'float_shares': 8, 'institutional_holders': [{'Holder': 'A'}]}
@@ -0,0 +1,82 @@
+"""
+股票清單快取測試：差異比對、代碼表指紋、只在代碼表變動時重建
+
+執行: python -m pytest -q test_stock_universe.py
+"""
+import os
+
+import pytest
+
+import stock_universe as su
+
+OLD = [
+    {'code': '1101', 'name': '台泥', 'market': 'LISTED'},
+    {'code': '2330', 'name': '台積電', 'market': 'LISTED'},
+    {'code': '6415', 'name': '矽力', 'market': 'OTC'},
+]
+NEW = [
+    {'code': '2330', 'name': '台積電', 'market': 'LISTED'},
+    {'code': '6415', 'name': '矽力-KY', 'market': 'LISTED'},
+    {'code': '7769', 'name': '鴻勁', 'market': 'LISTED'},
+]
+
+
+def test_diff_universe():
+    diff = su.diff_universe(OLD, NEW)
+    assert [s['code'] for s in diff['listed']] == ['7769']
+    assert [s['code'] for s in diff['delisted']] == ['1101']
+    assert diff['transferred'] == [{'code': '6415', 'name': '矽力-KY', 'from': 'OTC', 'to': 'LISTED'}]
+    assert diff['renamed'] == [{'code': '6415', 'from': '矽力', 'to': '矽力-KY'}]
+    assert not any(su.diff_universe(NEW, NEW).values())
+
+
+@pytest.fixture
+def codes(tmp_path, monkeypatch):
+    """假的 twstock 代碼表與 build_universe"""
+    files = [tmp_path / 'twse_equities.csv', tmp_path / 'tpex_equities.csv']
+    for f in files:
+        f.write_text('code,name\n', encoding='utf-8')
+    built = []
+    current = {'stocks': OLD}
+
+    def build():
+        built.append(1)
+        return current['stocks']
+
+    monkeypatch.setattr(su, '_twstock_code_files', lambda: [str(f) for f in files])
+    monkeypatch.setattr(su, 'build_universe', build)
+    return files, built, current
+
+
+def test_fingerprint_follows_code_tables(codes):
+    files, _, _ = codes
+    before = su.twstock_fingerprint()
+    assert su.twstock_fingerprint() == before
+    files[1].write_text('code,name\n7769,鴻勁\n', encoding='utf-8')
+    assert su.twstock_fingerprint() != before
+
+
+def test_rebuild_only_when_fingerprint_changes(codes, tmp_path):
+    files, built, current = codes
+    path = str(tmp_path / 'universe.json')
+
+    stocks, diff = su.get_universe(path=path)
+    assert stocks == OLD and diff is None and len(built) == 1
+    assert su.get_universe(path=path) == (OLD, None) and len(built) == 1     # 代碼表未變：讀快取
+
+    current['stocks'] = NEW
+    files[0].write_text('code,name\n7769,鴻勁\n', encoding='utf-8')
+    stocks, diff = su.get_universe(path=path)
+    assert stocks == NEW and len(built) == 2
+    assert [s['code'] for s in diff['listed']] == ['7769']
+    artifact = su.load_universe_artifact(path)
+    assert artifact['version'] == 2 and artifact['history'][0]['version'] == 2
+
+
+def test_default_location_is_cache_dir(codes, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    su._save_artifact({'version': 1, 'fingerprint': 'x', 'stocks': OLD}, su.LEGACY_UNIVERSE_FILE)
+    assert su.load_universe_artifact()['stocks'] == OLD                    # 舊位置的檔案仍可讀
+    su.get_universe()
+    assert os.path.exists(su.UNIVERSE_FILE)
+    assert su.load_universe_artifact()['version'] == 2
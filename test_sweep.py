@@ -0,0 +1,83 @@
+"""
+參數掃描測試：共享記憶體、參數展開、續跑
+
+執行: python -m pytest -q test_sweep.py
+"""
+import json
+
+import numpy as np
+import pytest
+
+import backtest
+import sweep
+from test_backtest import _random_history
+
+
+def test_shared_arrays_roundtrip_without_copy():
+    arrays = {'a': np.arange(12, dtype=float).reshape(3, 4), 'm': np.array([True, False])}
+    blocks, specs = sweep.share_arrays(arrays)
+    try:
+        attached_blocks, attached = sweep.attach_arrays(specs)
+        np.testing.assert_array_equal(attached['a'], arrays['a'])
+        attached['a'][0, 0] = -1           # 同一塊記憶體：另一端看得到修改
+        _, again = sweep.attach_arrays(specs)
+        assert again['a'][0, 0] == -1
+        for shm in attached_blocks:
+            shm.close()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def test_split_params():
+    filters, limit, params = sweep.split_params(
+        {'min_price': 20, 'candidate_limit': 50, 'smart_pick.rsi_low': 50, 'smart_pick.min_score': 7})
+    assert filters == {'min_price': 20}
+    assert limit == 50
+    assert params == {'smart_pick': {'rsi_low': 50, 'min_score': 7}}
+    assert len(sweep.expand_grid({'a': [1, 2], 'b': [3, 4, 5]})) == 6
+
+
+def test_sweep_matches_direct_replay_and_resumes(tmp_path):
+    hist = _random_history(seed=3)
+    hist_path = str(tmp_path / 'daily.npz')
+    hist.save(hist_path)
+    results = str(tmp_path / 'results.jsonl')
+    grid = {'min_price': [10, 40], 'smart_pick.min_score': [5, 8]}
+
+    rows = sweep.run_sweep(grid, history_path=hist_path, results_path=results, workers=2)
+    assert len(rows) == 4
+
+    feats = backtest.compute_features(backtest.History.load(hist_path))
+    masks = backtest.replay(feats, {'min_price': 40}, strategy_params={'smart_pick': {'min_score': 8}})
+    expected = backtest.summarize(feats, masks, hist.dates)
+    row = next(r for r in rows if r['params'] == {'min_price': 40, 'smart_pick.min_score': 8})
+    assert row['metrics']['smart.picks'] == expected['layers']['smart']['picks']
+    assert row['metrics']['strong.picks'] == expected['layers']['strong']['picks']
+
+    # 模擬中斷：最後一行寫到一半，重跑只補做缺少的組合（第一行是掃描條件）
+    lines = open(results, encoding='utf-8').read().splitlines()
+    assert json.loads(lines[0])['context']['history'] == sweep.history_fingerprint(hist_path)
+    with open(results, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines[:4]) + '\n' + lines[4][:20])
+    assert len(sweep.load_results(results)) == 3
+    rows = sweep.run_sweep(grid, history_path=hist_path, results_path=results, workers=2)
+    assert len(rows) == 4
+    keys = [json.loads(l).get('key') for l in open(results, encoding='utf-8') if l.strip().endswith('}')]
+    assert len(set(keys) - {None}) == 4
+
+
+def test_sweep_refuses_to_resume_with_different_context(tmp_path):
+    hist_path = str(tmp_path / 'daily.npz')
+    _random_history(seed=3).save(hist_path)
+    results = str(tmp_path / 'results.jsonl')
+    grid = {'min_price': [10]}
+    sweep.run_sweep(grid, history_path=hist_path, results_path=results, workers=1)
+
+    with pytest.raises(ValueError):
+        sweep.run_sweep(grid, start='2024-01-01', history_path=hist_path, results_path=results, workers=1)
+
+    _random_history(seed=4).save(hist_path)                 # 重建歷史資料
+    with pytest.raises(ValueError):
+        sweep.run_sweep(grid, history_path=hist_path, results_path=results, workers=1)
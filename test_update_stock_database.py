@@ -0,0 +1,202 @@
+"""
+資料庫更新測試：自適應批次、股本快取、checkpoint 接續與完成清理、盤中增量更新
+
+執行: python -m pytest -q test_update_stock_database.py
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import update_stock_database as usd
+from quote_sources import QuoteSource
+
+
+def _quote(close):
+    return {'close': close, 'open': close, 'prev_close': close, 'change_pct': 0.0, 'volume': 1000}
+
+
+def test_adaptive_batcher_shrinks_and_grows():
+    b = usd.AdaptiveBatcher(size=50, min_size=10, max_size=100, target_seconds=8)
+    assert b.record(50, 3, 20) == 25           # 失敗率 > 20%：減半
+    assert b.record(25, 10, 0) == 18           # 太慢：縮為 3/4
+    assert b.record(18, 2, 0) == 23            # 又快又穩：放大
+    for _ in range(20):
+        b.record(10, 30, 10)
+    assert b.next_size() == 10                 # 不低於下限
+    for _ in range(20):
+        b.record(10, 1, 0)
+    assert b.next_size() == 100                # 不超過上限
+
+
+def test_run_batches_follows_batcher_and_records_failures(monkeypatch):
+    sizes = []
+
+    def fake_download(batch):
+        sizes.append(len(batch))
+        prices = {usd.symbol_for(s): _quote(10.0) for s in batch if s['code'] != '0002'}
+        return prices, {}, {'0002.TW': 'no_data'} if len(prices) < len(batch) else {}
+
+    monkeypatch.setattr(usd, 'batch_download', fake_download)
+    stocks = [{'code': f"{i:04d}", 'market': 'LISTED'} for i in range(40)]
+    batcher = usd.AdaptiveBatcher(size=10, min_size=5, max_size=20, target_seconds=8)
+    failures, saved = {}, []
+
+    class FakeCheckpoint:
+        def save_prices(self, prices):
+            saved.append(len(prices))
+
+    results, failed = usd._run_batches(stocks, batcher, usd.Progress(len(stocks)), workers=1,
+                                       checkpoint=FakeCheckpoint(), failures=failures)
+    assert len(results) == 39 and [s['code'] for s in failed] == ['0002']
+    assert failures == {'0002.TW': 'no_data'}
+    # 第一批失敗率 10%：維持大小；之後快速且全數成功的批次逐步放大
+    assert sizes[:2] == [10, 10] and sizes[2] > 10 and sum(sizes) == 40
+    assert sum(saved) == 39                                            # 每批完成即寫入 checkpoint
+
+
+def test_refresh_shares_only_new_and_stale(tmp_path, monkeypatch):
+    monkeypatch.setattr(usd, 'SHARES_FILE', str(tmp_path / 'shares.json'))
+    monkeypatch.setattr(usd, 'SHARES_REFRESH_PER_RUN', 1)
+    asked = []
+
+    def fetch(symbols):
+        asked.extend(symbols)
+        return {sym: 1000 for sym in symbols if sym != '9999.TW'}
+
+    monkeypatch.setattr(usd, 'fetch_shares_batch', fetch)
+    cache = {
+        '2330': {'shares': 500, 'refreshed': '2026-02-01'},     # 未過期
+        '2317': {'shares': 500, 'refreshed': '2025-11-01'},     # 過期（最舊）
+        '1101': {'shares': 500, 'refreshed': '2025-12-01'},     # 過期，但超過每次上限
+    }
+    stocks = [{'code': c, 'market': 'LISTED'} for c in ('2330', '2317', '1101', '2454', '9999')]
+    assert usd.refresh_shares(stocks, cache, today='2026-02-11') == 3
+    assert sorted(asked) == ['2317.TW', '2454.TW', '9999.TW']
+    assert cache['2317'] == {'shares': 1000, 'refreshed': '2026-02-11'}
+    assert cache['1101']['refreshed'] == '2025-12-01'
+    assert '9999' not in cache                                    # 抓不到：下次再試
+    assert usd.load_shares_cache() == cache                       # 已存檔
+    assert usd.compute_market_cap('2454', 12.5, cache) == 12500
+    assert usd.compute_market_cap('9999', 12.5, cache) == 0
+
+
+def test_shares_cache_falls_back_to_legacy_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(usd.LEGACY_SHARES_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'2330': {'shares': 1, 'refreshed': '2026-01-01'}}, f)
+    cache = usd.load_shares_cache()
+    assert cache == {'2330': {'shares': 1, 'refreshed': '2026-01-01'}}
+    usd.save_shares_cache(cache)
+    assert os.path.exists(usd.SHARES_FILE)
+
+
+def test_checkpoint_resumes_same_trading_day(tmp_path):
+    cp = usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-11')
+    assert cp.load() == {}
+    cp.save_prices({'2330.TW': _quote(1060.0)})
+    cp.save_prices({'2317.TW': _quote(216.5)})
+    # 最後一批寫到一半：略過，不影響其他批次
+    with open(tmp_path / 'prices_00003.json', 'w', encoding='utf-8') as f:
+        f.write('{"6415.TWO": {"clo')
+
+    again = usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-11')
+    assert set(again.load()) == {'2330.TW', '2317.TW'}
+    again.save_prices({'1101.TW': _quote(40.0)})
+    assert os.path.exists(tmp_path / 'prices_00004.json')       # 接續編號，不覆寫舊批次
+
+
+def test_checkpoint_from_other_day_is_discarded(tmp_path):
+    usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-10').load()
+    usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-10').save_prices({'2330.TW': _quote(1.0)})
+
+    cp = usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-11')
+    assert cp.load() == {}
+    assert not any(n.startswith('prices_') for n in os.listdir(tmp_path))
+
+
+def test_checkpoint_finish_keeps_only_last_failures(tmp_path):
+    cp = usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-11')
+    cp.load()
+    cp.save_prices({'2330.TW': _quote(1060.0)})
+    cp.save_failures({'8299.TWO': 'yahoo: no_data'})
+    cp.finish({'8299.TWO': 'yahoo: no_data'})
+
+    assert os.listdir(tmp_path) == ['last_failures.json']
+    with open(tmp_path / 'last_failures.json', encoding='utf-8') as f:
+        assert json.load(f) == {'run_date': '2026-02-11', 'failures': {'8299.TWO': 'yahoo: no_data'}}
+    # 完成後再跑同一天：重新開始
+    assert usd.Checkpoint(directory=str(tmp_path), run_date='2026-02-11').load() == {}
+
+
+def test_failure_summary_points_at_kept_file(capsys):
+    usd.print_failure_summary({'8299.TWO': 'yahoo: no_data', '1101.TW': 'yahoo: no_data'})
+    out = capsys.readouterr().out
+    assert 'last_failures.json' in out and 'yahoo: no_data: 2' in out
+
+
+NOW = datetime(2026, 2, 11, 10, 30)
+
+
+def _row(code, volume, age_seconds, market='LISTED', now=NOW):
+    row = {'code': code, 'name': code, 'market': market, 'price': 10.0, 'open': 10.0,
+           'change_pct': 0.0, 'volume': volume, 'market_cap': 0}
+    if age_seconds is not None:
+        row['updated_at'] = (now - timedelta(seconds=age_seconds)).isoformat(timespec='seconds')
+    return row
+
+
+def test_select_stale_stocks():
+    stocks = [
+        _row('2330', 1000, 200),        # 有量、超過 180 秒
+        _row('2317', 1000, 60),         # 有量、剛更新
+        _row('1101', 0, 600),           # 零量、未滿 1 小時
+        _row('1102', 0, 4000),          # 零量、超過 1 小時
+        _row('1103', 1000, None),       # 舊資料沒有 updated_at
+        # 開盤前後今天的量都是 0：前一交易日有量的仍照一般頻率更新
+        dict(_row('2454', 0, 200), prev_volume=3000),
+        dict(_row('1104', 0, 600), prev_volume=0),     # 前一交易日也零量：暫停交易
+    ]
+    due = usd.select_stale_stocks(stocks, NOW, stale_seconds=180, dormant_seconds=3600)
+    assert [s['code'] for s in due] == ['2330', '1102', '1103', '2454']
+
+
+def test_previous_session_volume():
+    today = NOW.date()
+    yesterday = _row('2330', 4000, 86400)
+    assert usd.previous_session_volume(yesterday, today) == 4000       # 昨天的量就是前一交易日的量
+    earlier_today = dict(_row('2330', 0, 60), prev_volume=4000)
+    assert usd.previous_session_volume(earlier_today, today) == 4000   # 今天已更新過：沿用
+    assert usd.previous_session_volume(_row('2330', 7, 60), today) == 7   # 舊格式沒有 prev_volume
+
+
+def test_incremental_merges_only_due_stocks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(usd.SHARES_FILE))
+    now = datetime.now()
+    stocks = [_row('2330', 1000, 600, now=now), _row('2317', 1000, 0, now=now),
+              _row('6415', 0, 7200, 'OTC', now=now)]
+    with open(usd.DATABASE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'stocks': stocks}, f)
+    with open(usd.SHARES_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'2330': {'shares': 100, 'refreshed': '2026-02-01'}}, f)
+
+    class FakeMis(QuoteSource):
+        name = 'mis'
+
+        def fetch(self, due):
+            self.asked = sorted(s['code'] for s in due)
+            return {'2330.TW': {'close': 12.0, 'open': 11.0, 'prev_close': 10.0, 'change_pct': 20.0, 'volume': 5000}}
+
+    mis = FakeMis()
+    monkeypatch.setattr(usd, 'build_sources', lambda names, checkpoint=None: [mis])
+    usd.update_stock_database_incremental()
+
+    assert mis.asked == ['2330', '6415']
+    with open(usd.DATABASE_FILE, encoding='utf-8') as f:
+        merged = {s['code']: s for s in json.load(f)['stocks']}
+    assert len(merged) == 3
+    assert merged['2330']['price'] == 12.0 and merged['2330']['market_cap'] == 1200
+    assert merged['2330']['updated_at'] > stocks[0]['updated_at']
+    assert merged['2330']['prev_volume'] == 1000                      # 覆寫前的量保留為前一交易日的量
+    assert merged['2317'] == stocks[1]                                # 未過期：原封不動
+    assert merged['6415'] == stocks[2]                                # 抓不到：保留舊資料，下次再試
@@ -4,31 +4,49 @@
 """
 import yfinance as yf
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import os
-import twstock
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
+import time
+from stock_universe import get_universe, print_diff
+from quote_sources import QuoteSource, ExchangeBulkSource, ExchangeRealtimeSource, fetch_quotes, symbol_for
 
 DATABASE_FILE = 'stock_database.json'
 MAX_WORKERS = 20        # 同時抓取的執行緒數量
 BATCH_SIZE = 50         # 批次下載的股票數量（yf.download 一次最多建議 50-100）
+PRICE_WORKERS = 4       # 同時進行的價格批次數量
+MIN_BATCH_SIZE = 10     # 自適應批次大小下限
+MAX_BATCH_SIZE = 100    # 自適應批次大小上限
+TARGET_BATCH_SECONDS = 8    # 單批理想耗時，超過就縮小批次
+RETRY_BATCH_SIZE = 10   # 失敗股票重試時的小批次大小
+MAX_RETRY_ROUNDS = 2    # 失敗股票最多重試幾輪
+SHARES_FILE = os.path.join('.cache', 'shares_outstanding.json')
+LEGACY_SHARES_FILE = 'shares_outstanding.json'   # 舊版放在專案根目錄
+SHARES_REFRESH_DAYS = 30        # 股本只在增減資時變動，30 天更新一次即可
+SHARES_REFRESH_PER_RUN = 200    # 每次執行最多更新幾支過期股本
+SHARES_SAVE_EVERY = 100         # 每抓幾支股本就存檔一次
+QUOTE_SOURCES = ['exchange', 'yahoo']   # 報價來源順序，前者缺少的股票才交給後者
+CHECKPOINT_DIR = os.path.join('.cache', 'update_checkpoint')
+INCREMENTAL_SOURCES = ['mis', 'yahoo']  # 盤中增量更新使用即時報價
+INCREMENTAL_STALE_SECONDS = 180         # 有成交的股票：資料超過 3 分鐘才重抓
+DORMANT_STALE_SECONDS = 3600            # 前一交易日零成交量（暫停交易、冷門股）：1 小時才重抓一次
 
 # 執行緒安全的鎖，避免多執行緒同時寫入
 print_lock = threading.Lock()
 counter_lock = threading.Lock()
 
 def get_all_taiwan_stocks():
-    """使用 twstock 取得所有台灣股票清單"""
+    """取得所有台灣股票清單（twstock 代碼表未變動時直接讀 .cache/stock_universe.json）"""
     print("正在取得台灣股票清單...")
     try:
-        listed_stocks = twstock.codes
-        stocks = []
-        for code, info in listed_stocks.items():
-            if info.type == '股票' and code.isdigit() and len(code) == 4:
-                market = 'LISTED' if info.market == '上市' else 'OTC'
-                stocks.append({'code': code, 'name': info.name, 'market': market})
+        stocks, diff = get_universe()
+        if diff and any(diff.values()):
+            print(f"  股票清單有變動（新上市櫃 {len(diff['listed'])}，下市櫃 {len(diff['delisted'])}，"
+                  f"轉市場 {len(diff['transferred'])}）：")
+            print_diff(diff)
 
         listed_count = sum(1 for s in stocks if s['market'] == 'LISTED')
         otc_count    = sum(1 for s in stocks if s['market'] == 'OTC')
@@ -42,7 +60,7 @@ def get_all_taiwan_stocks():
 def batch_download(batch_stocks):
     """
     使用 yf.download() 一次批次下載多支股票的 5 天歷史資料（Open, Close, Volume）。
-    回傳 symbol -> {open, close, prev_close, volume} 的 dict。
+    回傳 (symbol -> {open, close, prev_close, volume}, suffix_map, symbol -> 失敗原因)。
     """
     suffix_map = {}   # symbol -> stock info
     symbols    = []
@@ -65,9 +83,10 @@ def batch_download(batch_stocks):
             threads=True
         )
     except Exception as e:
-        return {}
+        return {}, suffix_map, {sym: f"download_error: {e}" for sym in symbols}
 
     results = {}
+    failures = {}
     # 單支股票時 df 的欄位結構不同（沒有 ticker 層）
     single = len(symbols) == 1
 
@@ -78,11 +97,13 @@ def batch_download(batch_stocks):
             else:
                 sub = df[sym] if sym in df.columns.get_level_values(0) else None
 
-            if sub is None or len(sub) < 2:
+            if sub is None:
+                failures[sym] = 'no_data'
                 continue
 
             sub = sub.dropna(how='all')
             if len(sub) < 2:
+                failures[sym] = 'insufficient_history'
                 continue
 
             latest    = sub.iloc[-1]
@@ -102,36 +123,467 @@ def batch_download(batch_stocks):
                 'change_pct': round(change_pct, 2),
                 'volume':     volume,
             }
-        except Exception:
+        except Exception as e:
+            failures[sym] = f"parse_error: {e}"
             continue
 
-    return results, suffix_map
+    return results, suffix_map, failures
+
+
+class AdaptiveBatcher:
+    """依照每批的耗時與失敗率調整下一批的大小"""
+
+    def __init__(self, size=BATCH_SIZE, min_size=MIN_BATCH_SIZE, max_size=MAX_BATCH_SIZE,
+                 target_seconds=TARGET_BATCH_SECONDS):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.lock = threading.Lock()
+
+    def record(self, n_symbols, seconds, n_failed):
+        """回報一批的結果：失敗率高或太慢就縮小，又快又穩就放大"""
+        error_rate = n_failed / n_symbols if n_symbols else 0
+        with self.lock:
+            if error_rate > 0.2:
+                self.size = int(self.size * 0.5)
+            elif seconds > self.target_seconds:
+                self.size = int(self.size * 0.75)
+            elif seconds < self.target_seconds / 2 and error_rate < 0.05:
+                self.size = int(self.size * 1.25) + 1
+            self.size = max(self.min_size, min(self.max_size, self.size))
+            return self.size
+
+    def next_size(self):
+        with self.lock:
+            return self.size
+
+
+class Progress:
+    """以「已完成股票數」計算進度與剩餘時間（批次大小不固定，不能用批次數估算）"""
+
+    def __init__(self, total, label='價格'):
+        self.total = total
+        self.done = 0
+        self.label = label
+        self.start = time.monotonic()
+
+    def advance(self, n, extra=''):
+        with counter_lock:
+            self.done += n
+            done = self.done
+        elapsed = time.monotonic() - self.start
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = int((self.total - done) / rate) if rate > 0 else 0
+        pct = done / self.total * 100 if self.total else 100
+        with print_lock:
+            print(f"  {self.label} {done:5d}/{self.total}  ({pct:5.1f}%)  "
+                  f"{rate:5.1f} 支/秒  剩餘約 {eta} 秒 {extra}   ", end='\r')
+
+
+def _run_batches(stocks, batcher, progress, workers=PRICE_WORKERS, checkpoint=None, failures=None):
+    """
+    以執行緒池同時跑多個 yf.download 批次。
+    每批完成後依自適應大小切出下一批，並寫入 checkpoint。回傳 (results, failed_stocks)。
+    failures（symbol -> 原因）會就地更新。
+    """
+    pending = list(stocks)
+    results = {}
+    failed = []
+    failures = failures if failures is not None else {}
+
+    def _job(batch):
+        t0 = time.monotonic()
+        price_dict, _, reasons = batch_download(batch)
+        return batch, price_dict, reasons, time.monotonic() - t0
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        running = set()
+        while pending or running:
+            while pending and len(running) < workers:
+                size = batcher.next_size()
+                batch, pending = pending[:size], pending[size:]
+                running.add(ex.submit(_job, batch))
+
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                batch, price_dict, reasons, seconds = fut.result()
+                results.update(price_dict)
+                missing = [s for s in batch if symbol_for(s) not in price_dict]
+                failed.extend(missing)
+                for sym in price_dict:
+                    failures.pop(sym, None)
+                for s in missing:
+                    failures[symbol_for(s)] = reasons.get(symbol_for(s), 'not_in_response')
+                if checkpoint is not None and price_dict:
+                    checkpoint.save_prices(price_dict)
+                new_size = batcher.record(len(batch), seconds, len(missing))
+                progress.advance(len(batch) - len(missing), f"批次大小 {new_size}")
+
+    return results, failed
+
+
+def download_prices_yahoo(stocks, checkpoint=None, failures=None):
+    """
+    以 yf.download 平行分批下載價格，失敗的股票以小批次重試，回傳 symbol -> price dict。
+    每批完成即寫入 checkpoint；最後仍失敗的股票原因記錄在 failures。
+    """
+    progress = Progress(len(stocks))
+    batcher = AdaptiveBatcher()
+    failures = failures if failures is not None else {}
+
+    all_price_data, failed = _run_batches(stocks, batcher, progress, checkpoint=checkpoint, failures=failures)
+
+    for round_no in range(1, MAX_RETRY_ROUNDS + 1):
+        if not failed:
+            break
+        with print_lock:
+            print(f"\n  ↻ 第 {round_no} 輪重試 {len(failed)} 支失敗股票...")
+        retry_batcher = AdaptiveBatcher(size=RETRY_BATCH_SIZE, min_size=1, max_size=RETRY_BATCH_SIZE)
+        retried, failed = _run_batches(failed, retry_batcher, progress, checkpoint=checkpoint, failures=failures)
+        all_price_data.update(retried)
+
+    if stocks:
+        print()
+    elapsed = time.monotonic() - progress.start
+    print(f"  Yahoo 下載完成: {len(all_price_data)}/{len(stocks)} 支，耗時 {elapsed:.1f} 秒")
+
+    return all_price_data
+
+
+class YahooBatchSource(QuoteSource):
+    """Yahoo Finance 批次下載（備援來源）；每批完成就寫入 checkpoint"""
+    name = 'yahoo'
+    checkpoints_itself = True
+
+    def __init__(self, checkpoint=None):
+        super().__init__()
+        self.checkpoint = checkpoint
+
+    def fetch(self, stocks):
+        return download_prices_yahoo(stocks, checkpoint=self.checkpoint, failures=self.failures)
+
+
+SOURCE_FACTORIES = {
+    'exchange': ExchangeBulkSource,
+    'mis':      ExchangeRealtimeSource,
+    'yahoo':    YahooBatchSource,
+}
+
+
+def build_sources(names, checkpoint=None):
+    """來源名稱 list -> QuoteSource 物件 list"""
+    sources = []
+    for n in names:
+        factory = SOURCE_FACTORIES[n]
+        sources.append(factory(checkpoint=checkpoint) if factory is YahooBatchSource else factory())
+    return sources
+
+
+class Checkpoint:
+    """
+    更新進度存檔（位於 CHECKPOINT_DIR）：
+      - run.json：本次執行的交易日
+      - prices_NNNNN.json：每批完成的價格資料
+      - failures.json：每支股票最後一次失敗的原因
+    同一天重跑時只補抓缺少的股票；完成後清除價格檔，失敗原因保留為 last_failures.json。
+    """
+
+    def __init__(self, directory=None, run_date=None):
+        self.dir = directory or CHECKPOINT_DIR
+        self.run_date = run_date or datetime.now().strftime('%Y-%m-%d')
+        self.lock = threading.Lock()
+        self.seq = 0
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _write(self, name, obj):
+        tmp = self._path(f"{name}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, self._path(name))
+
+    def _price_files(self):
+        if not os.path.isdir(self.dir):
+            return []
+        return sorted(n for n in os.listdir(self.dir) if n.startswith('prices_') and n.endswith('.json'))
+
+    def reset(self):
+        """捨棄舊進度，開始新的一輪"""
+        os.makedirs(self.dir, exist_ok=True)
+        for name in self._price_files() + ['failures.json']:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        self.seq = 0
+        self._write('run.json', {'run_date': self.run_date, 'started_at': datetime.now().isoformat()})
+        return {}
+
+    def load(self):
+        """同一交易日的未完成進度 -> symbol -> price dict；否則重設並回傳空 dict"""
+        try:
+            with open(self._path('run.json'), 'r', encoding='utf-8') as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            return self.reset()
+        if run.get('run_date') != self.run_date:
+            return self.reset()
+
+        prices = {}
+        files = self._price_files()
+        for name in files:
+            try:
+                with open(self._path(name), 'r', encoding='utf-8') as f:
+                    prices.update(json.load(f))
+            except (OSError, ValueError):
+                continue
+        self.seq = len(files)
+        return prices
+
+    def save_prices(self, prices):
+        with self.lock:
+            self.seq += 1
+            name = f"prices_{self.seq:05d}.json"
+        self._write(name, prices)
+
+    def save_failures(self, failures):
+        self._write('failures.json', failures)
+
+    def finish(self, failures):
+        """資料庫寫入成功：清除進度，保留本次失敗清單"""
+        self._write('last_failures.json', {'run_date': self.run_date, 'failures': failures})
+        for name in self._price_files() + ['failures.json', 'run.json']:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+
+def load_shares_cache():
+    """載入股本快取：code -> {shares, refreshed (YYYY-MM-DD)}；新位置還沒有時沿用舊檔"""
+    path = SHARES_FILE if os.path.exists(SHARES_FILE) else LEGACY_SHARES_FILE
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"載入股本快取失敗: {e}")
+        return {}
+
 
+def save_shares_cache(cache):
+    os.makedirs(os.path.dirname(SHARES_FILE) or '.', exist_ok=True)
+    tmp = f"{SHARES_FILE}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, SHARES_FILE)
 
-def fetch_market_cap_batch(symbols):
+
+def fetch_shares_batch(symbols):
     """
-    用多執行緒同時抓取多支股票的市值（ticker.info）。
-    回傳 symbol -> market_cap 的 dict。
+    用多執行緒抓取多支股票的流通股數（fast_info.shares）。
+    回傳 symbol -> shares 的 dict，抓不到的不放入。
     """
-    caps = {}
+    shares = {}
 
-    def _get_cap(sym):
+    def _get_shares(sym):
         try:
             info = yf.Ticker(sym).fast_info
-            # fast_info 比 info 快很多，直接取 market_cap
-            mc = getattr(info, 'market_cap', None) or 0
-            caps[sym] = int(mc)
+            n = getattr(info, 'shares', None)
+            if not n:
+                # 部分股票沒有 shares，改用 市值 / 現價 逆推
+                mc, price = getattr(info, 'market_cap', None), getattr(info, 'last_price', None)
+                n = mc / price if mc and price else 0
+            if n:
+                shares[sym] = int(n)
         except Exception:
-            caps[sym] = 0
+            pass
 
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        list(ex.map(_get_cap, symbols))
+        list(ex.map(_get_shares, symbols))
+
+    return shares
+
+
+def refresh_shares(stocks, cache, today=None):
+    """
+    只對「新股票」與「股本資料過期」的股票重抓股本。
+    過期的股票每次最多更新 SHARES_REFRESH_PER_RUN 支，讓刷新分散到多天。
+    回傳實際重抓的股票數。
+    """
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    cutoff = (datetime.strptime(today, '%Y-%m-%d') - timedelta(days=SHARES_REFRESH_DAYS)).strftime('%Y-%m-%d')
+
+    new_stocks = [s for s in stocks if s['code'] not in cache]
+    stale = sorted((s for s in stocks if s['code'] in cache and cache[s['code']]['refreshed'] < cutoff),
+                   key=lambda s: cache[s['code']]['refreshed'])
+    todo = new_stocks + stale[:SHARES_REFRESH_PER_RUN]
+    if not todo:
+        return 0
+
+    print(f"  更新股本: 新股票 {len(new_stocks)} 支，過期 {min(len(stale), SHARES_REFRESH_PER_RUN)}/{len(stale)} 支")
+    # 分段抓取並逐段存檔，中斷後重跑只會補抓尚未更新的股票
+    for i in range(0, len(todo), SHARES_SAVE_EVERY):
+        chunk = todo[i:i + SHARES_SAVE_EVERY]
+        fetched = fetch_shares_batch([symbol_for(s) for s in chunk])
+        for s in chunk:
+            n = fetched.get(symbol_for(s))
+            if n:
+                cache[s['code']] = {'shares': n, 'refreshed': today}
+        save_shares_cache(cache)
+    return len(todo)
+
+
+def compute_market_cap(code, close, shares_cache):
+    """市值 = 收盤價 × 股本；沒有股本資料回傳 0"""
+    entry = shares_cache.get(code)
+    return int(round(close * entry['shares'])) if entry else 0
+
+
+def collect_failures(stocks, prices, sources):
+    """仍缺價格的股票 -> 失敗原因（取最後一個有記錄的來源）"""
+    failures = {}
+    for s in stocks:
+        sym = symbol_for(s)
+        if sym in prices:
+            continue
+        reason = 'no_data'
+        for src in sources:
+            r = getattr(src, 'failures', {}).get(sym)
+            if r:
+                reason = f"{src.name}: {r}"
+        failures[sym] = reason
+    return failures
+
+
+def print_failure_summary(failures, top=5):
+    if not failures:
+        return
+    counts = {}
+    for reason in failures.values():
+        key = ':'.join(reason.split(':')[:2])     # "yahoo: download_error: ..." -> "yahoo: download_error"
+        counts[key] = counts.get(key, 0) + 1
+    # 更新完成後 failures.json 會被清除，完整清單保留在 last_failures.json
+    print(f"  失敗原因（詳見 {os.path.join(CHECKPOINT_DIR, 'last_failures.json')}）：")
+    for key, n in sorted(counts.items(), key=lambda x: -x[1])[:top]:
+        print(f"    - {key}: {n} 支")
+
+
+def load_database():
+    """載入上一次的資料庫快照，不存在回傳 None"""
+    if not os.path.exists(DATABASE_FILE):
+        return None
+    try:
+        with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"載入資料庫失敗: {e}")
+        return None
+
+
+def save_database(all_stocks):
+    """寫入 JSON 資料庫（先寫暫存檔再替換，避免 app 讀到寫一半的檔案）與 CSV"""
+    database = {
+        'update_time':  datetime.now().isoformat(),
+        'total_stocks': len(all_stocks),
+        'stocks':       all_stocks
+    }
+    tmp = f"{DATABASE_FILE}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(database, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, DATABASE_FILE)
+    print(f"✅ 資料庫已儲存至: {DATABASE_FILE}")
+
+    df = pd.DataFrame(all_stocks)
+    df.to_csv('stock_database.csv', index=False, encoding='utf-8-sig')
+    print(f"✅ CSV 已儲存至: stock_database.csv")
+
+
+def previous_session_volume(s, today):
+    """
+    記錄中「前一交易日」的成交量：最後更新於今天以前時，舊的 volume 就是前一交易日的量；
+    今天已更新過則沿用 prev_volume（舊格式沒有此欄位時退回 volume）。
+    """
+    updated = s.get('updated_at')
+    if updated and datetime.fromisoformat(updated).date() < today:
+        return s.get('volume', 0)
+    return s.get('prev_volume', s.get('volume', 0))
+
+
+def is_dormant(s):
+    """
+    前一交易日與今天都沒有成交（暫停交易、冷門股）。
+    不能只看今天的累積量：開盤前後所有股票的量都是 0。
+    """
+    return not s.get('prev_volume', 0) and not s.get('volume', 0)
 
-    return caps
+
+def select_stale_stocks(stocks, now, stale_seconds=INCREMENTAL_STALE_SECONDS,
+                        dormant_seconds=DORMANT_STALE_SECONDS):
+    """
+    挑出需要重抓的股票：
+      - 一般股票：資料超過 stale_seconds
+      - 前一交易日與今天都零成交量（暫停交易、冷門股）：資料超過 dormant_seconds
+    沒有 updated_at 的舊資料一律視為過期。
+    """
+    due = []
+    for s in stocks:
+        updated = s.get('updated_at')
+        age = (now - datetime.fromisoformat(updated)).total_seconds() if updated else float('inf')
+        limit = dormant_seconds if is_dormant(s) else stale_seconds
+        if age >= limit:
+            due.append(s)
+    return due
 
 
-def update_stock_database():
-    """更新股票資料庫（高速版）"""
+def update_stock_database_incremental(source_names=None, stale_seconds=INCREMENTAL_STALE_SECONDS):
+    """
+    盤中增量更新：沿用上一次快照的股票清單，只重抓過期的股票並合併回資料庫。
+    不重新讀取 twstock 清單、不重抓股本；沒有舊快照時改跑完整更新。
+    """
+    start = datetime.now()
+    database = load_database()
+    if not database or not database.get('stocks'):
+        print("找不到上一次的資料庫，改為完整更新")
+        return update_stock_database(source_names)
+
+    stocks = database['stocks']
+    due = select_stale_stocks(stocks, start, stale_seconds)
+    print(f"[增量更新] {start.strftime('%H:%M:%S')} 需更新 {len(due)}/{len(stocks)} 支"
+          f"（一般 {sum(1 for s in due if not is_dormant(s))}，零量 {sum(1 for s in due if is_dormant(s))}）")
+    if not due:
+        return
+
+    sources = build_sources(source_names or INCREMENTAL_SOURCES)
+    quotes, _ = fetch_quotes(due, sources)
+    shares_cache = load_shares_cache()
+
+    now_iso = datetime.now().isoformat(timespec='seconds')
+    traded = 0
+    for s in due:
+        q = quotes.get(symbol_for(s))
+        if not q:
+            continue
+        if q['volume'] != s.get('volume'):
+            traded += 1
+        s['prev_volume'] = previous_session_volume(s, start.date())
+        s['price'] = q['close']
+        s['open'] = q['open']
+        s['change_pct'] = q['change_pct']
+        s['volume'] = q['volume']
+        s['market_cap'] = compute_market_cap(s['code'], q['close'], shares_cache) or s.get('market_cap', 0)
+        s['updated_at'] = now_iso
+
+    save_database(stocks)
+    elapsed = (datetime.now() - start).total_seconds()
+    print(f"[增量更新] 完成：更新 {len(quotes)}/{len(due)} 支（有新成交 {traded} 支），耗時 {elapsed:.1f} 秒")
+
+
+def update_stock_database(source_names=None, resume=True):
+    """更新股票資料庫（高速版）；resume=True 時接續同一交易日未完成的進度"""
     print("=" * 70)
     print("台灣股票資料庫更新 - 高速版（多執行緒 + 批次下載）")
     print(f"開始時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -145,42 +597,51 @@ def update_stock_database():
 
     total = len(all_list)
     print(f"\n總共需要更新: {total} 支股票")
-    print(f"批次大小: {BATCH_SIZE} | 下載執行緒: {MAX_WORKERS}")
-    print(f"預估時間: 約 3-8 分鐘（視網路速度而定）")
+    print(f"批次大小: {BATCH_SIZE}（自適應 {MIN_BATCH_SIZE}-{MAX_BATCH_SIZE}）| 價格批次並行: {PRICE_WORKERS} | 股本執行緒: {MAX_WORKERS}")
     print("-" * 70)
 
-    # ----- 批次下載 Open/Close/Volume -----
-    all_price_data = {}   # sym -> price dict
-    batches = [all_list[i:i+BATCH_SIZE] for i in range(0, total, BATCH_SIZE)]
-    n_batches = len(batches)
+    # ----- 接續未完成的進度 -----
+    checkpoint = Checkpoint()
+    done_prices = checkpoint.load() if resume else checkpoint.reset()
+    todo = [s for s in all_list if symbol_for(s) not in done_prices]
+    if done_prices:
+        print(f"↻ 接續上次進度：已完成 {total - len(todo)} 支，剩餘 {len(todo)} 支")
 
-    print(f"\n[階段 1/2] 批次下載價格資料（共 {n_batches} 批）...")
+    # ----- 取得 Open/Close/Volume -----
+    sources = build_sources(source_names or QUOTE_SOURCES, checkpoint=checkpoint)
+    print(f"\n[階段 1/2] 取得價格資料（來源: {' → '.join(src.name for src in sources)}）...")
     start = datetime.now()
 
-    for idx, batch in enumerate(batches, 1):
-        result = batch_download(batch)
-        if isinstance(result, tuple):
-            price_dict, _ = result
-            all_price_data.update(price_dict)
+    def _on_source_done(src, got):
+        if got and not getattr(src, 'checkpoints_itself', False):
+            checkpoint.save_prices(got)
+
+    new_prices, used = fetch_quotes(todo, sources, on_source_done=_on_source_done)
+    all_price_data = {**done_prices, **new_prices}
 
-        pct = idx / n_batches * 100
-        elapsed = (datetime.now() - start).seconds
-        eta = int(elapsed / idx * (n_batches - idx)) if idx > 1 else 0
-        print(f"  批次 {idx:3d}/{n_batches}  ({pct:5.1f}%)  剩餘約 {eta} 秒", end='\r')
+    failures = collect_failures(todo, all_price_data, sources)
+    checkpoint.save_failures(failures)
 
     success_price = len(all_price_data)
-    print(f"\n  ✅ 價格資料成功: {success_price} 支（失敗 {total - success_price} 支）")
+    detail = '，'.join(f"{name} {n}" for name, n in used.items())
+    print(f"  ✅ 價格資料成功: {success_price} 支（{detail}；失敗 {total - success_price} 支）")
+    print_failure_summary(failures)
 
-    # ----- 批次抓取市值（ticker.fast_info，多執行緒）-----
-    symbols_with_price = list(all_price_data.keys())
-    print(f"\n[階段 2/2] 批次抓取市值（{len(symbols_with_price)} 支，{MAX_WORKERS} 執行緒）...")
-    market_caps = fetch_market_cap_batch(symbols_with_price)
-    print(f"  ✅ 市值抓取完成")
+    # ----- 市值 = 收盤價 × 股本（股本快取，僅新股票或過期時才重抓）-----
+    print(f"\n[階段 2/2] 計算市值（股本快取: {SHARES_FILE}，每 {SHARES_REFRESH_DAYS} 天更新）...")
+    shares_cache = load_shares_cache()
+    priced = [s for s in all_list if symbol_for(s) in all_price_data]
+    refresh_shares(priced, shares_cache)
+    print(f"  ✅ 市值計算完成（股本資料 {sum(1 for s in priced if s['code'] in shares_cache)}/{len(priced)} 支）")
 
     # ----- 組合最終資料 -----
     # 建立 code -> stock_info 的雙查表
     code_info_map = {s['code']: s for s in all_list}
+    # 舊快照用來推算前一交易日成交量（增量更新判斷零量股票用）
+    previous = {s['code']: s for s in (load_database() or {}).get('stocks', [])}
 
+    today = datetime.now().date()
+    now_iso = datetime.now().isoformat(timespec='seconds')
     all_stocks = []
     for sym, price in all_price_data.items():
         # sym 格式: "6415.TW" 或 "6415.TWO"
@@ -189,7 +650,7 @@ def update_stock_database():
         if not info:
             continue
 
-        mc = market_caps.get(sym, 0)
+        mc = compute_market_cap(code, price['close'], shares_cache)
 
         all_stocks.append({
             'code':       code,
@@ -198,8 +659,10 @@ def update_stock_database():
             'open':       price['open'],
             'change_pct': price['change_pct'],
             'volume':     price['volume'],
+            'prev_volume': previous_session_volume(previous[code], today) if code in previous else 0,
             'market_cap': mc,
             'market':     info['market'],
+            'updated_at': now_iso,
         })
 
     total_time = (datetime.now() - start).seconds
@@ -212,18 +675,8 @@ def update_stock_database():
         return
 
     # ----- 儲存 -----
-    database = {
-        'update_time':  datetime.now().isoformat(),
-        'total_stocks': len(all_stocks),
-        'stocks':       all_stocks
-    }
-    with open(DATABASE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(database, f, ensure_ascii=False, indent=2)
-    print(f"✅ 資料庫已儲存至: {DATABASE_FILE}")
-
-    df = pd.DataFrame(all_stocks)
-    df.to_csv('stock_database.csv', index=False, encoding='utf-8-sig')
-    print(f"✅ CSV 已儲存至: stock_database.csv")
+    save_database(all_stocks)
+    checkpoint.finish(failures)
 
     print(f"\n📊 統計：")
     print(f"  價格範圍: {min(s['price'] for s in all_stocks):.2f} ~ {max(s['price'] for s in all_stocks):.2f} 元")
@@ -233,4 +686,19 @@ def update_stock_database():
 
 
 if __name__ == "__main__":
-    update_stock_database()
+    parser = argparse.ArgumentParser(description='更新台股資料庫')
+    parser.add_argument('--source', default=None,
+                        help=f"報價來源順序，以逗號分隔（可用: {', '.join(SOURCE_FACTORIES)}；"
+                             f"預設完整更新 {','.join(QUOTE_SOURCES)}，增量更新 {','.join(INCREMENTAL_SOURCES)}）")
+    parser.add_argument('--incremental', action='store_true',
+                        help='盤中增量更新：只重抓過期的股票（預設來源 mis,yahoo）')
+    parser.add_argument('--fresh', action='store_true',
+                        help='忽略上次未完成的進度，從頭開始完整更新')
+    parser.add_argument('--stale', type=int, default=INCREMENTAL_STALE_SECONDS,
+                        help='增量更新時，有成交股票的過期秒數')
+    args = parser.parse_args()
+    names = [n.strip() for n in args.source.split(',') if n.strip()] if args.source else None
+    if args.incremental:
+        update_stock_database_incremental(source_names=names, stale_seconds=args.stale)
+    else:
+        update_stock_database(source_names=names, resume=not args.fresh)